@@ -6,7 +6,6 @@ from pathlib import Path
 from psycop_feature_generation.application_modules.project_setup import (
     get_project_info,
 )
-from timeseriesflattener.utils import load_dataset_from_file
 
 log = logging.getLogger()
 
@@ -17,16 +16,17 @@ project_info = get_project_info(
 
 from t2d_feature_generation.specify_features import FeatureSpecifier
 
-feature_specs = FeatureSpecifier(
+spec_registry = FeatureSpecifier(
     project_info=project_info,
     min_set_for_debug=False,  # Remember to set to False when generating full dataset
-).get_feature_specs()
+).get_spec_registry()
 
-selected_specs = [
-    spec
-    for spec in feature_specs
-    if "pred" in spec.get_col_str() or "outc" in spec.get_col_str()
-]
+# Only the selected specs are created, so only their sources are loaded
+selected_specs = spec_registry.create_specs(
+    spec_registry.query(
+        prefix=[project_info.prefix.predictor, project_info.prefix.outcome],
+    ),
+)
 
 DATASET_FOLDER = Path(
     "E:/shared_resources/t2d/feature_sets/psycop_t2d_adminmanber_features_2023_03_22_15_14",
@@ -36,20 +36,15 @@ DATASET_FOLDER = Path(
 # %autoreload 2
 
 # %%
-dataset = load_dataset_from_file(
-    file_path=DATASET_FOLDER
-    / "psycop_t2d_adminmanber_features_2023_03_22_15_14_train.parquet",
-)
-
-# %%
-from psycop_feature_generation.data_checks.flattened.feature_describer import (
+# Streams the split one row group at a time, so the feature set is never
+# loaded into memory at once
+from t2d_feature_generation.feature_description import (
     save_feature_descriptive_stats_from_dir,
 )
 
 save_feature_descriptive_stats_from_dir(
     feature_set_dir=DATASET_FOLDER,
     feature_specs=selected_specs,  # type: ignore
-    file_suffix="parquet",
     splits=["train"],
 )
 
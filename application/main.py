@@ -1,59 +1,216 @@
 """Main feature generation."""
 
+import argparse
 import logging
+from collections.abc import Sequence
+from functools import partial
+from pathlib import Path
+from typing import Optional
 
+import pandas as pd
 from psycop_feature_generation.application_modules.describe_flattened_dataset import (
     save_flattened_dataset_description_to_disk,
 )
-from psycop_feature_generation.application_modules.flatten_dataset import (
-    create_flattened_dataset,
-)
 from psycop_feature_generation.application_modules.loggers import init_root_logger
 from psycop_feature_generation.application_modules.project_setup import (
     get_project_info,
     init_wandb,
 )
-from psycop_feature_generation.application_modules.save_dataset_to_disk import (
-    split_and_save_dataset_to_disk,
-)
 from psycop_feature_generation.application_modules.wandb_utils import (
     wandb_alert_on_exception,
 )
+from psycop_feature_generation.loaders.raw.load_demographic import birthdays
 from psycop_feature_generation.loaders.raw.load_moves import (
     load_move_into_rm_for_exclusion,
 )
 from psycop_feature_generation.loaders.raw.load_visits import (
     physical_visits_to_psychiatry,
 )
+from timeseriesflattener.feature_spec_objects import OutcomeSpec, StaticSpec
+
+from t2d_feature_generation.dtypes import get_memory_report
+from t2d_feature_generation.flattening.column_cache import ColumnCache
+from t2d_feature_generation.flattening.flatten import create_flattened_dataset
+from t2d_feature_generation.flattening.incident_outcomes import (
+    get_time_to_event_col_names,
+)
+from t2d_feature_generation.flattening.incremental import (
+    flatten_incrementally,
+    get_feature_fingerprint,
+    load_partitions,
+    refresh_static_specs,
+)
+from t2d_feature_generation.flattening.planner import DEFAULT_ENGINES
+from t2d_feature_generation.flattening.sharding import (
+    count_shard_rows,
+    flatten_sharded,
+    load_shards,
+)
+from t2d_feature_generation.instrumentation import Instrumentation
+from t2d_feature_generation.loader_cache import configure_loader_cache
+from t2d_feature_generation.partitioned_output import (
+    split_and_save_dataset_to_disk,
+    split_and_save_shards_to_disk,
+)
 from t2d_feature_generation.specify_features import FeatureSpecifier
 
 log = logging.getLogger()
 
 
 @wandb_alert_on_exception
-def main():
+def main(
+    incremental_feature_set_dir: Optional[Path] = None,
+    n_shards: Optional[int] = None,
+    partitioned_output: bool = False,
+    engines: Sequence[str] = DEFAULT_ENGINES,
+    planner_workers: Optional[int] = None,
+):
     """Main function for loading, generating and evaluating a flattened
-    dataset."""
+    dataset.
+
+    Args:
+        incremental_feature_set_dir (Optional[Path]): If set, only flatten prediction times added since the
+            last run, and keep the flattened dataset as partitions in this directory. Defaults to None.
+        n_shards (Optional[int]): If set, flatten patient shards in parallel worker processes, which bounds
+            the memory of each worker by the shard size. Unless flattening incrementally, the shards are then
+            split and saved one at a time, so the flattened dataset is never held in memory at once.
+            Defaults to None.
+        partitioned_output (bool): Whether to write each split as yearly partitions, sorted by id and timestamp,
+            instead of a single file. See t2d_feature_generation.partitioned_output. Defaults to False.
+        engines (Sequence[str]): Engines the planner computes the specs they support with, e.g.
+            ("numba",) to compute them all with the numba kernels. See t2d_feature_generation.flattening.planner.
+            Defaults to DEFAULT_ENGINES.
+        planner_workers (Optional[int]): If set, compute the planner's sources in this many worker processes,
+            which attach to the prediction times and loaded events instead of receiving a copy. See
+            t2d_feature_generation.flattening.worker_pool. Defaults to None.
+    """
+    # Loaders are resolved from the registry when specs are created
+    instrumentation = Instrumentation()
+    instrumentation.instrument_loaders()
+
     feature_specs = FeatureSpecifier(
         project_info=project_info,
         min_set_for_debug=False,  # Remember to set to False when generating full dataset
     ).get_feature_specs()
 
-    flattened_df = create_flattened_dataset(
-        feature_specs=feature_specs,
-        prediction_times_df=physical_visits_to_psychiatry(
-            timestamps_only=True,
-            timestamp_for_output="start",
-        ),
-        drop_pred_times_with_insufficient_look_distance=False,
+    prediction_times_df = instrumentation.wrap_loader(
+        "physical_visits_to_psychiatry",
+        physical_visits_to_psychiatry,
+    )(
+        timestamps_only=True,
+        timestamp_for_output="start",
+    )
+    flatten_shard = partial(
+        create_flattened_dataset,
         project_info=project_info,
-        quarantine_df=load_move_into_rm_for_exclusion(),
         quarantine_days=720,
+        column_cache=ColumnCache(
+            project_info.project_path / "column_cache",
+            max_size_bytes=50 * 1024**3,
+        ),
+        compact_dtypes=True,
+        time_to_event_prefix=project_info.prefix.eval,
+        engines=engines,
+        planner_workers=planner_workers,
     )
+    # Inputs with patient ids, restricted to each shard's patients when sharding
+    sharded_inputs = {
+        "feature_specs": feature_specs,
+        "quarantine_df": instrumentation.wrap_loader(
+            "move_into_rm_for_exclusion",
+            load_move_into_rm_for_exclusion,
+        )(),
+        "date_of_birth_df": instrumentation.wrap_loader("birthdays", birthdays)(),
+    }
 
-    split_and_save_dataset_to_disk(
-        flattened_df=flattened_df,
-        project_info=project_info,
+    def flatten_shards(prediction_times_df: pd.DataFrame) -> list[Path]:
+        # Shards are resolved in worker processes, so they are measured as a whole
+        instrumentation.start_progress(n_specs=len(feature_specs))
+        with instrumentation.measure(
+            stage="resolve",
+            name="shards",
+            spec_names=[spec.get_col_str() for spec in feature_specs],
+            rows_in=len(prediction_times_df),
+        ) as record:
+            shard_paths = flatten_sharded(
+                prediction_times=prediction_times_df,
+                # Shards already run in parallel, so each resolves its specs in
+                # a single process
+                flatten_fn=partial(
+                    flatten_shard,
+                    n_workers=1,
+                    planner_workers=None,
+                ),
+                output_dir=project_info.project_path / "feature_sets" / "shards",
+                n_shards=n_shards,
+                sharded_inputs=sharded_inputs,
+            )
+            record.rows_out = count_shard_rows(shard_paths)
+
+        return shard_paths
+
+    def flatten(prediction_times_df: pd.DataFrame) -> pd.DataFrame:
+        if n_shards is None:
+            return flatten_shard(
+                prediction_times_df=prediction_times_df,
+                instrumentation=instrumentation,
+                **sharded_inputs,
+            )
+
+        return load_shards(flatten_shards(prediction_times_df=prediction_times_df))
+
+    def split_and_save(flattened_df: pd.DataFrame) -> None:
+        log.info(  # pylint: disable=logging-fstring-interpolation
+            f"Memory of the flattened dataset by dtype:\n{get_memory_report(flattened_df)}",
+        )
+
+        split_and_save_dataset_to_disk(
+            flattened_df=flattened_df,
+            project_info=project_info,
+            partitioned=partitioned_output,
+        )
+
+    if incremental_feature_set_dir is None and n_shards is None:
+        split_and_save(flatten(prediction_times_df=prediction_times_df))
+    elif incremental_feature_set_dir is None:
+        # Shards are split and saved one at a time, so the flattened dataset
+        # is never held in memory at once
+        split_and_save_shards_to_disk(
+            shard_paths=flatten_shards(prediction_times_df=prediction_times_df),
+            project_info=project_info,
+            partitioned=partitioned_output,
+        )
+    else:
+        flatten_incrementally(
+            prediction_times=prediction_times_df,
+            feature_set_dir=incremental_feature_set_dir,
+            flatten_fn=flatten,
+            lookahead_days=max(
+                spec.lookahead_days
+                for spec in feature_specs
+                if isinstance(spec, OutcomeSpec)
+            ),
+            feature_fingerprint=get_feature_fingerprint(
+                [spec.get_col_str() for spec in feature_specs]
+                + get_time_to_event_col_names(
+                    feature_specs,
+                    prefix=project_info.prefix.eval,
+                ),
+            ),
+            refresh_fn=partial(
+                refresh_static_specs,
+                static_specs=[
+                    spec for spec in feature_specs if isinstance(spec, StaticSpec)
+                ],
+            ),
+        )
+        split_and_save(load_partitions(incremental_feature_set_dir))
+
+    instrumentation.close()
+    instrumentation.log_summary()
+    json_path, _ = instrumentation.write_report(project_info.feature_set_path)
+    log.info(  # pylint: disable=logging-fstring-interpolation
+        f"Wrote instrumentation report to {json_path}",
     )
 
     save_flattened_dataset_description_to_disk(
@@ -63,6 +220,14 @@ def main():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only flatten prediction times added since the last incremental run, and reuse its partitions",
+    )
+    args = parser.parse_args()
+
     # Run elements that are required before wandb init first,
     # then run the rest in main so you can wrap it all in
     # wandb_alert_on_exception, which will send a slack alert
@@ -78,6 +243,13 @@ if __name__ == "__main__":
     )
     log.debug("Debugging is still captured in the log file")
 
+    # Cache loader outputs across runs, so reruns with unchanged source data
+    # skip warehouse I/O
+    configure_loader_cache(
+        cache_dir=project_info.project_path / "loader_cache",
+        max_size_bytes=50 * 1024**3,
+    )
+
     # Use wandb to keep track of your dataset generations
     # Makes it easier to find paths on wandb, as well as
     # allows monitoring and automatic slack alert on failure
@@ -85,4 +257,11 @@ if __name__ == "__main__":
         project_info=project_info,
     )
 
-    main()
+    if args.incremental:
+        main(
+            incremental_feature_set_dir=project_info.project_path
+            / "feature_sets"
+            / "incremental",
+        )
+    else:
+        main()
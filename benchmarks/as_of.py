@@ -0,0 +1,96 @@
+"""Benchmark the as-of engine against the planner's expansion, on the hba1c
+results of a synthetic cohort.
+
+    python benchmarks/as_of.py --n-patients 100000
+
+Both compute the latest hba1c within the 7 windows of FeatureSpecifier for the
+cohort's visits. The expansion pairs each visit with every result within the
+largest window, the as-of engine looks up one result per visit. The outputs
+are checked to be equal before timing.
+"""
+import argparse
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    DIABETES_LAB_THRESHOLDS,
+)
+from t2d_feature_generation.synthetic_cohort import generate_synthetic_cohort
+
+SUITE = "as_of"
+
+INTERVAL_DAYS = (30, 180, 365, 730, 1095, 1460, 1825)
+
+
+def get_benchmarks(
+    prediction_times: pd.DataFrame,
+    values_df: pd.DataFrame,
+) -> dict[str, Callable[[], Any]]:
+    specs = [
+        WindowSpec(
+            loader_name="hba1c",
+            col_name=f"pred_hba1c_within_{interval_days}_days_latest_fallback_nan",
+            interval_days=interval_days,
+            direction="behind",
+            aggregation="latest",
+            fallback=np.nan,
+        )
+        for interval_days in INTERVAL_DAYS
+    ]
+
+    def flatten(engines: tuple[str, ...]) -> Callable[[], pd.DataFrame]:
+        return lambda: flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=specs,
+            load_values=lambda _: values_df,
+            engines=engines,
+        )
+
+    benchmarks = {"expansion": flatten(()), "as_of_engine": flatten(("as_of",))}
+
+    pd.testing.assert_frame_equal(
+        benchmarks["expansion"](),
+        benchmarks["as_of_engine"](),
+    )
+
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-patients", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    cohort = generate_synthetic_cohort(n_patients=args.n_patients)
+    values_df = cohort.get_lab_results(DIABETES_LAB_THRESHOLDS[0])
+    prediction_times = cohort.visits[["dw_ek_borger", "timestamp"]]
+    print(
+        f"{len(prediction_times):,} prediction times, {len(values_df):,} hba1c results",
+    )
+
+    results = run_benchmarks(
+        get_benchmarks(prediction_times, values_df),
+        repeat=args.repeat,
+        params={"n_patients": args.n_patients},
+    )
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Timing, memory profiling and result storage shared by the benchmarks.
+
+Results are appended as JSON lines to benchmarks/results/<suite>.jsonl, one per
+benchmark and run, with the commit they were run on. Comparing with the latest
+results of another commit shows regressions between commits on the same
+machine.
+"""
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from collections.abc import Mapping
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def get_commit() -> str:
+    """Short hash of the checked out commit, with a suffix if the tree is dirty."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        is_dirty = subprocess.run(
+            ["git", "diff", "--quiet", "HEAD", "--", "src"],
+            check=False,
+        ).returncode
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return f"{commit}-dirty" if is_dirty else commit
+
+
+def measure(fn: Callable[[], Any], repeat: int = 3) -> dict[str, float]:
+    """Time fn, and profile its peak memory.
+
+    Memory is profiled in a separate run, as tracing allocations slows fn down.
+    numpy and pandas report their array allocations to tracemalloc.
+
+    Returns:
+        dict[str, float]: Best and median wall-clock seconds over repeat runs, and the peak of
+            allocations during a run in MB.
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "best_seconds": min(timings),
+        "median_seconds": sorted(timings)[len(timings) // 2],
+        "peak_mb": peak_bytes / 1024**2,
+    }
+
+
+def run_benchmarks(
+    benchmarks: Mapping[str, Callable[[], Any]],
+    repeat: int = 3,
+    params: Optional[Mapping[str, Any]] = None,
+) -> list[dict[str, Any]]:
+    """Measure each benchmark, printing results as they finish."""
+    commit = get_commit()
+    run_at = datetime.now().isoformat(timespec="seconds")
+
+    results = []
+    for name, fn in benchmarks.items():
+        measurements = measure(fn, repeat=repeat)
+        print(
+            f"{name}: {measurements['best_seconds']:.3f} s, {measurements['peak_mb']:.1f} MB peak",
+        )
+
+        results.append(
+            {
+                "benchmark": name,
+                "commit": commit,
+                "run_at": run_at,
+                "machine": platform.node(),
+                "params": dict(params or {}),
+                **measurements,
+            },
+        )
+
+    return results
+
+
+def store_results(suite: str, results: list[dict[str, Any]]) -> Path:
+    """Append results to the suite's results file."""
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{suite}.jsonl"
+
+    with path.open("a") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    return path
+
+
+def compare_with_previous(
+    suite: str,
+    results: list[dict[str, Any]],
+) -> Optional[pd.DataFrame]:
+    """Compare results with the latest stored results of another commit, with
+    the same parameters and machine.
+
+    Returns:
+        Optional[pd.DataFrame]: Time and peak memory ratios per benchmark, or None if there is nothing to compare with.
+    """
+    path = RESULTS_DIR / f"{suite}.jsonl"
+    if not path.exists() or not results:
+        return None
+
+    stored = pd.DataFrame(
+        [json.loads(line) for line in path.read_text().splitlines() if line],
+    )
+    current = pd.DataFrame(results)
+    commit, params, machine = (
+        results[0]["commit"],
+        results[0]["params"],
+        results[0]["machine"],
+    )
+
+    previous = stored[
+        (stored["commit"] != commit)
+        & stored["params"].apply(lambda stored_params: stored_params == params)
+        & (stored["machine"] == machine)
+    ]
+    if previous.empty:
+        return None
+
+    previous = previous[previous["run_at"] == previous["run_at"].max()]
+    comparison = current.merge(
+        previous,
+        on="benchmark",
+        suffixes=("", "_previous"),
+    )
+
+    return pd.DataFrame(
+        {
+            "benchmark": comparison["benchmark"],
+            "previous_commit": comparison["commit_previous"],
+            "time_ratio": comparison["best_seconds"]
+            / comparison["best_seconds_previous"],
+            "peak_mb_ratio": comparison["peak_mb"] / comparison["peak_mb_previous"],
+        },
+    ).round(2)
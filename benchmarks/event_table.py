@@ -0,0 +1,162 @@
+"""Benchmark the event table against loading and sorting each source, on the
+diabetes lab results of a synthetic cohort.
+
+    python benchmarks/event_table.py --n-patients 100000 --lab-results-per-patient 30
+
+Compares sorting each source's frame into PatientSortedEvents with building
+one EventTable and gathering each source from it, and flattening the max, mean
+and latest of each lab within 30, 365 and 1825 days from either. Also times
+combining the first lab result per patient of each lab, which reads the first
+row of each patient in a table of the reduced labs. The flattened outputs are
+checked to be equal before timing.
+"""
+import argparse
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+
+from t2d_feature_generation.event_table import EventTable
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+from t2d_feature_generation.outcome_specification.first_event import (
+    combine_first_events,
+    get_first_event_per_patient,
+)
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    DIABETES_LAB_THRESHOLDS,
+)
+from t2d_feature_generation.synthetic_cohort import generate_synthetic_cohort
+
+SUITE = "event_table"
+
+INTERVAL_DAYS = (30, 365, 1825)
+
+
+def get_benchmarks(
+    prediction_times: pd.DataFrame,
+    values_by_lab: dict[str, pd.DataFrame],
+) -> dict[str, Callable[[], Any]]:
+    specs = [
+        WindowSpec(
+            loader_name=lab,
+            col_name=f"pred_{lab}_within_{interval_days}_days_{aggregation}_fallback_nan",
+            interval_days=interval_days,
+            direction="behind",
+            aggregation=aggregation,
+            fallback=np.nan,
+        )
+        for lab in values_by_lab
+        for interval_days in INTERVAL_DAYS
+        for aggregation in ("max", "mean", "latest")
+    ]
+    values_by_source = {
+        spec.source_key: values_by_lab[spec.loader_name] for spec in specs
+    }
+    patients = pd.Index(prediction_times["dw_ek_borger"].unique())
+    first_lab_results = {
+        lab: get_first_event_per_patient(values_df)
+        for lab, values_df in values_by_lab.items()
+    }
+
+    def build_event_table() -> EventTable:
+        return EventTable.from_frames(values_by_source, patients=patients)
+
+    def gather_each_source() -> list[PatientSortedEvents]:
+        table = build_event_table()
+        return [
+            PatientSortedEvents.from_event_table(table, source)
+            for source in values_by_source
+        ]
+
+    def sort_each_source() -> list[PatientSortedEvents]:
+        return [
+            PatientSortedEvents.from_df(values_df, patients=patients)
+            for values_df in values_by_source.values()
+        ]
+
+    def flatten_from_frames() -> pd.DataFrame:
+        return flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=specs,
+            load_values=lambda spec: values_by_lab[spec.loader_name],
+        )
+
+    def flatten_from_event_table() -> pd.DataFrame:
+        return flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=specs,
+            event_table=build_event_table(),
+        )
+
+    pd.testing.assert_frame_equal(flatten_from_event_table(), flatten_from_frames())
+
+    return {
+        "sort_each_source": sort_each_source,
+        "build_event_table_and_gather_each_source": gather_each_source,
+        "flatten_from_frames": flatten_from_frames,
+        "flatten_from_event_table": flatten_from_event_table,
+        "combine_first_events": lambda: combine_first_events(first_lab_results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-patients", type=int, default=100_000)
+    parser.add_argument("--lab-results-per-patient", type=float, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    cohort = generate_synthetic_cohort(
+        n_patients=args.n_patients,
+        lab_results_per_patient=args.lab_results_per_patient,
+    )
+    values_by_lab = {
+        threshold.value_type: cohort.get_lab_results(threshold)
+        for threshold in DIABETES_LAB_THRESHOLDS
+    }
+    prediction_times = cohort.visits[["dw_ek_borger", "timestamp"]]
+
+    table = EventTable.from_frames(values_by_lab)
+    frames_mb = sum(
+        df.memory_usage(deep=True).sum() for df in values_by_lab.values()
+    ) / (1024**2)
+    table_mb = sum(
+        array.nbytes
+        for array in (
+            table.codes,
+            table.timestamps,
+            table.values,
+            table.source_codes,
+            table.offsets,
+        )
+    ) / (1024**2)
+    print(
+        f"{len(prediction_times):,} prediction times, {len(table):,} lab results: {frames_mb:.0f} MB as frames, {table_mb:.0f} MB as an event table",
+    )
+
+    results = run_benchmarks(
+        get_benchmarks(prediction_times, values_by_lab),
+        repeat=args.repeat,
+        params={
+            "n_patients": args.n_patients,
+            "lab_results_per_patient": args.lab_results_per_patient,
+        },
+    )
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark reading a few columns of a wide feature set.
+
+    python benchmarks/feature_set_reader.py --n-columns 5000 --n-rows 20000
+
+Compares reading every file of the splits with pd.read_parquet and selecting
+three columns afterwards, as get_eligible_prediction_times.py did, with the
+FeatureSetReader, with and without filters on ids and timestamps. peak_mb only
+counts allocations traced by tracemalloc, which excludes Arrow's memory pool,
+so the peak resident set size delta of a run is printed as well.
+"""
+import argparse
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+
+from t2d_feature_generation.feature_set_reader import SPLITS, FeatureSetReader
+from t2d_feature_generation.instrumentation import Instrumentation
+
+SUITE = "feature_set_reader"
+COLUMNS = [
+    "dw_ek_borger",
+    "timestamp",
+    "outc_first_diabetes_lab_result_within_1095_days_max_fallback_0_dichotomous",
+]
+
+
+def write_feature_set(feature_set_dir: Path, n_rows: int, n_columns: int) -> None:
+    """Write a feature set of n_rows per split, sorted by id and timestamp."""
+    rng = np.random.default_rng(0)
+
+    for i, split in enumerate(SPLITS):
+        df = pd.DataFrame(
+            {
+                "dw_ek_borger": np.sort(rng.integers(0, n_rows // 10, n_rows))
+                + i * n_rows,
+                "timestamp": pd.Timestamp("2013-01-01")
+                + pd.to_timedelta(rng.integers(0, 9 * 365, n_rows), unit="D"),
+                COLUMNS[2]: rng.integers(0, 2, n_rows).astype(np.int8),
+                **{
+                    f"pred_{j}": rng.normal(size=n_rows).astype(np.float32)
+                    for j in range(n_columns - len(COLUMNS))
+                },
+            },
+        )
+        df.to_parquet(
+            feature_set_dir / f"t2d_features_{split}.parquet",
+            row_group_size=max(n_rows // 20, 1),
+        )
+
+
+def get_benchmarks(feature_set_dir: Path) -> dict[str, Callable[[], Any]]:
+    def read_and_concat() -> pd.DataFrame:
+        paths = [
+            next(iter(feature_set_dir.glob(f"*{split}*.parquet"))) for split in SPLITS
+        ]
+        return pd.concat([pd.read_parquet(path) for path in paths])[COLUMNS]
+
+    reader = FeatureSetReader(feature_set_dir)
+    ids = pd.read_parquet(
+        next(feature_set_dir.glob("*train*.parquet")),
+        columns=["dw_ek_borger"],
+    )["dw_ek_borger"].unique()[:100]
+
+    return {
+        "read_and_concat": read_and_concat,
+        "reader_projected": lambda: reader.read(columns=COLUMNS),
+        "reader_filtered": lambda: reader.read(
+            columns=COLUMNS,
+            ids=ids,
+            start=pd.Timestamp("2018-01-01"),
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-columns", type=int, default=5_000)
+    parser.add_argument("--n-rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        feature_set_dir = Path(tmp_dir)
+        write_feature_set(
+            feature_set_dir,
+            n_rows=args.n_rows,
+            n_columns=args.n_columns,
+        )
+
+        benchmarks = get_benchmarks(feature_set_dir)
+        results = run_benchmarks(
+            benchmarks,
+            repeat=args.repeat,
+            params={"n_columns": args.n_columns, "n_rows": args.n_rows},
+        )
+
+        with Instrumentation() as instrumentation:
+            for name, fn in benchmarks.items():
+                with instrumentation.measure(stage="load", name=name) as record:
+                    record.rows_out = len(fn())
+
+    print(instrumentation.get_report()[["name", "peak_memory_delta_mb"]])
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark the first-event-per-patient kernel against the sort + groupby
+implementation it replaces, on synthetic lab results.
+
+    python benchmarks/first_event.py --n-rows 20000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.outcome_specification.first_event import (
+    get_first_event_per_patient,
+)
+
+
+def generate_lab_results(n_rows: int, n_patients: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    start, end = pd.Timestamp("2011-01-01").value, pd.Timestamp("2022-01-01").value
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, n_patients, n_rows),
+            "timestamp": pd.to_datetime(rng.integers(start, end, n_rows)),
+            "value": rng.normal(40, 10, n_rows),
+        },
+    )
+
+
+def sort_and_groupby(df: pd.DataFrame) -> pd.DataFrame:
+    return (
+        df.sort_values("timestamp")
+        .groupby("dw_ek_borger")
+        .first()
+        .reset_index(drop=False)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-rows", type=int, default=20_000_000)
+    parser.add_argument("--n-patients", type=int, default=300_000)
+    args = parser.parse_args()
+
+    df = generate_lab_results(n_rows=args.n_rows, n_patients=args.n_patients)
+
+    timings = {}
+    for name, fn in (
+        ("sort_and_groupby", sort_and_groupby),
+        ("first_event_kernel", get_first_event_per_patient),
+    ):
+        start_time = time.perf_counter()
+        fn(df)
+        timings[name] = time.perf_counter() - start_time
+        print(f"{name}: {timings[name]:.2f} s")
+
+    print(
+        f"Speedup: {timings['sort_and_groupby'] / timings['first_event_kernel']:.1f}x on {args.n_rows:,} rows",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark importing specify_features in a fresh interpreter.
+
+    python benchmarks/import_time.py --max-seconds 2.5
+
+Imports are timed in a subprocess each, so modules are never already imported.
+"eager_loaders" also imports the modules whose @data_loaders.register side
+effects specify_features used to import, which lazy loader registration
+defers until a spec resolves them. "python_startup" is the interpreter alone.
+
+As a regression guard, the script exits with an error if importing
+specify_features imports any of the deferred modules, or takes longer than
+--max-seconds.
+"""
+import argparse
+import subprocess
+import sys
+
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+
+SUITE = "import_time"
+DEFERRED_MODULES = (
+    "psycop_feature_generation.loaders.raw",
+    "t2d_feature_generation.outcome_specification.combined",
+    "t2d_feature_generation.outcome_specification.lab_results",
+)
+IMPORTS = {
+    "python_startup": "pass",
+    "specify_features": "import t2d_feature_generation.specify_features",
+    "eager_loaders": "import t2d_feature_generation.specify_features, "
+    + ", ".join(DEFERRED_MODULES),
+}
+
+
+def run_python(code: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def get_deferred_imports() -> list[str]:
+    """Deferred modules imported by importing specify_features."""
+    output = run_python(
+        f"{IMPORTS['specify_features']}; import sys; "
+        f"print(*[name for name in {DEFERRED_MODULES!r} if name in sys.modules])",
+    )
+    return output.split()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        {name: lambda code=code: run_python(code) for name, code in IMPORTS.items()},
+        repeat=args.repeat,
+    )
+    columns = ["benchmark", "best_seconds", "median_seconds"]
+    print(pd.DataFrame(results)[columns].to_string(index=False))
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+    deferred_imports = get_deferred_imports()
+    if deferred_imports:
+        sys.exit(f"Importing specify_features imported {deferred_imports}")
+
+    import_seconds = results[1]["best_seconds"]
+    if args.max_seconds is not None and import_seconds > args.max_seconds:
+        sys.exit(
+            f"Importing specify_features took {import_seconds:.2f} s, more than {args.max_seconds:.2f} s",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark the incident outcome engine against timeseriesflattener, on the
+first diabetes lab results of a synthetic cohort.
+
+    python benchmarks/incident_outcomes.py --n-patients 1000000
+
+Both compute the 1 to 5 year outcomes of FeatureSpecifier for the cohort's
+visits. timeseriesflattener merges the visits with the first lab results once
+per outcome, the engine once in total. The outputs are checked to be equal
+before timing.
+"""
+import argparse
+from collections.abc import Callable
+from typing import Any
+
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+from outcome_specification import use_synthetic_sources
+from timeseriesflattener.feature_spec_objects import OutcomeSpec
+from timeseriesflattener.flattened_dataset import TimeseriesFlattener
+
+from t2d_feature_generation.flattening.flatten import flatten_with_incident_engine
+from t2d_feature_generation.loader_cache import configure_loader_cache
+from t2d_feature_generation.outcome_specification import lab_results
+from t2d_feature_generation.synthetic_cohort import generate_synthetic_cohort
+
+SUITE = "incident_outcomes"
+
+
+def get_benchmarks(
+    prediction_times: pd.DataFrame,
+    first_diabetes_lab_result: pd.DataFrame,
+) -> dict[str, Callable[[], Any]]:
+    specs = [
+        OutcomeSpec(
+            values_df=first_diabetes_lab_result,
+            feature_name="first_diabetes_lab_result",
+            lookahead_days=year * 365,
+            resolve_multiple_fn="max",
+            fallback=0,
+            incident=True,
+            allowed_nan_value_prop=0,
+            prefix="outc",
+        )
+        for year in (1, 2, 3, 4, 5)
+    ]
+
+    def timeseriesflattener() -> pd.DataFrame:
+        flattener = TimeseriesFlattener(
+            prediction_times_df=prediction_times.copy(),
+            entity_id_col_name="dw_ek_borger",
+            drop_pred_times_with_insufficient_look_distance=False,
+        )
+        flattener.add_spec(specs)
+        return flattener.get_df().drop(columns="prediction_time_uuid")
+
+    def incident_engine() -> pd.DataFrame:
+        return flatten_with_incident_engine(
+            flattened_df=prediction_times,
+            specs=specs,
+            entity_id_col_name="dw_ek_borger",
+            timestamp_col_name="timestamp",
+        )
+
+    pd.testing.assert_frame_equal(
+        incident_engine().reset_index(drop=True),
+        timeseriesflattener().reset_index(drop=True),
+    )
+
+    return {
+        "timeseriesflattener": timeseriesflattener,
+        "incident_engine": incident_engine,
+        "incident_engine_with_time_to_event": lambda: flatten_with_incident_engine(
+            flattened_df=prediction_times,
+            specs=specs,
+            entity_id_col_name="dw_ek_borger",
+            timestamp_col_name="timestamp",
+            time_to_event_prefix="eval",
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-patients", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    configure_loader_cache(cache_dir=None)
+
+    cohort = generate_synthetic_cohort(n_patients=args.n_patients)
+    with use_synthetic_sources(cohort):
+        first_diabetes_lab_result = (
+            lab_results.get_first_diabetes_lab_result_above_threshold(pushdown=False)
+        )
+    prediction_times = cohort.visits[["dw_ek_borger", "timestamp"]]
+    print(
+        f"{len(prediction_times):,} prediction times, {len(first_diabetes_lab_result):,} first diabetes lab results",
+    )
+
+    results = run_benchmarks(
+        get_benchmarks(prediction_times, first_diabetes_lab_result),
+        repeat=args.repeat,
+        params={"n_patients": args.n_patients},
+    )
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
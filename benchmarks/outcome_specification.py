@@ -0,0 +1,171 @@
+"""Benchmark the outcome specification and eligibility criteria on a synthetic
+cohort.
+
+    python benchmarks/outcome_specification.py --n-patients 1000000
+
+The psycop loaders are replaced by the cohort's sources, so each benchmark
+measures the computation on top of the loaded data. Results are stored in
+benchmarks/results/outcome_specification.jsonl, and compared with the latest
+results of another commit with the same parameters.
+
+With --pushdown, the lab result threshold queries are also run against a SQLite
+copy of the lab results view, with and without pushing the threshold down.
+"""
+import argparse
+import contextlib
+import sqlite3
+from collections.abc import Iterator
+from functools import partial
+from typing import Any, Callable
+from unittest import mock
+
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+
+from t2d_feature_generation.eligibility import get_eligible_prediction_times
+from t2d_feature_generation.loader_cache import configure_loader_cache
+from t2d_feature_generation.outcome_specification import (
+    combined,
+    lab_results,
+    medications,
+    t1d_diagnoses,
+    t2d_diagnoses,
+)
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    DIABETES_LAB_THRESHOLDS,
+    load_lab_results_above_threshold,
+)
+from t2d_feature_generation.synthetic_cohort import (
+    SyntheticCohort,
+    generate_synthetic_cohort,
+)
+
+SUITE = "outcome_specification"
+
+
+@contextlib.contextmanager
+def use_synthetic_sources(cohort: SyntheticCohort) -> Iterator[None]:
+    """Replace the psycop loaders used by the outcome specification with the
+    cohort's sources."""
+    labs = {lab.value_type: lab for lab in DIABETES_LAB_THRESHOLDS}
+    replacements: list[tuple[Any, str, Callable[..., pd.DataFrame]]] = [
+        (t1d_diagnoses, "type_1_diabetes", lambda: cohort.t1d_diagnoses),
+        (t2d_diagnoses, "type_2_diabetes", lambda: cohort.t2d_diagnoses),
+        (
+            medications,
+            "load_medications",
+            lambda **_: cohort.antidiabetic_medications,
+        ),
+        # The pushdown path needs a warehouse, so the combined indicator uses
+        # the psycop lab loaders
+        (
+            combined,
+            "get_first_diabetes_lab_result_above_threshold",
+            partial(
+                lab_results.get_first_diabetes_lab_result_above_threshold,
+                pushdown=False,
+            ),
+        ),
+    ] + [
+        (
+            lab_results,
+            loader_name,
+            partial(cohort.get_lab_results, labs[value_type]),
+        )
+        for loader_name, value_type in (
+            ("hba1c", "hba1c"),
+            ("unscheduled_p_glc", "unscheduled_p_glc"),
+            ("fasting_p_glc", "fasting_p_glc"),
+            ("ogtt", "ogtt"),
+        )
+    ]
+
+    with contextlib.ExitStack() as stack:
+        for module, name, replacement in replacements:
+            stack.enter_context(mock.patch.object(module, name, replacement))
+
+        yield
+
+
+def get_benchmarks(cohort: SyntheticCohort) -> dict[str, Callable[[], Any]]:
+    first_diabetes_indicator = combined.get_first_diabetes_indicator()
+    first_diabetes_lab_result = (
+        lab_results.get_first_diabetes_lab_result_above_threshold(pushdown=False)
+    )
+
+    return {
+        "first_type_1_diabetes_diagnosis": t1d_diagnoses.get_first_type_1_diabetes_diagnosis,
+        "first_type_2_diabetes_diagnosis": t2d_diagnoses.get_first_type_2_diabetes_diagnosis,
+        "first_antidiabetic_medication": medications.get_first_antidiabetic_medication,
+        "diabetes_lab_results_above_threshold": lab_results.get_diabetes_lab_results_above_threshold,
+        "first_diabetes_lab_result": partial(
+            lab_results.get_first_diabetes_lab_result_above_threshold,
+            pushdown=False,
+        ),
+        "first_diabetes_indicator": combined.get_first_diabetes_indicator,
+        "eligible_prediction_times": partial(
+            get_eligible_prediction_times,
+            prediction_times=cohort.visits,
+            first_diabetes_indicator=first_diabetes_indicator,
+            first_diabetes_lab_result=first_diabetes_lab_result,
+            quarantine_timestamps=cohort.moves,
+        ),
+    }
+
+
+def get_pushdown_benchmarks(cohort: SyntheticCohort) -> dict[str, Callable[[], Any]]:
+    con = sqlite3.connect(":memory:", check_same_thread=False)
+    con.execute("ATTACH DATABASE ':memory:' AS fct")
+    cohort.write_lab_results_view(con)
+
+    def read_sql(query: str, chunksize: Any = None) -> Any:
+        return pd.read_sql(query, con, chunksize=chunksize)
+
+    return {
+        f"first_{lab.value_type}_above_threshold_{mode}": partial(
+            load_lab_results_above_threshold,
+            lab=lab,
+            first_per_patient=True,
+            pushdown=mode == "pushdown",
+            read_sql=read_sql,
+        )
+        for lab in DIABETES_LAB_THRESHOLDS[:1]
+        for mode in ("pushdown", "streaming")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-patients", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pushdown", action="store_true")
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    # Measure the computation, not reads from the loader cache
+    configure_loader_cache(cache_dir=None)
+
+    cohort = generate_synthetic_cohort(n_patients=args.n_patients)
+    print(f"Generated {args.n_patients:,} patients: {cohort.get_n_rows()}")
+
+    with use_synthetic_sources(cohort):
+        benchmarks = get_benchmarks(cohort)
+        if args.pushdown:
+            benchmarks.update(get_pushdown_benchmarks(cohort))
+
+        results = run_benchmarks(
+            benchmarks,
+            repeat=args.repeat,
+            params={"n_patients": args.n_patients, "pushdown": args.pushdown},
+        )
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
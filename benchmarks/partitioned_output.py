@@ -0,0 +1,126 @@
+"""Benchmark writing a split as a single file vs. as yearly partitions.
+
+    python benchmarks/partitioned_output.py --n-rows 500000 --n-columns 500
+
+The single file is written as psycop's save_split_to_disk does, with
+DataFrame.to_parquet defaults. For each layout, the write time, throughput of
+in-memory data, size on disk and the time of reading three columns of 10
+patients within a year with the FeatureSetReader are reported.
+"""
+import argparse
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+
+from t2d_feature_generation.feature_set_reader import FeatureSetReader
+from t2d_feature_generation.partitioned_output import write_partitioned_split
+
+SUITE = "partitioned_output"
+
+
+def make_split_df(n_rows: int, n_columns: int) -> pd.DataFrame:
+    """A flattened split with the compact dtype policy: a third of the columns
+    are dichotomous int8 flags, the rest float32 with missing values."""
+    rng = np.random.default_rng(0)
+    n_flags = n_columns // 3
+
+    columns = {
+        "dw_ek_borger": rng.integers(0, n_rows // 20, n_rows).astype(np.int32),
+        "timestamp": pd.Timestamp("2013-01-01")
+        + pd.to_timedelta(rng.integers(0, 9 * 365 * 24, n_rows), unit="h"),
+    }
+    for i in range(n_flags):
+        columns[f"pred_flag_{i}"] = (rng.random(n_rows) < 0.1).astype(np.int8)
+    for i in range(n_columns - n_flags):
+        values = rng.lognormal(3, 0.5, n_rows).astype(np.float32)
+        values[rng.random(n_rows) < 0.5] = np.nan
+        columns[f"pred_value_{i}"] = values
+
+    return pd.DataFrame(columns)
+
+
+def get_size_mb(path: Path) -> float:
+    return sum(file.stat().st_size for file in path.rglob("*.parquet")) / 1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-rows", type=int, default=200_000)
+    parser.add_argument("--n-columns", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    split_df = make_split_df(n_rows=args.n_rows, n_columns=args.n_columns)
+    in_memory_mb = split_df.memory_usage(index=False).sum() / 1024**2
+    ids = split_df["dw_ek_borger"].drop_duplicates().sample(10, random_state=0)
+    columns = ["dw_ek_borger", "timestamp", "pred_value_0"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        layout_dirs = {
+            "single_file": Path(tmp_dir) / "single_file",
+            "partitioned": Path(tmp_dir) / "partitioned",
+        }
+        layout_dirs["single_file"].mkdir()
+
+        writers: dict[str, Callable[[], Any]] = {
+            "single_file": lambda: split_df.to_parquet(
+                layout_dirs["single_file"] / "t2d_features_train.parquet",
+            ),
+            "partitioned": lambda: write_partitioned_split(
+                split_df=split_df,
+                split_dir=layout_dirs["partitioned"] / "split=train",
+            ),
+        }
+        results = run_benchmarks(
+            {f"write_{layout}": writer for layout, writer in writers.items()},
+            repeat=args.repeat,
+            params={"n_rows": args.n_rows, "n_columns": args.n_columns},
+        )
+
+        for result, layout_dir in zip(results, layout_dirs.values()):
+            reader = FeatureSetReader(layout_dir, splits=["train"])
+            start_time = time.perf_counter()
+            reader.read(
+                columns=columns,
+                ids=ids,
+                start=pd.Timestamp("2018-01-01"),
+                end=pd.Timestamp("2019-01-01"),
+            )
+
+            result.update(
+                {
+                    "size_mb": get_size_mb(layout_dir),
+                    "throughput_mb_per_second": in_memory_mb / result["best_seconds"],
+                    "filtered_read_seconds": time.perf_counter() - start_time,
+                },
+            )
+
+    print(
+        pd.DataFrame(results)[
+            [
+                "benchmark",
+                "best_seconds",
+                "throughput_mb_per_second",
+                "size_mb",
+                "filtered_read_seconds",
+            ]
+        ].to_string(index=False),
+    )
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
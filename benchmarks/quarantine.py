@@ -0,0 +1,84 @@
+"""Benchmark the quarantine index against psycop's PredictionTimeFilterer, on the
+visits and moves of a synthetic cohort.
+
+    python benchmarks/quarantine.py --n-patients 1000000
+
+The filterer merges the visits with every move of their patient, the index
+searches the latest move before each visit once, also for the 720 and 730 day
+quarantines of main.py and the eligibility criteria in one call. The outputs
+are checked to be equal before timing.
+"""
+import argparse
+from collections.abc import Callable
+from typing import Any
+
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+from psycop_feature_generation.application_modules.filter_prediction_times import (
+    PredictionTimeFilterer,
+)
+
+from t2d_feature_generation.quarantine import QuarantineIndex, filter_prediction_times
+from t2d_feature_generation.synthetic_cohort import generate_synthetic_cohort
+
+SUITE = "quarantine"
+
+
+def get_benchmarks(
+    prediction_times: pd.DataFrame,
+    moves: pd.DataFrame,
+) -> dict[str, Callable[[], Any]]:
+    def prediction_time_filterer() -> pd.DataFrame:
+        # The filterer adds a uuid column to the prediction times in place
+        return PredictionTimeFilterer(
+            prediction_times_df=prediction_times.copy(),
+            entity_id_col_name="dw_ek_borger",
+            quarantine_timestamps_df=moves,
+            quarantine_interval_days=720,
+        ).run_filter()
+
+    def quarantine_index() -> pd.DataFrame:
+        return filter_prediction_times(
+            prediction_times_df=prediction_times,
+            quarantine_df=moves,
+            quarantine_days=720,
+        )
+
+    pd.testing.assert_frame_equal(quarantine_index(), prediction_time_filterer())
+
+    return {
+        "prediction_time_filterer": prediction_time_filterer,
+        "quarantine_index": quarantine_index,
+        "quarantine_index_720_and_730_days": lambda: QuarantineIndex(
+            moves,
+        ).get_exclusions(prediction_times, [720, 730]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-patients", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    cohort = generate_synthetic_cohort(n_patients=args.n_patients)
+    prediction_times = cohort.visits[["dw_ek_borger", "timestamp"]]
+    print(f"{len(prediction_times):,} prediction times, {len(cohort.moves):,} moves")
+
+    results = run_benchmarks(
+        get_benchmarks(prediction_times, cohort.moves),
+        repeat=args.repeat,
+        params={"n_patients": args.n_patients},
+    )
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
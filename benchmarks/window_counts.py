@@ -0,0 +1,94 @@
+"""Benchmark the window-count engine against the planner's expansion, on a
+diagnosis-like source with an event at every visit of a synthetic cohort.
+
+    python benchmarks/window_counts.py --n-patients 100000
+
+Both compute the count, mean and bool of the source within the 7 windows of
+FeatureSpecifier for the cohort's visits. The expansion pairs each visit with
+every event within the largest window, the window-count engine searches the
+bounds of each window. The outputs are checked to be equal before timing.
+"""
+import argparse
+from collections.abc import Callable
+from typing import Any
+
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+from t2d_feature_generation.synthetic_cohort import generate_synthetic_cohort
+
+SUITE = "window_counts"
+
+INTERVAL_DAYS = (30, 180, 365, 730, 1095, 1460, 1825)
+
+
+def get_benchmarks(
+    prediction_times: pd.DataFrame,
+    values_df: pd.DataFrame,
+) -> dict[str, Callable[[], Any]]:
+    specs = [
+        WindowSpec(
+            loader_name="visits",
+            col_name=f"pred_visits_within_{interval_days}_days_{aggregation}_fallback_0",
+            interval_days=interval_days,
+            direction="behind",
+            aggregation=aggregation,
+            fallback=0,
+        )
+        for interval_days in INTERVAL_DAYS
+        for aggregation in ("count", "mean", "bool")
+    ]
+
+    def flatten(engines: tuple[str, ...]) -> Callable[[], pd.DataFrame]:
+        return lambda: flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=specs,
+            load_values=lambda _: values_df,
+            engines=engines,
+        )
+
+    benchmarks = {
+        "expansion": flatten(()),
+        "window_count_engine": flatten(("window_counts",)),
+    }
+
+    pd.testing.assert_frame_equal(
+        benchmarks["expansion"](),
+        benchmarks["window_count_engine"](),
+    )
+
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-patients", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    cohort = generate_synthetic_cohort(n_patients=args.n_patients)
+    prediction_times = cohort.visits[["dw_ek_borger", "timestamp"]]
+    values_df = prediction_times.assign(value=1.0)
+    print(f"{len(prediction_times):,} prediction times and events")
+
+    results = run_benchmarks(
+        get_benchmarks(prediction_times, values_df),
+        repeat=args.repeat,
+        params={"n_patients": args.n_patients},
+    )
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
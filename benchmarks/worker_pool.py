@@ -0,0 +1,168 @@
+"""Benchmark resolving the planner's sources in a worker pool, on the diabetes
+lab results of a synthetic cohort.
+
+    python benchmarks/worker_pool.py --n-patients 100000 --lab-results-per-patient 30
+
+Compares computing all sources in this process with computing them in a
+SourcePool, and the cost of starting a task that receives the prediction times
+and a source's events pickled with one that attaches to them. Starting a
+pickled task grows with the cohort, starting an attached one does not. Peak
+memory is that of this process; workers are not profiled.
+"""
+import argparse
+import tempfile
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from benchmark_utils import compare_with_previous, run_benchmarks, store_results
+
+from t2d_feature_generation.dtypes import timestamps_to_int64
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+from t2d_feature_generation.flattening.worker_pool import (
+    attach_arrays,
+    publish_arrays,
+)
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    DIABETES_LAB_THRESHOLDS,
+)
+from t2d_feature_generation.synthetic_cohort import generate_synthetic_cohort
+
+SUITE = "worker_pool"
+
+INTERVAL_DAYS = (30, 180, 365, 730, 1095, 1460, 1825)
+
+
+def count_pickled(arrays: dict[str, np.ndarray]) -> int:
+    return sum(len(array) for array in arrays.values())
+
+
+def count_attached(paths: list[Path]) -> int:
+    return sum(len(array) for path in paths for array in attach_arrays(path).values())
+
+
+def get_benchmarks(
+    prediction_times: pd.DataFrame,
+    values_by_lab: dict[str, pd.DataFrame],
+    max_workers: int,
+    shared_dir: Path,
+    executor: ProcessPoolExecutor,
+) -> dict[str, Callable[[], Any]]:
+    specs = [
+        WindowSpec(
+            loader_name=lab,
+            col_name=f"pred_{lab}_within_{interval_days}_days_{aggregation}_fallback_nan",
+            interval_days=interval_days,
+            direction="behind",
+            aggregation=aggregation,
+            fallback=np.nan,
+        )
+        for lab in values_by_lab
+        for interval_days in INTERVAL_DAYS
+        for aggregation in ("max", "min", "mean", "latest")
+    ]
+
+    def flatten(**kwargs: Any) -> Callable[[], pd.DataFrame]:
+        return lambda: flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=specs,
+            load_values=lambda spec: values_by_lab[spec.loader_name],
+            **kwargs,
+        )
+
+    # The arrays a task needs to compute the first lab
+    codes, patients = pd.factorize(prediction_times["dw_ek_borger"])
+    events = PatientSortedEvents.from_df(
+        values_by_lab[specs[0].loader_name],
+        patients=pd.Index(patients),
+    )
+    arrays = {
+        "codes": codes.astype(np.int64),
+        "timestamps": timestamps_to_int64(prediction_times["timestamp"]),
+        "event_codes": events.codes,
+        "event_timestamps": events.timestamps,
+        "event_values": events.values,
+    }
+    paths = [
+        publish_arrays({name: array}, shared_dir / f"{name}.arrow")
+        for name, array in arrays.items()
+    ]
+
+    benchmarks = {
+        "in_process": flatten(),
+        f"worker_pool_{max_workers}_workers": flatten(
+            max_workers=max_workers,
+            shared_dir=shared_dir,
+        ),
+        "pickled_task": lambda: executor.submit(count_pickled, arrays).result(),
+        "attached_task": lambda: executor.submit(count_attached, paths).result(),
+    }
+
+    pd.testing.assert_frame_equal(
+        benchmarks[f"worker_pool_{max_workers}_workers"](),
+        benchmarks["in_process"](),
+    )
+    assert benchmarks["pickled_task"]() == benchmarks["attached_task"]()
+
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-patients", type=int, default=100_000)
+    parser.add_argument("--lab-results-per-patient", type=float, default=30)
+    parser.add_argument("--max-workers", type=int, default=2)
+    parser.add_argument("--shared-dir", type=Path, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    cohort = generate_synthetic_cohort(
+        n_patients=args.n_patients,
+        lab_results_per_patient=args.lab_results_per_patient,
+    )
+    values_by_lab = {
+        threshold.value_type: cohort.get_lab_results(threshold)
+        for threshold in DIABETES_LAB_THRESHOLDS
+    }
+    prediction_times = cohort.visits[["dw_ek_borger", "timestamp"]]
+    print(
+        f"{len(prediction_times):,} prediction times, {sum(map(len, values_by_lab.values())):,} lab results",
+    )
+
+    with tempfile.TemporaryDirectory(
+        dir=args.shared_dir,
+    ) as shared_dir, ProcessPoolExecutor(max_workers=1) as executor:
+        results = run_benchmarks(
+            get_benchmarks(
+                prediction_times,
+                values_by_lab,
+                max_workers=args.max_workers,
+                shared_dir=Path(shared_dir),
+                executor=executor,
+            ),
+            repeat=args.repeat,
+            params={
+                "n_patients": args.n_patients,
+                "lab_results_per_patient": args.lab_results_per_patient,
+                "max_workers": args.max_workers,
+            },
+        )
+
+    comparison = compare_with_previous(SUITE, results)
+    if comparison is not None:
+        print(comparison.to_string(index=False))
+
+    if not args.no_store:
+        print(f"Stored results in {store_results(SUITE, results)}")
+
+
+if __name__ == "__main__":
+    main()
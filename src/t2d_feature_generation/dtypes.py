@@ -0,0 +1,176 @@
+"""Compact dtypes for event tables and flattened datasets.
+
+Most flattened columns are presence flags of diagnoses and medications, which
+fit in int8, and lab values and demographics, which do not need float64. The
+policy is decided per spec, before resolving it, so every shard, partition and
+cached column of a feature gets the same dtype regardless of its values:
+
+- Specs with a 0 fallback and an aggregation that keeps values of 0/1 sources
+  within 0/1 (e.g. max or latest of a medication) get int8, as do dichotomous
+  outcomes.
+- Other numeric features get float32.
+- Patient ids get int32, and low-cardinality strings such as source and
+  value_type get a categorical dtype.
+
+Casts to int8 are checked to be lossless, so a spec that is wrongly classified
+as dichotomous raises instead of silently truncating its values.
+"""
+import logging
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+DICHOTOMOUS_DTYPE = "int8"
+NUMERIC_DTYPE = "float32"
+ID_DTYPE = "int32"
+
+# Aggregations whose result is one of the values, or 1 for all-1 sources
+DICHOTOMOUS_AGGREGATIONS = ("max", "min", "mean", "latest", "earliest", "bool")
+
+CATEGORICAL_COL_NAMES = ("source", "value_type")
+
+# NaT as int64 nanoseconds since epoch
+NAT_INT64 = np.iinfo(np.int64).min
+
+
+def get_compact_dtype(aggregation: str, fallback: Any) -> str:
+    """Get the compact dtype of a temporal feature."""
+    if aggregation in DICHOTOMOUS_AGGREGATIONS and fallback in (0, 1):
+        return DICHOTOMOUS_DTYPE
+
+    return NUMERIC_DTYPE
+
+
+def get_compact_dtype_for_spec(spec: Any) -> Optional[str]:
+    """Get the compact dtype of a timeseriesflattener spec's column, or None to
+    keep the dtype it is resolved with, e.g. for static timestamps."""
+    if getattr(spec, "incident", False) and spec.is_dichotomous():
+        return DICHOTOMOUS_DTYPE
+
+    if hasattr(spec, "key_for_resolve_multiple"):
+        return get_compact_dtype(spec.key_for_resolve_multiple, spec.fallback)
+
+    return None
+
+
+def cast_column(values: np.ndarray, dtype: str, col_name: str) -> np.ndarray:
+    """Cast a column to dtype.
+
+    Raises:
+        ValueError: If the column has values that an integer dtype cannot hold.
+    """
+    values = np.asarray(values)
+    if values.dtype == dtype:
+        return values
+
+    with np.errstate(invalid="ignore"):
+        cast = values.astype(dtype)
+
+    if np.issubdtype(cast.dtype, np.integer) and not np.array_equal(cast, values):
+        raise ValueError(
+            f"{col_name}: Values cannot be cast to {dtype} without loss. Is the spec dichotomous?",
+        )
+
+    return cast
+
+
+def timestamps_to_int64(timestamps: pd.Series) -> np.ndarray:
+    """Convert a datetime series to int64 nanoseconds since epoch."""
+    return timestamps.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def compact_ids(ids: pd.Series) -> pd.Series:
+    """Cast integer patient ids to int32, if they fit."""
+    if not pd.api.types.is_integer_dtype(ids) or len(ids) == 0:
+        return ids
+
+    info = np.iinfo(ID_DTYPE)
+    if ids.min() < info.min or ids.max() > info.max:
+        log.warning(f"{ids.name}: Ids do not fit in {ID_DTYPE}, keeping {ids.dtype}")
+        return ids
+
+    return ids.astype(ID_DTYPE)
+
+
+def compact_event_df(df: pd.DataFrame) -> pd.DataFrame:
+    """Make the low-cardinality string columns of an event table categorical."""
+    return df.astype(
+        {
+            col_name: "category"
+            for col_name in CATEGORICAL_COL_NAMES
+            if col_name in df.columns
+        },
+    )
+
+
+def compact_flattened_df(
+    df: pd.DataFrame,
+    dtypes: dict[str, str],
+    entity_id_col_name: str = "dw_ek_borger",
+) -> pd.DataFrame:
+    """Apply the policy to a flattened dataframe, e.g. one resolved by
+    timeseriesflattener.
+
+    Args:
+        df (pd.DataFrame): Flattened dataframe.
+        dtypes (dict[str, str]): Dtypes of spec columns, from get_compact_dtype_for_spec.
+        entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+
+    Returns:
+        pd.DataFrame: The dataframe with compact dtypes. Float64 columns that are not in dtypes,
+            e.g. age, become float32.
+    """
+    df = compact_event_df(df)
+
+    for col_name in df.columns:
+        if col_name == entity_id_col_name:
+            df[col_name] = compact_ids(df[col_name])
+        elif col_name in dtypes:
+            df[col_name] = cast_column(df[col_name], dtypes[col_name], col_name)
+        elif df[col_name].dtype == np.float64:
+            df[col_name] = df[col_name].astype(NUMERIC_DTYPE)
+
+    return df
+
+
+def _get_baseline_bytes(column: pd.Series) -> int:
+    """Bytes the column takes without the policy: 64-bit numbers and object strings."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return int(column.astype(object).memory_usage(index=False, deep=True))
+
+    if pd.api.types.is_numeric_dtype(column) or pd.api.types.is_bool_dtype(column):
+        return len(column) * 8
+
+    return int(column.memory_usage(index=False, deep=True))
+
+
+def get_memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Memory of a flattened dataframe by dtype, compared with the same frame
+    without the compact dtype policy.
+
+    Returns:
+        pd.DataFrame: One row per dtype, and a total, with the number of columns, and memory in MB with
+            and without the policy.
+    """
+    report = pd.DataFrame(
+        {
+            "dtype": [str(dtype) for dtype in df.dtypes],
+            "n_columns": 1,
+            "mb": [
+                df[col_name].memory_usage(index=False, deep=True) / 1024**2
+                for col_name in df.columns
+            ],
+            "baseline_mb": [
+                _get_baseline_bytes(df[col_name]) / 1024**2 for col_name in df.columns
+            ],
+        },
+    )
+
+    report = report.groupby("dtype").sum()
+    report.loc["total"] = report.sum()
+    report["saved_prop"] = 1 - report["mb"] / report["baseline_mb"]
+
+    return report.round(3)
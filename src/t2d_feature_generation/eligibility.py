@@ -0,0 +1,182 @@
+"""Eligibility criteria for prediction times.
+
+Applies all criteria in one vectorised pass over the prediction times. The
+previous approach merged the prediction times with each source on dw_ek_borger,
+which copies every column for each merge. Here, each criterion is a boolean mask,
+computed from per-patient timestamp lookups. Nothing is merged, so peak memory
+stays close to the size of the prediction times.
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.quarantine import QuarantineIndex
+
+log = logging.getLogger(__name__)
+
+MIN_DATE = datetime(year=2013, month=1, day=1)
+QUARANTINE_DAYS = 730
+
+
+def get_first_timestamp_per_patient(
+    prediction_times: pd.DataFrame,
+    events: pd.DataFrame,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+) -> pd.Series:
+    """Look up each prediction time's patient's first event timestamp.
+
+    Returns:
+        pd.Series: First event timestamp, aligned with prediction_times. NaT for patients without events.
+    """
+    first_timestamps = events.groupby(entity_id_col_name)[timestamp_col_name].min()
+    return prediction_times[entity_id_col_name].map(first_timestamps)
+
+
+def is_within_quarantine(
+    prediction_times: pd.DataFrame,
+    quarantine_timestamps: pd.DataFrame,
+    quarantine_days: int,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+) -> np.ndarray:
+    """Whether each prediction time is within quarantine_days after one of its
+    patient's quarantine timestamps. See QuarantineIndex.
+
+    Returns:
+        np.ndarray: Boolean mask, aligned with prediction_times.
+    """
+    quarantine_index = QuarantineIndex(
+        quarantine_timestamps=quarantine_timestamps,
+        entity_id_col_name=entity_id_col_name,
+        timestamp_col_name=timestamp_col_name,
+    )
+    return quarantine_index.get_exclusions(prediction_times, [quarantine_days])[
+        quarantine_days
+    ]
+
+
+def get_eligible_prediction_times(
+    prediction_times: pd.DataFrame,
+    first_diabetes_indicator: pd.DataFrame,
+    first_diabetes_lab_result: pd.DataFrame,
+    quarantine_timestamps: Optional[pd.DataFrame] = None,
+    min_date: datetime = MIN_DATE,
+    quarantine_days: int = QUARANTINE_DAYS,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Keep the prediction times that meet the eligibility criteria.
+
+    In order, prediction times are excluded if they are:
+        1. At or before min_date.
+        2. From a patient with a diabetes indicator before min_date (prevalent diabetes).
+        3. After the patient's first lab result above the diabetes threshold (incident diabetes).
+        4. Within quarantine_days after a quarantine timestamp, e.g. moving into the region.
+
+    Args:
+        prediction_times (pd.DataFrame): Prediction times with an id and a timestamp column.
+        first_diabetes_indicator (pd.DataFrame): First diabetes indicator per patient.
+        first_diabetes_lab_result (pd.DataFrame): First lab result above the diabetes threshold per patient.
+        quarantine_timestamps (Optional[pd.DataFrame]): Timestamps that start a quarantine. Defaults to None, i.e. no quarantine.
+        min_date (datetime): Prediction times must be after this date. Defaults to MIN_DATE.
+        quarantine_days (int): Length of the quarantine. Defaults to QUARANTINE_DAYS.
+        entity_id_col_name (str): Name of the id column in all dataframes. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column in all dataframes. Defaults to "timestamp".
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: The eligible prediction times, in their original order, and an
+            exclusion funnel with the number of prediction times excluded by, and remaining after, each criterion.
+    """
+    timestamps = prediction_times[timestamp_col_name]
+
+    first_indicator = get_first_timestamp_per_patient(
+        prediction_times=prediction_times,
+        events=first_diabetes_indicator,
+        entity_id_col_name=entity_id_col_name,
+        timestamp_col_name=timestamp_col_name,
+    )
+    first_lab_result = get_first_timestamp_per_patient(
+        prediction_times=prediction_times,
+        events=first_diabetes_lab_result,
+        entity_id_col_name=entity_id_col_name,
+        timestamp_col_name=timestamp_col_name,
+    )
+
+    exclusions = {
+        "before_min_date": (timestamps <= min_date).to_numpy(),
+        "prevalent_diabetes": (first_indicator < min_date).to_numpy(),
+        "after_incident_diabetes": (timestamps > first_lab_result).to_numpy(),
+    }
+
+    if quarantine_timestamps is not None:
+        exclusions["within_quarantine"] = is_within_quarantine(
+            prediction_times=prediction_times,
+            quarantine_timestamps=quarantine_timestamps,
+            quarantine_days=quarantine_days,
+            entity_id_col_name=entity_id_col_name,
+            timestamp_col_name=timestamp_col_name,
+        )
+
+    is_eligible = np.ones(len(prediction_times), dtype=bool)
+    funnel = [
+        {
+            "criterion": "all",
+            "n_excluded": 0,
+            "n_remaining": len(prediction_times),
+        },
+    ]
+
+    for criterion, is_excluded in exclusions.items():
+        n_excluded = int((is_eligible & is_excluded).sum())
+        is_eligible &= ~is_excluded
+
+        funnel.append(
+            {
+                "criterion": criterion,
+                "n_excluded": n_excluded,
+                "n_remaining": int(is_eligible.sum()),
+            },
+        )
+        log.info(f"{criterion}: Excluded {n_excluded} prediction times")
+
+    return (
+        prediction_times[is_eligible].reset_index(drop=True),
+        pd.DataFrame(funnel),
+    )
+
+
+def load_eligible_prediction_times(
+    min_date: datetime = MIN_DATE,
+    quarantine_days: int = QUARANTINE_DAYS,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Load physical visits to psychiatry and keep the eligible ones. See
+    `get_eligible_prediction_times`."""
+    from psycop_feature_generation.loaders.raw.load_moves import (
+        load_move_into_rm_for_exclusion,
+    )
+    from psycop_feature_generation.loaders.raw.load_visits import (
+        physical_visits_to_psychiatry,
+    )
+
+    from t2d_feature_generation.outcome_specification.combined import (
+        get_first_diabetes_indicator,
+    )
+    from t2d_feature_generation.outcome_specification.lab_results import (
+        get_first_diabetes_lab_result_above_threshold,
+    )
+
+    return get_eligible_prediction_times(
+        prediction_times=physical_visits_to_psychiatry(
+            timestamps_only=True,
+            timestamp_for_output="start",
+        ),
+        first_diabetes_indicator=get_first_diabetes_indicator(),
+        first_diabetes_lab_result=get_first_diabetes_lab_result_above_threshold(),
+        quarantine_timestamps=load_move_into_rm_for_exclusion(),
+        min_date=min_date,
+        quarantine_days=quarantine_days,
+    )
@@ -0,0 +1,178 @@
+"""Canonical columnar table of the events of all sources of a run.
+
+Each loader returns its own pandas frame, with object patient ids, datetime64
+timestamps and varying extra columns such as value_type or source, and every
+consumer codes the ids, converts the timestamps and sorts the events again. An
+EventTable does that once for all sources: patient ids become int32 codes into
+a patient dictionary, timestamps int64 nanoseconds since epoch, values
+float64, and the source of each event an int16 code into a source dictionary.
+
+Events of all sources are sorted by (patient, time) in one table, and a
+per-patient offset index gives each patient's events as one slice, e.g. the
+first event per patient across sources is the first row of each slice. The
+events of a source keep their (patient, time) order when they are gathered
+from the table, so the planner's windowed aggregations of every source read
+them from the same table.
+
+Values can be stored as float32, the precision of compact dtypes, to halve
+their memory when the features are narrowed to float32 anyway.
+"""
+from collections.abc import Hashable, Mapping
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.dtypes import NAT_INT64, timestamps_to_int64
+
+PATIENT_CODE_DTYPE = np.int32
+SOURCE_CODE_DTYPE = np.int16
+
+
+@dataclass
+class EventTable:
+    """Events of several sources, sorted by (patient code, timestamp).
+
+    Ties on timestamp are in the order of the sources, then of their rows.
+    Events of patient code p are rows offsets[p]:offsets[p + 1].
+    """
+
+    patients: pd.Index
+    sources: list[Hashable]
+    codes: np.ndarray
+    timestamps: np.ndarray
+    values: np.ndarray
+    source_codes: np.ndarray
+    offsets: np.ndarray
+    _source_code_by_source: dict[Hashable, int] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._source_code_by_source = {
+            source: code for code, source in enumerate(self.sources)
+        }
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @classmethod
+    def from_frames(
+        cls,
+        frames: Mapping[Hashable, pd.DataFrame],
+        patients: Optional[pd.Index] = None,
+        value_col_names: Optional[Mapping[Hashable, str]] = None,
+        entity_id_col_name: str = "dw_ek_borger",
+        timestamp_col_name: str = "timestamp",
+        value_dtype: Any = np.float64,
+    ) -> "EventTable":
+        """Build the table from the frames of the sources.
+
+        Rows without a timestamp are dropped, as are rows of patients outside
+        patients, if set.
+
+        Args:
+            frames (Mapping[Hashable, pd.DataFrame]): Events with an id and a timestamp column, by source.
+                The order of the sources breaks ties on timestamp.
+            patients (Optional[pd.Index]): Unique patient ids. A patient's code is its position in patients.
+                Defaults to None, which codes the patients with events in sorted order.
+            value_col_names (Optional[Mapping[Hashable, str]]): Name of the value column, by source. Sources
+                without one, or without the column, get NaN values. Defaults to None, which reads "value".
+            entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+            timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+            value_dtype (Any): Dtype of the values. Defaults to np.float64.
+
+        Raises:
+            ValueError: If there are more sources than source codes can hold.
+        """
+        sources = list(frames)
+        if len(sources) > np.iinfo(SOURCE_CODE_DTYPE).max:
+            raise ValueError(
+                f"{len(sources)} sources do not fit in {np.dtype(SOURCE_CODE_DTYPE)} source codes",
+            )
+
+        values = []
+        for source, df in frames.items():
+            value_col_name = (value_col_names or {}).get(source, "value")
+            if value_col_name in df.columns:
+                values.append(df[value_col_name].to_numpy(dtype=value_dtype))
+            else:
+                values.append(np.full(len(df), np.nan, dtype=value_dtype))
+
+        timestamps = np.concatenate(
+            [
+                timestamps_to_int64(pd.to_datetime(df[timestamp_col_name]))
+                for df in frames.values()
+            ],
+        )
+        has_timestamp = np.flatnonzero(timestamps != NAT_INT64)
+
+        # Patients are coded after dropping rows without a timestamp, so every
+        # coded patient has events
+        ids = np.concatenate(
+            [df[entity_id_col_name].to_numpy() for df in frames.values()],
+        )[has_timestamp]
+        if patients is None:
+            codes, uniques = pd.factorize(ids, sort=True)
+            patients = pd.Index(uniques)
+        else:
+            codes = patients.get_indexer(ids)
+
+        source_codes = np.repeat(
+            np.arange(len(sources), dtype=SOURCE_CODE_DTYPE),
+            [len(df) for df in frames.values()],
+        )[has_timestamp]
+        timestamps = timestamps[has_timestamp]
+
+        keep = np.flatnonzero(codes >= 0)
+        order = keep[np.lexsort((source_codes[keep], timestamps[keep], codes[keep]))]
+        sorted_codes = codes[order].astype(PATIENT_CODE_DTYPE)
+
+        return cls(
+            patients=patients,
+            sources=sources,
+            codes=sorted_codes,
+            timestamps=timestamps[order],
+            values=np.concatenate(values)[has_timestamp][order],
+            source_codes=source_codes[order],
+            offsets=np.concatenate(
+                [[0], np.cumsum(np.bincount(sorted_codes, minlength=len(patients)))],
+            ),
+        )
+
+    @cached_property
+    def _source_positions(self) -> tuple[np.ndarray, np.ndarray]:
+        """Positions of the events of each source, in table order, and the
+        offset of each source's positions."""
+        positions = np.argsort(self.source_codes, kind="stable")
+        source_offsets = np.concatenate(
+            [
+                [0],
+                np.cumsum(
+                    np.bincount(self.source_codes, minlength=len(self.sources)),
+                ),
+            ],
+        )
+
+        return positions, source_offsets
+
+    def get_source_positions(self, source: Hashable) -> np.ndarray:
+        """Get the positions of the events of a source, in table order.
+
+        Raises:
+            KeyError: If the source is not in the table.
+        """
+        code = self._source_code_by_source[source]
+        positions, source_offsets = self._source_positions
+
+        return positions[source_offsets[code] : source_offsets[code + 1]]
+
+    def get_first_positions(self) -> np.ndarray:
+        """Get the position of each patient's first event, across sources.
+
+        Returns:
+            np.ndarray: Position of the first event of each patient code. Patients without events get len(self).
+        """
+        has_events = self.offsets[1:] > self.offsets[:-1]
+
+        return np.where(has_events, self.offsets[:-1], len(self))
@@ -0,0 +1,442 @@
+"""Streaming descriptive statistics for flattened feature sets.
+
+psycop's save_feature_descriptive_stats_from_dir loads a whole split into
+memory before describing it, i.e. thousands of columns x millions of rows. Here,
+each worker describes a batch of columns, reading only those columns, one
+Parquet row group at a time. Every row group is summarised in a ColumnSketch,
+which merges exact counts, sums and extremes with approximate quantile and
+distinct-value sketches. Memory is thus bounded by the row group size x the
+number of columns per task x the number of workers, whatever the size of the
+feature set.
+
+Quantiles have a relative error of at most relative_accuracy (a DDSketch, see
+Masson et al. 2019), and distinct counts are exact below DISTINCT_SKETCH_SIZE
+distinct values and estimated from the k minimum hash values above it.
+"""
+import logging
+import math
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from psycop_feature_generation.data_checks.flattened.feature_describer import (
+    HIST_BINS,
+    UNICODE_HIST,
+)
+from psycop_feature_generation.data_checks.utils import save_df_to_pretty_html_table
+from timeseriesflattener.feature_spec_objects import StaticSpec, TemporalSpec
+
+from t2d_feature_generation.feature_set_reader import get_split_paths
+
+log = logging.getLogger(__name__)
+
+PERCENTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+DISTINCT_SKETCH_SIZE = 1024
+COLUMNS_PER_TASK = 16
+
+# Values closer to zero than this are counted as zero by the quantile sketch
+MIN_QUANTILE_MAGNITUDE = 1e-9
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative error guarantees.
+
+    Values are counted in logarithmically sized buckets, so every value in a
+    bucket is within relative_accuracy of the bucket's representative value.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.positive: dict[int, int] = {}
+        self.negative: dict[int, int] = {}
+        self.n_zero = 0
+
+    @property
+    def n(self) -> int:
+        return sum(self.positive.values()) + sum(self.negative.values()) + self.n_zero
+
+    def _add_to_buckets(self, buckets: dict[int, int], magnitudes: np.ndarray) -> None:
+        indices, counts = np.unique(
+            np.ceil(np.log(magnitudes) / math.log(self.gamma)).astype(np.int64),
+            return_counts=True,
+        )
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            buckets[index] = buckets.get(index, 0) + count
+
+    def update(self, values: np.ndarray) -> None:
+        """Add finite values to the sketch."""
+        is_zero = np.abs(values) < MIN_QUANTILE_MAGNITUDE
+        self.n_zero += int(is_zero.sum())
+        self._add_to_buckets(self.positive, values[~is_zero & (values > 0)])
+        self._add_to_buckets(self.negative, -values[~is_zero & (values < 0)])
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different accuracies")
+
+        for buckets, other_buckets in (
+            (self.positive, other.positive),
+            (self.negative, other.negative),
+        ):
+            for index, count in other_buckets.items():
+                buckets[index] = buckets.get(index, 0) + count
+        self.n_zero += other.n_zero
+
+    def _get_buckets(self) -> tuple[np.ndarray, np.ndarray]:
+        """Representative values of the buckets in ascending order, and their
+        counts."""
+        negative_indices = np.array(sorted(self.negative, reverse=True), dtype=np.int64)
+        positive_indices = np.array(sorted(self.positive), dtype=np.int64)
+
+        values = np.concatenate(
+            [
+                -2 * self.gamma**negative_indices / (self.gamma + 1),
+                [0.0],
+                2 * self.gamma**positive_indices / (self.gamma + 1),
+            ],
+        )
+        counts = np.array(
+            [self.negative[index] for index in negative_indices.tolist()]
+            + [self.n_zero]
+            + [self.positive[index] for index in positive_indices.tolist()],
+            dtype=np.int64,
+        )
+
+        return values, counts
+
+    def quantile(self, q: float) -> float:
+        """Approximate value at rank q * (n - 1), or NaN if the sketch is empty."""
+        values, counts = self._get_buckets()
+        if counts.sum() == 0:
+            return np.nan
+
+        rank = math.floor(q * (counts.sum() - 1))
+        return float(values[np.searchsorted(np.cumsum(counts), rank, side="right")])
+
+    def get_histogram(self, bin_edges: np.ndarray) -> np.ndarray:
+        """Approximate number of values in each bin between consecutive edges."""
+        values, counts = self._get_buckets()
+        n_at_or_below = np.concatenate([[0], np.cumsum(counts)])[
+            np.searchsorted(values, bin_edges, side="right")
+        ]
+        histogram = np.diff(n_at_or_below)
+        # Representative values may be slightly outside the edges, so values
+        # outside are counted in the first or last bin
+        histogram[0] += counts[values <= bin_edges[0]].sum()
+        histogram[-1] += counts[values > bin_edges[-1]].sum()
+
+        return histogram
+
+
+class DistinctSketch:
+    """Mergeable distinct count: exact up to size distinct values, then a k
+    minimum values estimate."""
+
+    def __init__(self, size: int = DISTINCT_SKETCH_SIZE) -> None:
+        self.size = size
+        self.min_hashes = np.array([], dtype=np.uint64)
+
+    def _add_hashes(self, hashes: np.ndarray) -> None:
+        self.min_hashes = np.unique(np.concatenate([self.min_hashes, hashes]))[
+            : self.size
+        ]
+
+    def update(self, values: np.ndarray) -> None:
+        """Add non-null values to the sketch."""
+        # Adding 0.0 turns -0.0 into 0.0, which hashes differently
+        self._add_hashes(pd.util.hash_array(values.astype(np.float64) + 0.0))
+
+    def merge(self, other: "DistinctSketch") -> None:
+        self._add_hashes(other.min_hashes)
+
+    def estimate(self) -> int:
+        if len(self.min_hashes) < self.size:
+            return len(self.min_hashes)
+
+        kth_hash_prop = (int(self.min_hashes[-1]) + 1) / 2**64
+        return round((self.size - 1) / kth_hash_prop)
+
+
+class ColumnSketch:
+    """Mergeable summary of a numeric column."""
+
+    def __init__(
+        self,
+        fallback: Optional[float] = None,
+        relative_accuracy: float = 0.01,
+    ) -> None:
+        """Initialise an empty summary.
+
+        Args:
+            fallback (Optional[float]): Fallback of the column's spec. Values equal to it are counted,
+                or NaNs if it is NaN. Defaults to None, i.e. the column has no fallback.
+            relative_accuracy (float): Relative accuracy of quantiles. Defaults to 0.01.
+        """
+        self.fallback = fallback
+        self.n = 0
+        self.n_nan = 0
+        self.n_fallback = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.quantiles = QuantileSketch(relative_accuracy=relative_accuracy)
+        self.distinct = DistinctSketch()
+
+    def update(self, values: np.ndarray) -> None:
+        """Add a chunk of values, with NaN for missing values."""
+        values = np.asarray(values, dtype=np.float64)
+        is_nan = np.isnan(values)
+        not_nan = values[~is_nan]
+
+        self.n += len(values)
+        self.n_nan += int(is_nan.sum())
+        if self.fallback is not None:
+            self.n_fallback += int(
+                is_nan.sum()
+                if np.isnan(self.fallback)
+                else (not_nan == self.fallback).sum(),
+            )
+
+        if len(not_nan) == 0:
+            return
+
+        self.sum += float(not_nan.sum())
+        self.min = min(self.min, float(not_nan.min()))
+        self.max = max(self.max, float(not_nan.max()))
+        self.quantiles.update(not_nan[np.isfinite(not_nan)])
+        self.distinct.update(not_nan)
+
+    def merge(self, other: "ColumnSketch") -> None:
+        """Add the values summarised by other."""
+        self.n += other.n
+        self.n_nan += other.n_nan
+        self.n_fallback += other.n_fallback
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.quantiles.merge(other.quantiles)
+        self.distinct.merge(other.distinct)
+
+    @property
+    def mean(self) -> float:
+        n_not_nan = self.n - self.n_nan
+        return self.sum / n_not_nan if n_not_nan else np.nan
+
+    def get_unicode_histogram(self, n_bins: int = HIST_BINS) -> str:
+        """Histogram rendered in block unicode, as psycop's create_unicode_hist."""
+        if self.n == self.n_nan:
+            return ""
+
+        bin_edges = np.linspace(self.min, self.max, n_bins + 1)
+        if self.min == self.max:
+            bin_edges = np.linspace(self.min - 0.5, self.max + 0.5, n_bins + 1)
+
+        histogram = self.quantiles.get_histogram(bin_edges)
+        histogram = histogram / histogram.max()
+
+        levels = np.array(list(UNICODE_HIST))
+        return "".join(
+            UNICODE_HIST[levels[np.abs(levels - height).argmin()]]
+            for height in histogram
+        )
+
+
+def _to_float64(column: Union[pa.Array, pa.ChunkedArray]) -> np.ndarray:
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+
+    return column.cast(pa.float64()).to_numpy(zero_copy_only=False)
+
+
+def describe_columns_in_files(
+    paths: Sequence[Path],
+    fallbacks: dict[str, Optional[float]],
+    relative_accuracy: float = 0.01,
+) -> dict[str, ColumnSketch]:
+    """Summarise columns of Parquet files, reading one row group at a time
+    and only the given columns.
+
+    Args:
+        paths (Sequence[Path]): Parquet files to read.
+        fallbacks (dict[str, Optional[float]]): Fallback of each column to summarise, or None if it has none.
+        relative_accuracy (float): Relative accuracy of quantiles. Defaults to 0.01.
+
+    Returns:
+        dict[str, ColumnSketch]: Summary of each column.
+    """
+    sketches = {
+        col_name: ColumnSketch(fallback=fallback, relative_accuracy=relative_accuracy)
+        for col_name, fallback in fallbacks.items()
+    }
+
+    for path in paths:
+        parquet_file = pq.ParquetFile(path)
+
+        for row_group in range(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(row_group, columns=list(fallbacks))
+
+            for col_name, sketch in sketches.items():
+                sketch.update(_to_float64(table.column(col_name)))
+
+    return sketches
+
+
+def describe_columns(
+    paths: Sequence[Path],
+    fallbacks: dict[str, Optional[float]],
+    max_workers: Optional[int] = None,
+    columns_per_task: int = COLUMNS_PER_TASK,
+    relative_accuracy: float = 0.01,
+) -> dict[str, ColumnSketch]:
+    """Summarise columns of Parquet files, with batches of columns described in
+    parallel worker processes.
+
+    Args:
+        paths (Sequence[Path]): Parquet files to read.
+        fallbacks (dict[str, Optional[float]]): Fallback of each column to summarise, or None if it has none.
+        max_workers (Optional[int]): Maximum number of worker processes. Defaults to None, i.e. the number of CPUs.
+        columns_per_task (int): Number of columns read by each task. Bounds the memory of each worker to this many
+            columns of a row group. Defaults to COLUMNS_PER_TASK.
+        relative_accuracy (float): Relative accuracy of quantiles. Defaults to 0.01.
+
+    Returns:
+        dict[str, ColumnSketch]: Summary of each column, in the order of fallbacks.
+    """
+    col_names = list(fallbacks)
+    batches = [
+        {
+            col_name: fallbacks[col_name]
+            for col_name in col_names[i : i + columns_per_task]
+        }
+        for i in range(0, len(col_names), columns_per_task)
+    ]
+    log.info(
+        f"Describing {len(col_names)} columns of {len(paths)} files in {len(batches)} tasks",
+    )
+
+    sketches: dict[str, ColumnSketch] = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for batch_sketches in executor.map(
+            describe_columns_in_files,
+            [paths] * len(batches),
+            batches,
+            [relative_accuracy] * len(batches),
+        ):
+            sketches.update(batch_sketches)
+
+    return {col_name: sketches[col_name] for col_name in col_names}
+
+
+def _get_fallback(spec: Union[TemporalSpec, StaticSpec]) -> Optional[float]:
+    if isinstance(spec, TemporalSpec):
+        return float(spec.fallback)
+
+    return None
+
+
+def generate_feature_description_row(
+    sketch: ColumnSketch,
+    spec: Union[TemporalSpec, StaticSpec],
+) -> dict[str, Any]:
+    """Generate a row with feature description, with the columns of psycop's
+    generate_feature_description_row."""
+    is_temporal = isinstance(spec, TemporalSpec)
+
+    row = {
+        "Predictor df": spec.feature_name,
+        "Lookbehind days": spec.interval_days if is_temporal else "N/A",
+        "Resolve multiple": spec.resolve_multiple_fn.__name__ if is_temporal else "N/A",
+        "N unique": sketch.distinct.estimate(),
+        "Fallback strategy": str(spec.fallback) if is_temporal else "N/A",
+        "Proportion missing": sketch.n_nan / sketch.n if sketch.n else np.nan,
+        "Mean": round(sketch.mean, 2),
+        "Histogram": sketch.get_unicode_histogram(),
+        "Proportion using fallback": round(sketch.n_fallback / sketch.n, 2)
+        if is_temporal and sketch.n
+        else "N/A",
+    }
+
+    if is_temporal:
+        for percentile in PERCENTILES:
+            row[f"{percentile * 100}-percentile"] = round(
+                sketch.quantiles.quantile(percentile),
+                1,
+            )
+
+    return row
+
+
+def generate_feature_description_df(
+    paths: Sequence[Path],
+    feature_specs: Sequence[Union[TemporalSpec, StaticSpec]],
+    max_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """Generate a dataframe with feature descriptions of the specs' columns in
+    the Parquet files."""
+    sketches = describe_columns(
+        paths=paths,
+        fallbacks={spec.get_col_str(): _get_fallback(spec) for spec in feature_specs},
+        max_workers=max_workers,
+    )
+
+    return pd.DataFrame(
+        [
+            generate_feature_description_row(
+                sketch=sketches[spec.get_col_str()],
+                spec=spec,
+            )
+            for spec in feature_specs
+        ],
+    ).sort_values(by="Predictor df")
+
+
+def save_feature_descriptive_stats_from_dir(
+    feature_set_dir: Path,
+    feature_specs: Sequence[Union[TemporalSpec, StaticSpec]],
+    splits: Sequence[str] = ("train",),
+    out_dir: Optional[Path] = None,
+    max_workers: Optional[int] = None,
+) -> None:
+    """Write a html table and csv with descriptive stats for features in the
+    directory, streaming the Parquet files of each split.
+
+    Args:
+        feature_set_dir (Path): Directory with the feature set's Parquet files.
+        feature_specs (Sequence[Union[TemporalSpec, StaticSpec]]): Specs of the columns to describe.
+        splits (Sequence[str]): Splits to describe. Defaults to ("train",).
+        out_dir (Optional[Path]): Directory to write the descriptions to. Defaults to None, i.e.
+            feature_set_dir / "feature_set_descriptive_stats".
+        max_workers (Optional[int]): Maximum number of worker processes. Defaults to None, i.e. the number of CPUs.
+    """
+    if out_dir is None:
+        out_dir = feature_set_dir / "feature_set_descriptive_stats"
+
+    out_dir.mkdir(exist_ok=True, parents=True)
+
+    for split in splits:
+        paths = get_split_paths(feature_set_dir=feature_set_dir, split=split)
+        if not paths:
+            raise FileNotFoundError(f"{split}: No Parquet files in {feature_set_dir}")
+
+        log.info(f"{split}: Generating descriptive stats from {len(paths)} files")
+        feature_descriptive_stats = generate_feature_description_df(
+            paths=paths,
+            feature_specs=feature_specs,
+            max_workers=max_workers,
+        )
+
+        feature_descriptive_stats.to_csv(
+            out_dir / f"{split}_feature_descriptive_stats.csv",
+            index=False,
+        )
+        save_df_to_pretty_html_table(
+            df=feature_descriptive_stats,
+            path=out_dir / f"{split}_feature_descriptive_stats.html",
+            title="Feature descriptive stats",
+        )
@@ -0,0 +1,213 @@
+"""Read columns of a feature set directory, across splits.
+
+A feature set has thousands of columns, split over one or more Parquet files
+per split. Reading a few columns with pd.read_parquet of every file, followed by
+a concat, reads and decodes every column. The reader instead scans the files as
+an Arrow dataset, reading only the requested columns, and skips row groups whose
+statistics show that no rows match the filters on ids and timestamps. Batches
+are returned lazily, so memory is bounded by the batch size.
+"""
+import logging
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+log = logging.getLogger(__name__)
+
+SPLITS = ("train", "val", "test")
+BATCH_SIZE = 1_000_000
+
+# Arrow does not prune row groups on is_in, so up to this many ids are pruned
+# on by equality, and more ids by their range
+MAX_IDS_FOR_EQUALITY_PRUNING = 256
+
+
+def get_split_paths(feature_set_dir: Path, split: str) -> list[Path]:
+    """Parquet files of a split, also within partitioned split directories."""
+    return sorted(
+        path
+        for path in Path(feature_set_dir).rglob("*.parquet")
+        if split in path.relative_to(feature_set_dir).as_posix()
+    )
+
+
+class FeatureSetReader:
+    """Column-projected, predicate-filtered reader of a feature set directory."""
+
+    def __init__(
+        self,
+        feature_set_dir: Path,
+        splits: Sequence[str] = SPLITS,
+        entity_id_col_name: str = "dw_ek_borger",
+        timestamp_col_name: str = "timestamp",
+    ) -> None:
+        """Initialise the reader. Only file metadata is read.
+
+        Args:
+            feature_set_dir (Path): Directory with the feature set's Parquet files.
+            splits (Sequence[str]): Splits to read, as one dataset. Defaults to SPLITS.
+            entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+            timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+
+        Raises:
+            FileNotFoundError: If a split has no Parquet files.
+        """
+        self.entity_id_col_name = entity_id_col_name
+        self.timestamp_col_name = timestamp_col_name
+
+        self.paths: list[Path] = []
+        for split in splits:
+            split_paths = get_split_paths(feature_set_dir=feature_set_dir, split=split)
+            if not split_paths:
+                raise FileNotFoundError(
+                    f"{split}: No Parquet files in {feature_set_dir}",
+                )
+            self.paths.extend(split_paths)
+
+        self.dataset = ds.dataset([str(path) for path in self.paths], format="parquet")
+
+    @property
+    def schema(self) -> pa.Schema:
+        return self.dataset.schema
+
+    def get_filter(
+        self,
+        ids: Optional[Sequence[int]] = None,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+        for_row_groups: bool = False,
+    ) -> Optional[pc.Expression]:
+        """Filter on ids, and timestamps within [start, end).
+
+        Args:
+            ids (Optional[Sequence[int]]): Ids to keep. Defaults to None, i.e. all ids.
+            start (Optional[pd.Timestamp]): First timestamp to keep. Defaults to None.
+            end (Optional[pd.Timestamp]): Timestamps from end are dropped. Defaults to None.
+            for_row_groups (bool): Whether to get a filter that Arrow can evaluate on row group statistics,
+                which may keep rows of other ids. Defaults to False.
+
+        Returns:
+            Optional[pc.Expression]: The filter, or None if there is nothing to filter on.
+        """
+        expressions = []
+
+        if ids is not None:
+            id_field = pc.field(self.entity_id_col_name)
+            ids = pa.array(ids, type=self.schema.field(self.entity_id_col_name).type)
+
+            if not for_row_groups:
+                expressions.append(id_field.isin(ids))
+            elif len(ids) == 0:
+                expressions.append(pc.scalar(False))
+            elif len(ids) <= MAX_IDS_FOR_EQUALITY_PRUNING:
+                expression = id_field == ids[0]
+                for id_ in ids[1:]:
+                    expression = expression | (id_field == id_)
+                expressions.append(expression)
+            else:
+                min_max = pc.min_max(ids)
+                expressions.append(
+                    (id_field >= min_max["min"]) & (id_field <= min_max["max"]),
+                )
+
+        timestamp_type = self.schema.field(self.timestamp_col_name).type
+        if start is not None:
+            expressions.append(
+                pc.field(self.timestamp_col_name)
+                >= pa.scalar(pd.Timestamp(start), type=timestamp_type),
+            )
+        if end is not None:
+            expressions.append(
+                pc.field(self.timestamp_col_name)
+                < pa.scalar(pd.Timestamp(end), type=timestamp_type),
+            )
+
+        if not expressions:
+            return None
+
+        expression = expressions[0]
+        for other in expressions[1:]:
+            expression = expression & other
+
+        return expression
+
+    def get_fragments(
+        self,
+        filter: Optional[pc.Expression] = None,  # noqa: A002
+    ) -> list[ds.ParquetFileFragment]:
+        """One fragment per file, restricted to the row groups whose statistics
+        do not rule out rows matching filter. See get_filter(for_row_groups=True).
+
+        Files are scanned as a whole rather than one fragment per row group, as
+        each fragment scan reads the metadata of all the file's columns.
+        """
+        fragments = list(self.dataset.get_fragments())
+        if filter is None:
+            return fragments
+
+        return [
+            subset
+            for subset in (fragment.subset(filter=filter) for fragment in fragments)
+            if subset.num_row_groups
+        ]
+
+    def iter_batches(
+        self,
+        columns: Sequence[str],
+        ids: Optional[Sequence[int]] = None,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+        batch_size: int = BATCH_SIZE,
+    ) -> Iterator[pd.DataFrame]:
+        """Lazily read columns of rows matching the filters, in batches.
+
+        Args:
+            columns (Sequence[str]): Columns to read.
+            ids (Optional[Sequence[int]]): Only read rows of these ids. Defaults to None, i.e. all ids.
+            start (Optional[pd.Timestamp]): Only read rows with timestamps from start. Defaults to None.
+            end (Optional[pd.Timestamp]): Only read rows with timestamps before end. Defaults to None.
+            batch_size (int): Maximum number of rows per batch. Defaults to BATCH_SIZE.
+
+        Yields:
+            pd.DataFrame: Batches of rows, in the order of the splits and files.
+        """
+        filter_expression = self.get_filter(ids=ids, start=start, end=end)
+        fragments = self.get_fragments(
+            filter=self.get_filter(ids=ids, start=start, end=end, for_row_groups=True),
+        )
+        log.debug(
+            f"Scanning {sum(fragment.num_row_groups for fragment in fragments)} row groups of {len(fragments)} files",
+        )
+
+        for fragment in fragments:
+            for batch in fragment.to_batches(
+                columns=list(columns),
+                filter=filter_expression,
+                batch_size=batch_size,
+            ):
+                if batch.num_rows:
+                    yield batch.to_pandas()
+
+    def read(
+        self,
+        columns: Sequence[str],
+        ids: Optional[Sequence[int]] = None,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+    ) -> pd.DataFrame:
+        """Read columns of rows matching the filters into a single dataframe.
+
+        See iter_batches for the arguments.
+        """
+        batches = list(
+            self.iter_batches(columns=columns, ids=ids, start=start, end=end),
+        )
+        if not batches:
+            return self.schema.empty_table().select(list(columns)).to_pandas()
+
+        return pd.concat(batches, ignore_index=True)
@@ -0,0 +1,106 @@
+"""Helpers for the files written by the caches and outputs of this package.
+
+Files are written to a temporary path next to their destination, which then
+replaces it, so a crashed run never leaves a partial file where a reader, or
+a later run, would pick it up.
+"""
+import logging
+import os
+import shutil
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+def _get_tmp_path(path: Path, suffix: str) -> Path:
+    return path.with_name(f"{path.name}.{os.getpid()}.{suffix}")
+
+
+@contextmanager
+def atomic_write(path: Path) -> Iterator[Path]:
+    """Yield a temporary path to write a file to, which replaces path once the
+    block exits. If the block raises, the temporary file is removed instead."""
+    path = Path(path)
+    tmp_path = _get_tmp_path(path, "tmp")
+
+    try:
+        yield tmp_path
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    tmp_path.replace(path)
+
+
+@contextmanager
+def atomic_write_dir(path: Path) -> Iterator[Path]:
+    """Yield a temporary directory to write a directory's files to, which
+    replaces path once the block exits.
+
+    A directory cannot replace another in one rename, so the old directory is
+    renamed aside first, and removed once the new one is in place. Readers see
+    either the old or the new directory, never a partially written one, but
+    find no directory in the instant between the two renames. If the block
+    raises, the temporary directory is removed and path is left as it was.
+    """
+    path = Path(path)
+    tmp_dir = _get_tmp_path(path, "tmp")
+    old_dir = _get_tmp_path(path, "old")
+    # Left over from a crashed run of a process with the same id
+    for stale_dir in (tmp_dir, old_dir):
+        if stale_dir.exists():
+            shutil.rmtree(stale_dir)
+    tmp_dir.mkdir(parents=True)
+
+    try:
+        yield tmp_dir
+    except BaseException:
+        shutil.rmtree(tmp_dir)
+        raise
+
+    if path.exists():
+        path.replace(old_dir)
+    try:
+        tmp_dir.replace(path)
+    except BaseException:
+        if old_dir.exists():
+            old_dir.replace(path)
+        raise
+
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+
+
+def evict_least_recently_used(paths: Iterable[Path], max_size_bytes: int) -> int:
+    """Remove the least recently used files, by modification time, until the
+    total size of paths is within max_size_bytes.
+
+    Files that cannot be removed because they are open, e.g. memory-mapped on
+    Windows, are kept and count towards the size.
+
+    Returns:
+        int: Number of removed files.
+    """
+    entries = sorted(
+        ((path, path.stat()) for path in paths),
+        key=lambda entry: entry[1].st_mtime,
+    )
+    total_size = sum(stat.st_size for _, stat in entries)
+
+    n_evicted = 0
+    for path, stat in entries:
+        if total_size <= max_size_bytes:
+            break
+
+        try:
+            path.unlink(missing_ok=True)
+        except PermissionError:
+            log.debug(f"{path}: In use, not evicted")
+            continue
+
+        total_size -= stat.st_size
+        n_evicted += 1
+
+    return n_evicted
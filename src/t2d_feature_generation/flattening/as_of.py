@@ -0,0 +1,120 @@
+"""As-of lookups for latest and earliest values.
+
+The planner computes the aggregations of a source from one expansion of the
+prediction times to the events within the largest window, so a latest value
+within 1825 days repeats every event of the last five years for each
+prediction time. Yet the latest value within any window is the latest value
+before the prediction time, if it is recent enough.
+
+Here, one searchsorted per source and direction finds the latest non-null
+event before each prediction time (or the earliest after it, looking ahead),
+and its distance from the prediction time. Every window's column is then that
+value, masked where the distance exceeds the window, without expanding any
+events.
+"""
+from collections.abc import Sequence
+from typing import Any
+
+import numpy as np
+
+from t2d_feature_generation.flattening.events import PatientSortedEvents, WindowIndex
+
+# The aggregation that an as-of lookup answers, by direction
+AS_OF_AGGREGATIONS = {"behind": "latest", "ahead": "earliest"}
+
+
+def is_as_of_spec(spec: Any) -> bool:
+    """Whether the spec's aggregation is the value nearest the prediction time."""
+    return AS_OF_AGGREGATIONS.get(spec.direction) == spec.aggregation
+
+
+def get_nearest_events(
+    events: PatientSortedEvents,
+    codes: np.ndarray,
+    timestamps: np.ndarray,
+    direction: str,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find the nearest non-null event before (behind) or after (ahead) each
+    prediction time.
+
+    Matches the planner's windows: looking behind, events at the prediction
+    time are excluded, and of several events at the same time, the last in
+    input order is the latest. Looking ahead, the first is the earliest.
+
+    Args:
+        events (PatientSortedEvents): Events of a source.
+        codes (np.ndarray): Patient code of each prediction time.
+        timestamps (np.ndarray): int64 timestamp of each prediction time.
+        direction (str): "behind" or "ahead".
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Value of the nearest event, its distance from the prediction
+            time in ns, and whether the prediction time has such an event. Values and distances are undefined
+            without one.
+    """
+    is_not_null = ~np.isnan(events.values)
+    non_null_events = PatientSortedEvents(
+        codes=events.codes[is_not_null],
+        timestamps=events.timestamps[is_not_null],
+        values=events.values[is_not_null],
+    )
+
+    if len(non_null_events) == 0:
+        return (
+            np.full(len(codes), np.nan),
+            np.zeros(len(codes), dtype=np.int64),
+            np.zeros(len(codes), dtype=bool),
+        )
+
+    if direction == "behind":
+        positions = non_null_events.searchsorted(codes, timestamps, side="left") - 1
+    else:
+        positions = non_null_events.searchsorted(codes, timestamps, side="right")
+
+    # Positions outside the events, or of a neighbouring patient, have no event
+    clipped = np.clip(positions, 0, len(non_null_events) - 1)
+    has_event = (positions == clipped) & (non_null_events.codes[clipped] == codes)
+
+    distance = non_null_events.timestamps[clipped] - timestamps
+    if direction == "behind":
+        distance = -distance
+
+    return non_null_events.values[clipped], distance, has_event
+
+
+def flatten_as_of(
+    window_index: WindowIndex,
+    specs: Sequence[Any],
+) -> dict[str, np.ndarray]:
+    """Compute latest (behind) and earliest (ahead) specs of a source, with one
+    lookup per direction.
+
+    Args:
+        window_index (WindowIndex): Events of the specs' source, and the prediction times.
+        specs (Sequence[Any]): WindowSpecs for which is_as_of_spec is true.
+
+    Returns:
+        dict[str, np.ndarray]: float64 column of each spec, NaN without a value in the window.
+    """
+    columns = {}
+
+    for direction in AS_OF_AGGREGATIONS:
+        direction_specs = [spec for spec in specs if spec.direction == direction]
+        if not direction_specs:
+            continue
+
+        values, distance, has_event = get_nearest_events(
+            events=window_index.events,
+            codes=window_index.codes,
+            timestamps=window_index.timestamps,
+            direction=direction,
+        )
+
+        for spec in direction_specs:
+            columns[spec.col_name] = np.where(
+                has_event & (distance <= spec.interval_ns),
+                values,
+                np.nan,
+            )
+
+    return columns
@@ -0,0 +1,181 @@
+"""Per-spec cache of flattened feature columns.
+
+Each column is stored in its own Arrow IPC file, keyed by a hash of its spec and
+fingerprints of the prediction times and of the source's values. When a spec
+changes, e.g. a new lookbehind window or an extra loader, only the columns with
+new keys are computed on the next run.
+
+The cache can be bounded in size, in which case the least recently used
+columns are evicted after each write, as in the loader cache.
+
+Cached columns are memory-mapped, and the dataset is assembled through an Arrow
+table, so cached columns are not copied into the resulting dataframe. Such
+columns are read-only.
+"""
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Mapping, Sequence
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from t2d_feature_generation.file_utils import (
+    atomic_write,
+    evict_least_recently_used,
+)
+
+if TYPE_CHECKING:
+    from t2d_feature_generation.flattening.planner import WindowSpec
+
+log = logging.getLogger(__name__)
+
+Column = Union[np.ndarray, pa.Array]
+
+
+def get_fingerprint(df: pd.DataFrame, col_names: Sequence[str]) -> str:
+    """Fingerprint of the content and row order of the columns of df."""
+    row_hashes = pd.util.hash_pandas_object(df[list(col_names)], index=False)
+    return hashlib.sha256(row_hashes.to_numpy().tobytes()).hexdigest()[:32]
+
+
+def get_array_fingerprint(arrays: Sequence[np.ndarray]) -> str:
+    """Fingerprint of the content, dtype and order of arrays."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(np.ascontiguousarray(array).data)
+
+    return digest.hexdigest()[:32]
+
+
+def get_spec_hash(spec: "WindowSpec") -> str:
+    """Stable hash of all fields of a spec, including its column name."""
+    content = json.dumps(asdict(spec), sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+class ColumnCache:
+    """Arrow IPC files with one flattened feature column each, with
+    size-bounded least-recently-used eviction."""
+
+    def __init__(self, cache_dir: Path, max_size_bytes: Optional[int] = None) -> None:
+        """Initialise the cache.
+
+        Args:
+            cache_dir (Path): Directory to store cached columns in.
+            max_size_bytes (Optional[int]): Maximum total size of the cache. The least
+                recently used columns are evicted when it is exceeded. Defaults to None, i.e. unbounded.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_key(
+        self,
+        spec: "WindowSpec",
+        prediction_times_fingerprint: str,
+        values_fingerprint: str,
+    ) -> str:
+        """Get the cache key for a spec's column."""
+        content = json.dumps(
+            {
+                "spec": get_spec_hash(spec),
+                "prediction_times": prediction_times_fingerprint,
+                "values": values_fingerprint,
+            },
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(content.encode()).hexdigest()[:32]
+
+        return f"{spec.loader_name}-{digest}"
+
+    def _get_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.arrow"
+
+    def _get_entries(self) -> list[Path]:
+        return list(self.cache_dir.glob("*.arrow"))
+
+    def read(self, key: str) -> Optional[pa.Array]:
+        """Memory-map a cached column, or return None on a cache miss."""
+        path = self._get_path(key)
+
+        if not path.exists():
+            return None
+
+        # Mark as recently used for eviction
+        os.utime(path)
+
+        with pa.ipc.open_file(pa.memory_map(str(path))) as reader:
+            return reader.get_batch(0).column(0)
+
+    def write(self, key: str, column: np.ndarray) -> None:
+        """Write a column to the cache, then evict columns if the cache is too big."""
+        path = self._get_path(key)
+        batch = pa.record_batch([pa.array(column)], names=["value"])
+
+        with atomic_write(path) as tmp_path, pa.OSFile(
+            str(tmp_path),
+            "wb",
+        ) as sink, pa.ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+
+        self.evict()
+
+    def clear(self) -> int:
+        """Remove all cached columns.
+
+        Returns:
+            int: Number of removed columns.
+        """
+        paths = self._get_entries()
+
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+        return len(paths)
+
+    def get_size_bytes(self) -> int:
+        """Total size of the cached columns."""
+        return sum(path.stat().st_size for path in self._get_entries())
+
+    def evict(self) -> int:
+        """Evict the least recently used columns until the cache is within
+        max_size_bytes.
+
+        Returns:
+            int: Number of evicted columns.
+        """
+        if self.max_size_bytes is None:
+            return 0
+
+        n_evicted = evict_least_recently_used(
+            self._get_entries(),
+            max_size_bytes=self.max_size_bytes,
+        )
+
+        if n_evicted:
+            log.info(f"Evicted {n_evicted} cached columns")
+
+        return n_evicted
+
+
+def assemble_columns(
+    columns: Mapping[str, Column],
+    index: pd.Index,
+) -> pd.DataFrame:
+    """Assemble columns into a dataframe without copying them.
+
+    Going through an Arrow table with split blocks keeps each column in its own
+    block, instead of consolidating all columns into one 2D array.
+    """
+    table = pa.table(dict(columns))
+    df = table.to_pandas(split_blocks=True)
+    df.index = index
+
+    return df
@@ -0,0 +1,247 @@
+"""Events sorted by patient and time, for windowed lookups."""
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.dtypes import NAT_INT64, timestamps_to_int64
+from t2d_feature_generation.event_table import EventTable
+
+MAX_COMPOSITE_KEY = 2**62
+
+
+@dataclass
+class PatientSortedEvents:
+    """Events sorted by (patient code, timestamp).
+
+    Patient codes index into the unique patients of the prediction times, so
+    events for patients without prediction times are dropped on construction.
+    Ties on timestamp keep the order of the input events.
+    """
+
+    codes: np.ndarray
+    timestamps: np.ndarray
+    values: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @classmethod
+    def from_df(
+        cls,
+        df: pd.DataFrame,
+        patients: pd.Index,
+        value_col_name: str = "value",
+        entity_id_col_name: str = "dw_ek_borger",
+        timestamp_col_name: str = "timestamp",
+    ) -> "PatientSortedEvents":
+        """Sort events by patient and time.
+
+        Args:
+            df (pd.DataFrame): Events with an id, a timestamp and a value column.
+            patients (pd.Index): Unique patient ids. A patient's code is its position in patients.
+            value_col_name (str): Name of the value column. Defaults to "value".
+            entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+            timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+        """
+        codes = patients.get_indexer(df[entity_id_col_name])
+        timestamps = timestamps_to_int64(pd.to_datetime(df[timestamp_col_name]))
+        values = df[value_col_name].to_numpy(dtype=np.float64)
+
+        keep = np.flatnonzero((codes >= 0) & (timestamps != NAT_INT64))
+        order = keep[np.lexsort((timestamps[keep], codes[keep]))]
+
+        return cls(
+            codes=codes[order].astype(np.int64),
+            timestamps=timestamps[order],
+            values=values[order],
+        )
+
+    @classmethod
+    def from_event_table(
+        cls,
+        event_table: EventTable,
+        source: Hashable,
+    ) -> "PatientSortedEvents":
+        """Gather the events of a source from an event table, which are already
+        sorted by patient and time. Codes and values are widened to int64 and
+        float64.
+
+        Raises:
+            KeyError: If the source is not in the table.
+        """
+        positions = event_table.get_source_positions(source)
+
+        return cls(
+            codes=event_table.codes[positions].astype(np.int64),
+            timestamps=event_table.timestamps[positions],
+            values=event_table.values[positions].astype(np.float64),
+        )
+
+    def searchsorted(
+        self,
+        query_codes: np.ndarray,
+        query_timestamps: np.ndarray,
+        side: str = "left",
+    ) -> np.ndarray:
+        """Find the position of each (code, timestamp) query among the events.
+
+        With side="left", this is the position of the patient's first event at or
+        after the query timestamp. With side="right", of the first event after it.
+
+        Args:
+            query_codes (np.ndarray): Patient code of each query.
+            query_timestamps (np.ndarray): int64 timestamp of each query.
+            side (str): "left" or "right", as in np.searchsorted. Defaults to "left".
+
+        Returns:
+            np.ndarray: Positions into the events, aligned with the queries.
+        """
+        if len(self) == 0:
+            return np.zeros(len(query_codes), dtype=np.int64)
+
+        composite = self._get_composite_keys(
+            query_codes=query_codes,
+            query_timestamps=query_timestamps,
+            side=side,
+        )
+
+        if composite is None:
+            return self._searchsorted_by_merging(
+                query_codes=query_codes,
+                query_timestamps=query_timestamps,
+                side=side,
+            )
+
+        event_keys, query_keys = composite
+        return np.searchsorted(event_keys, query_keys, side=side)
+
+    def _get_composite_keys(
+        self,
+        query_codes: np.ndarray,
+        query_timestamps: np.ndarray,
+        side: str,
+    ) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        """Encode (code, timestamp) as a single sortable int64.
+
+        Timestamps are expressed in the largest unit that divides all event
+        timestamps, usually seconds, which leaves room for the patient code in the
+        high bits. Query timestamps are rounded towards the side being searched,
+        and clipped to just outside the event range, so they never cross into a
+        neighbouring patient. Returns None if the keys would overflow.
+        """
+        origin = self.timestamps.min()
+        offsets = self.timestamps - origin
+        unit = max(int(np.gcd.reduce(offsets)), 1)
+        span = int(offsets.max()) // unit + 3
+
+        if (int(self.codes.max()) + 1) * span >= MAX_COMPOSITE_KEY:
+            return None
+
+        query_offsets = query_timestamps - origin
+        if side == "left":
+            query_units = -(-query_offsets // unit)
+        else:
+            query_units = query_offsets // unit
+
+        event_keys = self.codes * span + offsets // unit + 1
+        query_keys = query_codes * span + np.clip(query_units + 1, 0, span - 1)
+
+        return event_keys, query_keys
+
+    def _searchsorted_by_merging(
+        self,
+        query_codes: np.ndarray,
+        query_timestamps: np.ndarray,
+        side: str,
+    ) -> np.ndarray:
+        """Searchsorted by sorting queries and events together. Slower than
+        composite keys, but has no range limits."""
+        n_events = len(self)
+
+        # Queries sort before events on ties for side="left", after for side="right"
+        is_event = np.concatenate(
+            [np.ones(n_events, dtype=bool), np.zeros(len(query_codes), dtype=bool)],
+        )
+        tie_breaker = is_event if side == "left" else ~is_event
+
+        order = np.lexsort(
+            (
+                tie_breaker,
+                np.concatenate([self.timestamps, query_timestamps]),
+                np.concatenate([self.codes, query_codes]),
+            ),
+        )
+        n_events_before = np.cumsum(is_event[order]) - is_event[order]
+
+        positions = np.empty(len(query_codes), dtype=np.int64)
+        is_query = ~is_event[order]
+        positions[order[is_query] - n_events] = n_events_before[is_query]
+
+        return positions
+
+
+class WindowIndex:
+    """Events of a source, the patient codes and int64 timestamps of the
+    prediction times, and the range of events within each window of each
+    prediction time.
+
+    Windows match the planner's: looking behind, prediction time - interval <=
+    event time < prediction time, looking ahead, prediction time < event time
+    <= prediction time + interval. Each window bound is searched once, and
+    shared by all engines computing specs of the source. The bound at the
+    prediction time is shared by all windows of a direction.
+    """
+
+    def __init__(
+        self,
+        events: PatientSortedEvents,
+        codes: np.ndarray,
+        timestamps: np.ndarray,
+    ) -> None:
+        self.events = events
+        self.codes = codes
+        self.timestamps = timestamps
+        self._bounds: dict[tuple[str, int], np.ndarray] = {}
+
+    def _search(self, direction: str, interval_ns: int) -> np.ndarray:
+        """Position of the bound of each prediction time's window that is
+        interval_ns away from it."""
+        key = (direction, interval_ns)
+        if key not in self._bounds:
+            if direction == "behind":
+                self._bounds[key] = self.events.searchsorted(
+                    self.codes,
+                    self.timestamps - interval_ns,
+                    side="left",
+                )
+            else:
+                self._bounds[key] = self.events.searchsorted(
+                    self.codes,
+                    self.timestamps + interval_ns,
+                    side="right",
+                )
+
+        return self._bounds[key]
+
+    def get_bounds(
+        self,
+        direction: str,
+        interval_ns: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get the range of events within a window of each prediction time.
+
+        Args:
+            direction (str): "behind" or "ahead".
+            interval_ns (int): Window length in ns.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Start and end position of each prediction time's events within
+                the window, so they are events[start:end].
+        """
+        if direction == "behind":
+            return self._search(direction, interval_ns), self._search(direction, 0)
+
+        return self._search(direction, 0), self._search(direction, interval_ns)
@@ -0,0 +1,304 @@
+"""Flatten the dataset, computing temporal features with the grouped planner
+and incident outcomes with the incident engine."""
+import logging
+import time
+from collections.abc import Sequence
+from dataclasses import replace
+from typing import Any, Optional
+
+import pandas as pd
+import psutil
+from psycop_feature_generation.application_modules.project_setup import ProjectInfo
+from psycop_feature_generation.loaders.raw.load_demographic import birthdays
+from timeseriesflattener.feature_spec_objects import TemporalSpec, _AnySpec
+from timeseriesflattener.flattened_dataset import TimeseriesFlattener
+
+from t2d_feature_generation.dtypes import (
+    NUMERIC_DTYPE,
+    compact_flattened_df,
+    get_compact_dtype,
+    get_compact_dtype_for_spec,
+)
+from t2d_feature_generation.event_table import EventTable
+from t2d_feature_generation.flattening.column_cache import ColumnCache
+from t2d_feature_generation.flattening.incident_outcomes import (
+    IncidentOutcomeSpec,
+    flatten_incident_outcomes,
+    is_incident_outcome,
+)
+from t2d_feature_generation.flattening.planner import (
+    DEFAULT_ENGINES,
+    SUPPORTED_AGGREGATIONS,
+    WindowSpec,
+    flatten_temporal_specs,
+)
+from t2d_feature_generation.instrumentation import Instrumentation, measure_stage
+from t2d_feature_generation.quarantine import filter_prediction_times
+
+log = logging.getLogger(__name__)
+
+
+def can_plan(spec: _AnySpec) -> bool:
+    """Whether the planner can compute the spec. Static specs, incident outcomes,
+    non-numerical values and custom aggregations are left to timeseriesflattener."""
+    if not isinstance(spec, TemporalSpec) or getattr(spec, "incident", False):
+        return False
+
+    if spec.key_for_resolve_multiple not in SUPPORTED_AGGREGATIONS:
+        return False
+
+    input_col_name = spec.input_col_name_override or "value"
+    return pd.api.types.is_numeric_dtype(spec.values_df[input_col_name])
+
+
+def flatten_with_planner(
+    flattened_df: pd.DataFrame,
+    specs: list[Any],
+    entity_id_col_name: str,
+    timestamp_col_name: str,
+    column_cache: Optional[ColumnCache] = None,
+    compact_dtypes: bool = False,
+    instrumentation: Optional[Instrumentation] = None,
+    engines: Sequence[str] = DEFAULT_ENGINES,
+    max_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """Add the temporal specs to an already flattened dataframe.
+
+    The events of all sources are coded into one EventTable, restricted to the
+    patients of the prediction times, and every source's windowed aggregations
+    read them from it. With compact dtypes, its values are float32 as well.
+    """
+    window_specs = [WindowSpec.from_spec(spec) for spec in specs]
+    if compact_dtypes:
+        window_specs = [
+            replace(
+                window_spec,
+                dtype=get_compact_dtype(window_spec.aggregation, window_spec.fallback),
+            )
+            for window_spec in window_specs
+        ]
+
+    # Specs of the same source share its values
+    values_by_source: dict[tuple, pd.DataFrame] = {}
+    for window_spec, spec in zip(window_specs, specs):
+        values_by_source.setdefault(window_spec.source_key, spec.values_df)
+
+    event_table = None
+    if values_by_source:
+        start_time = time.perf_counter()
+        event_table = EventTable.from_frames(
+            values_by_source,
+            patients=pd.Index(flattened_df[entity_id_col_name].unique()),
+            value_col_names={
+                source_key: source_key[2] for source_key in values_by_source
+            },
+            entity_id_col_name=entity_id_col_name,
+            timestamp_col_name=timestamp_col_name,
+            value_dtype=NUMERIC_DTYPE if compact_dtypes else "float64",
+        )
+        log.info(
+            f"Built an event table of {len(event_table)} events from {len(values_by_source)} sources in {time.perf_counter() - start_time:.2f} seconds",
+        )
+
+    temporal_df = flatten_temporal_specs(
+        prediction_times=flattened_df[[entity_id_col_name, timestamp_col_name]],
+        specs=window_specs,
+        entity_id_col_name=entity_id_col_name,
+        timestamp_col_name=timestamp_col_name,
+        column_cache=column_cache,
+        instrumentation=instrumentation,
+        engines=engines,
+        max_workers=max_workers,
+        event_table=event_table,
+    )
+
+    return pd.concat([flattened_df, temporal_df], axis=1, copy=False)
+
+
+def flatten_with_incident_engine(
+    flattened_df: pd.DataFrame,
+    specs: list[Any],
+    entity_id_col_name: str,
+    timestamp_col_name: str,
+    time_to_event_prefix: Optional[str] = None,
+    compact_dtypes: bool = False,
+) -> pd.DataFrame:
+    """Add the incident outcome specs to an already flattened dataframe,
+    dropping prediction times after the outcome."""
+    incident_specs = [IncidentOutcomeSpec.from_spec(spec) for spec in specs]
+    if compact_dtypes:
+        incident_specs = [
+            replace(incident_spec, dtype=get_compact_dtype_for_spec(spec))
+            for incident_spec, spec in zip(incident_specs, specs)
+        ]
+
+    return flatten_incident_outcomes(
+        prediction_times=flattened_df,
+        specs=incident_specs,
+        values_by_source={
+            incident_spec.source_key: spec.values_df
+            for incident_spec, spec in zip(incident_specs, specs)
+        },
+        entity_id_col_name=entity_id_col_name,
+        timestamp_col_name=timestamp_col_name,
+        time_to_event_prefix=time_to_event_prefix,
+        time_to_event_dtype=NUMERIC_DTYPE if compact_dtypes else "float64",
+    )
+
+
+def create_flattened_dataset(
+    feature_specs: list[_AnySpec],
+    prediction_times_df: pd.DataFrame,
+    project_info: ProjectInfo,
+    quarantine_df: Optional[pd.DataFrame] = None,
+    quarantine_days: Optional[int] = None,
+    column_cache: Optional[ColumnCache] = None,
+    compact_dtypes: bool = False,
+    instrumentation: Optional[Instrumentation] = None,
+    time_to_event_prefix: Optional[str] = None,
+    engines: Sequence[str] = DEFAULT_ENGINES,
+    planner_workers: Optional[int] = None,
+    date_of_birth_df: Optional[pd.DataFrame] = None,
+    n_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """Create flattened dataset.
+
+    Mirrors create_flattened_dataset from psycop_feature_generation, but temporal
+    specs are computed by the grouped planner, once per source, and incident
+    outcomes by the incident engine, with one join per source, instead of one
+    at a time by timeseriesflattener. Prediction times within the quarantine
+    are dropped with a QuarantineIndex instead of a merge with the quarantine
+    timestamps. Prediction times with insufficient look distance are never
+    dropped.
+
+    Args:
+        feature_specs (list[_AnySpec]): List of feature specifications of any type.
+        prediction_times_df (pd.DataFrame): Prediction times dataframe.
+            Should contain entity_id and timestamp columns with col_names matching those in project_info.col_names.
+        project_info (ProjectInfo): Project info.
+        quarantine_df (pd.DataFrame, optional): Quarantine dataframe with "timestamp" and "project_info.col_names.id" columns.
+        quarantine_days (int, optional): Number of days to quarantine. Any prediction time within quarantine_days after the timestamps in quarantine_df will be dropped.
+        column_cache (ColumnCache, optional): Cache of planned columns. If set, only columns of new or changed specs,
+            or of changed prediction times or source values, are computed.
+        compact_dtypes (bool): Whether to resolve each spec with a compact dtype, see t2d_feature_generation.dtypes.
+            Defaults to False, which keeps timeseriesflattener's dtypes.
+        instrumentation (Instrumentation, optional): If set, the specs resolved by timeseriesflattener are measured as
+            one resolve stage, the incident outcomes as one, and the planned specs as one resolve stage per source.
+            Progress is logged as stages finish.
+        time_to_event_prefix (str, optional): If set, a column of days from each prediction time to the event of each
+            incident outcome source is added, with this prefix. See flattening.incident_outcomes.
+        engines (Sequence[str]): Engines the planner computes the specs they support with, e.g. to select the
+            numba engine for a run. See flattening.planner.ENGINES. Defaults to DEFAULT_ENGINES.
+        planner_workers (int, optional): If set, the planner computes its sources in this many worker processes,
+            which share the prediction times and events instead of each holding a copy. The planned specs are then
+            measured as one resolve stage. See flattening.worker_pool.
+        date_of_birth_df (pd.DataFrame, optional): Dates of birth, with id and "date_of_birth" columns, e.g. restricted
+            to a shard's patients. Defaults to None, which loads birthdays().
+        n_workers (int, optional): Number of processes timeseriesflattener resolves its specs in. Set it to 1 when
+            flattening shards in a process pool. Defaults to None, which uses one per spec, up to the number of CPUs.
+
+    Returns:
+        pd.DataFrame: Flattened dataset.
+    """
+    planned_specs = [spec for spec in feature_specs if can_plan(spec)]
+    incident_specs = [spec for spec in feature_specs if is_incident_outcome(spec)]
+    remaining_specs = [
+        spec
+        for spec in feature_specs
+        if not can_plan(spec) and not is_incident_outcome(spec)
+    ]
+
+    log.info(
+        f"Computing {len(planned_specs)} specs with the planner, {len(incident_specs)} with the incident engine, {len(remaining_specs)} with timeseriesflattener",
+    )
+
+    filtered_prediction_times_df = filter_prediction_times(
+        prediction_times_df=prediction_times_df,
+        quarantine_df=quarantine_df,
+        quarantine_days=quarantine_days,
+        entity_id_col_name=project_info.col_names.id,
+        timestamp_col_name=project_info.col_names.timestamp,
+    )
+
+    flattened_dataset = TimeseriesFlattener(
+        prediction_times_df=filtered_prediction_times_df,
+        n_workers=n_workers
+        or max(
+            min(len(remaining_specs), psutil.cpu_count(logical=True)),
+            1,
+        ),
+        cache=None,
+        drop_pred_times_with_insufficient_look_distance=False,
+        predictor_col_name_prefix=project_info.prefix.predictor,
+        outcome_col_name_prefix=project_info.prefix.outcome,
+        timestamp_col_name=project_info.col_names.timestamp,
+        entity_id_col_name=project_info.col_names.id,
+    )
+
+    flattened_dataset.add_age(
+        date_of_birth_df=date_of_birth_df
+        if date_of_birth_df is not None
+        else birthdays(),
+        date_of_birth_col_name="date_of_birth",
+    )
+
+    if instrumentation is not None:
+        instrumentation.start_progress(n_specs=len(feature_specs))
+
+    with measure_stage(
+        instrumentation,
+        stage="resolve",
+        name="timeseriesflattener",
+        spec_names=[spec.get_col_str() for spec in remaining_specs],
+        rows_in=len(filtered_prediction_times_df),
+    ) as record:
+        flattened_dataset.add_spec(spec=remaining_specs)
+        flattened_df = flattened_dataset.get_df()
+        record.rows_out = len(flattened_df)
+
+    if compact_dtypes:
+        dtypes = {
+            spec.get_col_str(): get_compact_dtype_for_spec(spec)
+            for spec in remaining_specs
+        }
+        flattened_df = compact_flattened_df(
+            df=flattened_df,
+            dtypes={
+                col_name: dtype
+                for col_name, dtype in dtypes.items()
+                if dtype is not None
+            },
+            entity_id_col_name=project_info.col_names.id,
+        )
+
+    # Incident outcomes drop prediction times, so they are added before the
+    # planned specs
+    if incident_specs:
+        with measure_stage(
+            instrumentation,
+            stage="resolve",
+            name="incident_outcomes",
+            spec_names=[spec.get_col_str() for spec in incident_specs],
+            rows_in=len(flattened_df),
+        ) as record:
+            flattened_df = flatten_with_incident_engine(
+                flattened_df=flattened_df,
+                specs=incident_specs,
+                entity_id_col_name=project_info.col_names.id,
+                timestamp_col_name=project_info.col_names.timestamp,
+                time_to_event_prefix=time_to_event_prefix,
+                compact_dtypes=compact_dtypes,
+            )
+            record.rows_out = len(flattened_df)
+
+    return flatten_with_planner(
+        flattened_df=flattened_df,
+        specs=planned_specs,
+        entity_id_col_name=project_info.col_names.id,
+        timestamp_col_name=project_info.col_names.timestamp,
+        column_cache=column_cache,
+        compact_dtypes=compact_dtypes,
+        instrumentation=instrumentation,
+        engines=engines,
+        max_workers=planner_workers,
+    )
@@ -0,0 +1,213 @@
+"""Single-join engine for incident outcomes.
+
+An incident outcome has at most one event per patient, e.g. the first diabetes
+lab result. timeseriesflattener resolves each incident OutcomeSpec with its own
+merge of the prediction times with the events, so the 1 to 5 year outcomes of
+the same loader make five merges of the full prediction times.
+
+Here, each prediction time is joined to its patient's event once per loader,
+and the time from prediction time to event gives every horizon column, and a
+continuous time-to-event column, in one vectorized step. Semantics match
+timeseriesflattener's incident outcomes:
+
+- Prediction times after the patient's event are dropped.
+- An outcome is 1 if prediction time <= event time < prediction time + lookahead_days,
+  otherwise 0, also for patients without an event.
+
+The time-to-event column is censored at the largest lookahead of the source,
+like the outcomes, so incremental flattening, which recomputes prediction
+times within the largest lookahead of the previous run, still matches a full
+rebuild.
+"""
+import logging
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.dtypes import NAT_INT64, cast_column, timestamps_to_int64
+
+log = logging.getLogger(__name__)
+
+NS_PER_DAY = pd.Timedelta(days=1).value
+
+
+@dataclass(frozen=True)
+class IncidentOutcomeSpec:
+    """A dichotomous incident outcome: whether the patient's event is within
+    lookahead_days of the prediction time."""
+
+    loader_name: str
+    col_name: str
+    lookahead_days: float
+    loader_kwargs: tuple[tuple[str, Any], ...] = ()
+    dtype: str = "int64"
+
+    @property
+    def source_key(self) -> tuple[str, tuple[tuple[str, Any], ...]]:
+        """Specs with the same source key are computed from the same events."""
+        return (self.loader_name, self.loader_kwargs)
+
+    @property
+    def lookahead_ns(self) -> int:
+        return pd.Timedelta(days=self.lookahead_days).value
+
+    @classmethod
+    def from_spec(cls, spec: Any) -> "IncidentOutcomeSpec":
+        """Create from a timeseriesflattener OutcomeSpec."""
+        return cls(
+            loader_name=spec.feature_name,
+            col_name=spec.get_col_str(),
+            lookahead_days=float(spec.lookahead_days),
+            loader_kwargs=tuple(sorted((spec.loader_kwargs or {}).items())),
+        )
+
+
+def is_incident_outcome(spec: Any) -> bool:
+    """Whether the engine can compute the spec: incident outcomes with
+    dichotomous values. timeseriesflattener adds no column for other incident
+    outcomes, so those are left to it."""
+    return bool(getattr(spec, "incident", False)) and spec.is_dichotomous()
+
+
+def get_time_to_event_col_name(loader_name: str, prefix: str) -> str:
+    return f"{prefix}_days_to_{loader_name}"
+
+
+def get_time_to_event_col_names(specs: Sequence[Any], prefix: str) -> list[str]:
+    """Time-to-event columns added for the incident outcomes among
+    timeseriesflattener specs, in order of first appearance."""
+    return list(
+        dict.fromkeys(
+            get_time_to_event_col_name(spec.feature_name, prefix)
+            for spec in specs
+            if is_incident_outcome(spec)
+        ),
+    )
+
+
+def _get_ns_to_event(
+    prediction_ids: pd.Series,
+    prediction_timestamps: np.ndarray,
+    values_df: pd.DataFrame,
+    loader_name: str,
+    entity_id_col_name: str,
+    timestamp_col_name: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Nanoseconds from each prediction time to its patient's event, and
+    whether the patient has an event."""
+    event_ids = values_df[entity_id_col_name]
+    if event_ids.duplicated().any():
+        raise ValueError(
+            f"{loader_name}: Incident outcomes must have at most one event per patient",
+        )
+
+    event_timestamps = timestamps_to_int64(
+        pd.to_datetime(values_df[timestamp_col_name]),
+    )
+    event_positions = pd.Index(event_ids).get_indexer(prediction_ids)
+
+    prediction_event_timestamps = np.where(
+        event_positions >= 0,
+        event_timestamps[event_positions],
+        NAT_INT64,
+    )
+    has_event = prediction_event_timestamps != NAT_INT64
+
+    return (
+        np.where(has_event, prediction_event_timestamps - prediction_timestamps, 0),
+        has_event,
+    )
+
+
+def flatten_incident_outcomes(
+    prediction_times: pd.DataFrame,
+    specs: Sequence[IncidentOutcomeSpec],
+    values_by_source: dict[tuple, pd.DataFrame],
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+    time_to_event_prefix: Optional[str] = None,
+    time_to_event_dtype: str = "float64",
+) -> pd.DataFrame:
+    """Add incident outcomes, dropping prediction times after the event.
+
+    Args:
+        prediction_times (pd.DataFrame): Prediction times with an id and a timestamp column, and any other columns.
+        specs (Sequence[IncidentOutcomeSpec]): Outcomes to compute.
+        values_by_source (dict[tuple, pd.DataFrame]): Events by the source key of the specs. At most one
+            event per patient.
+        entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+        time_to_event_prefix (Optional[str]): If set, a column of days from prediction time to event is
+            added per source, named by get_time_to_event_col_name. Events are censored at the largest lookahead
+            of the source's specs, i.e. the column is NaN without an event within it. Defaults to None.
+        time_to_event_dtype (str): dtype of the time-to-event columns. Defaults to "float64".
+
+    Returns:
+        pd.DataFrame: The kept rows of prediction_times, with their index, and one column per spec. The
+            time-to-event column of a source follows the source's specs.
+    """
+    start_time = time.time()
+
+    specs_by_source: dict[tuple, list[IncidentOutcomeSpec]] = {}
+    for spec in specs:
+        specs_by_source.setdefault(spec.source_key, []).append(spec)
+
+    prediction_ids = prediction_times[entity_id_col_name]
+    prediction_timestamps = timestamps_to_int64(prediction_times[timestamp_col_name])
+
+    ns_to_event_by_source = {
+        source_key: _get_ns_to_event(
+            prediction_ids=prediction_ids,
+            prediction_timestamps=prediction_timestamps,
+            values_df=values_by_source[source_key],
+            loader_name=source_key[0],
+            entity_id_col_name=entity_id_col_name,
+            timestamp_col_name=timestamp_col_name,
+        )
+        for source_key in specs_by_source
+    }
+
+    is_kept = np.ones(len(prediction_times), dtype=bool)
+    for ns_to_event, has_event in ns_to_event_by_source.values():
+        is_kept &= ~has_event | (ns_to_event >= 0)
+    kept = np.flatnonzero(is_kept)
+
+    columns: dict[str, np.ndarray] = {}
+    for source_key, source_specs in specs_by_source.items():
+        ns_to_event, has_event = (
+            array[kept] for array in ns_to_event_by_source[source_key]
+        )
+
+        for spec in source_specs:
+            columns[spec.col_name] = cast_column(
+                has_event & (ns_to_event < spec.lookahead_ns),
+                spec.dtype,
+                spec.col_name,
+            )
+
+        if time_to_event_prefix is not None:
+            max_lookahead_ns = max(spec.lookahead_ns for spec in source_specs)
+            col_name = get_time_to_event_col_name(source_key[0], time_to_event_prefix)
+            columns[col_name] = np.where(
+                has_event & (ns_to_event < max_lookahead_ns),
+                ns_to_event / NS_PER_DAY,
+                np.nan,
+            ).astype(time_to_event_dtype)
+
+    log.info(
+        f"Computed {len(specs)} incident outcomes from {len(specs_by_source)} sources, dropping {len(prediction_times) - len(kept)} of {len(prediction_times)} prediction times after the event, in {time.time() - start_time:.2f} seconds",
+    )
+
+    kept_prediction_times = prediction_times.iloc[kept]
+    return pd.concat(
+        [
+            kept_prediction_times,
+            pd.DataFrame(columns, index=kept_prediction_times.index),
+        ],
+        axis=1,
+        copy=False,
+    )
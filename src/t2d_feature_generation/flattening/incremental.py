@@ -0,0 +1,234 @@
+"""Incremental flattening of newly added prediction times.
+
+A feature set directory holds the flattened dataset as one Parquet partition
+per prediction-time month, and a high-water mark: the latest prediction time
+that has been flattened. On the next run, only prediction times after the mark
+need new features, with two exceptions that would otherwise make the result
+differ from a full rebuild:
+
+- Outcomes look ahead, so prediction times within the largest lookahead before
+  the mark can see events that arrived since the last run. Those months are
+  recomputed too.
+- Static features are per patient, e.g. the timestamp of the first diabetes
+  indicator, and can change for any prediction time. They are refreshed in the
+  older partitions, which are only rewritten if a value changed.
+
+This assumes source data is append-only, i.e. new events are not backdated to
+before the previous run.
+"""
+import hashlib
+import json
+import logging
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+from t2d_feature_generation.file_utils import atomic_write
+
+log = logging.getLogger(__name__)
+
+HIGH_WATER_MARK_FILENAME = "_high_water_mark.json"
+PARTITION_GLOB = "part-*.parquet"
+
+
+@dataclass(frozen=True)
+class HighWaterMark:
+    """The state of an incrementally flattened feature set."""
+
+    timestamp: str
+    lookahead_days: float
+    feature_fingerprint: str
+
+
+def read_high_water_mark(feature_set_dir: Path) -> Optional[HighWaterMark]:
+    path = feature_set_dir / HIGH_WATER_MARK_FILENAME
+
+    if not path.exists():
+        return None
+
+    return HighWaterMark(**json.loads(path.read_text()))
+
+
+def write_high_water_mark(feature_set_dir: Path, mark: HighWaterMark) -> None:
+    with atomic_write(feature_set_dir / HIGH_WATER_MARK_FILENAME) as tmp_path:
+        tmp_path.write_text(json.dumps(asdict(mark), indent=2))
+
+
+def get_partition_path(feature_set_dir: Path, month: pd.Period) -> Path:
+    return feature_set_dir / f"part-{month}.parquet"
+
+
+def _get_partition_month(path: Path) -> pd.Period:
+    return pd.Period(path.stem.removeprefix("part-"), freq="M")
+
+
+def _write_partition(
+    df: pd.DataFrame,
+    path: Path,
+    sort_by: list[str],
+) -> None:
+    """Write a partition sorted by sort_by, so partitions read in month order
+    give the same row order however they were written."""
+    df = df.sort_values(sort_by, kind="stable").reset_index(drop=True)
+
+    with atomic_write(path) as tmp_path:
+        df.to_parquet(tmp_path, index=False)
+
+
+def load_partitions(feature_set_dir: Path) -> pd.DataFrame:
+    """Load all partitions of an incrementally flattened feature set, in month
+    order."""
+    paths = sorted(
+        Path(feature_set_dir).glob(PARTITION_GLOB),
+        key=_get_partition_month,
+    )
+    return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+
+
+def refresh_static_specs(
+    df: pd.DataFrame,
+    static_specs: Sequence[Any],
+    entity_id_col_name: str = "dw_ek_borger",
+) -> pd.DataFrame:
+    """Recompute the columns of static (per-patient) specs, as
+    timeseriesflattener's StaticSpec resolution does. Patients without a value
+    get NaN."""
+    df = df.copy()
+
+    for spec in static_specs:
+        value_col_name = spec.input_col_name_override
+        if value_col_name is None:
+            (value_col_name,) = (
+                col for col in spec.values_df.columns if col != entity_id_col_name
+            )
+
+        values = spec.values_df.set_index(entity_id_col_name)[value_col_name]
+        col_name = spec.get_col_str()
+        refreshed = df[entity_id_col_name].map(values)
+
+        # Keep the dtype the column was written with, e.g. a compact dtype,
+        # unless it is an integer or boolean dtype that cannot hold the NaN of
+        # patients without a value
+        if col_name in df.columns:
+            dtype = df[col_name].dtype
+            can_hold_nan = not (
+                pd.api.types.is_integer_dtype(dtype)
+                or pd.api.types.is_bool_dtype(dtype)
+            )
+            if can_hold_nan or refreshed.notna().all():
+                refreshed = refreshed.astype(dtype)
+
+        df[col_name] = refreshed
+
+    return df
+
+
+def get_feature_fingerprint(col_names: Sequence[str]) -> str:
+    """Fingerprint of the features in a feature set. If it changes, the feature
+    set is rebuilt."""
+    content = json.dumps(sorted(col_names))
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def flatten_incrementally(
+    prediction_times: pd.DataFrame,
+    feature_set_dir: Path,
+    flatten_fn: Callable[[pd.DataFrame], pd.DataFrame],
+    lookahead_days: float,
+    feature_fingerprint: str,
+    refresh_fn: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+) -> list[Path]:
+    """Flatten prediction times past the feature set's high-water mark, and
+    write them as new partitions.
+
+    Args:
+        prediction_times (pd.DataFrame): All prediction times, including those already flattened.
+        feature_set_dir (Path): Directory of the feature set. Stays the same across runs.
+        flatten_fn (Callable[[pd.DataFrame], pd.DataFrame]): Flattens a set of prediction times.
+            The features of a prediction time must not depend on the other prediction times.
+        lookahead_days (float): The largest lookahead of the outcome specs.
+        feature_fingerprint (str): Fingerprint of the feature specs, e.g. from `get_feature_fingerprint`.
+            If it or lookahead_days differ from the previous run, the feature set is rebuilt.
+        refresh_fn (Optional[Callable[[pd.DataFrame], pd.DataFrame]]): Recomputes per-patient columns of a
+            partition that is not recomputed, e.g. with `refresh_static_specs`. Defaults to None.
+        entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+
+    Returns:
+        list[Path]: Paths of the written partitions.
+    """
+    feature_set_dir = Path(feature_set_dir)
+    feature_set_dir.mkdir(parents=True, exist_ok=True)
+    sort_by = [timestamp_col_name, entity_id_col_name]
+
+    previous_mark = read_high_water_mark(feature_set_dir)
+    timestamps = prediction_times[timestamp_col_name]
+
+    if previous_mark is None:
+        recompute_from = None
+    elif (
+        previous_mark.feature_fingerprint != feature_fingerprint
+        or previous_mark.lookahead_days != lookahead_days
+    ):
+        log.warning("Feature specs changed since the last run, rebuilding")
+        recompute_from = None
+    else:
+        recompute_from = (
+            pd.Timestamp(previous_mark.timestamp) - pd.Timedelta(days=lookahead_days)
+        ).to_period("M")
+
+    existing_paths = list(feature_set_dir.glob(PARTITION_GLOB))
+    if recompute_from is None:
+        to_flatten = prediction_times
+        kept_paths = []
+    else:
+        to_flatten = prediction_times[
+            timestamps >= recompute_from.to_timestamp(how="start")
+        ]
+        kept_paths = [
+            path
+            for path in existing_paths
+            if _get_partition_month(path) < recompute_from
+        ]
+
+    log.info(
+        f"Flattening {len(to_flatten)} of {len(prediction_times)} prediction times",
+    )
+    flattened = flatten_fn(to_flatten)
+
+    # Remove recomputed partitions, including months that no longer have rows
+    for path in set(existing_paths) - set(kept_paths):
+        path.unlink()
+
+    written_paths = []
+    months = flattened[timestamp_col_name].dt.to_period("M")
+    for month, partition in flattened.groupby(months, sort=True):
+        path = get_partition_path(feature_set_dir, month)
+        _write_partition(df=partition, path=path, sort_by=sort_by)
+        written_paths.append(path)
+
+    if refresh_fn is not None:
+        for path in kept_paths:
+            partition = pd.read_parquet(path)
+            refreshed = refresh_fn(partition)
+
+            if not refreshed.equals(partition):
+                _write_partition(df=refreshed, path=path, sort_by=sort_by)
+                written_paths.append(path)
+
+    write_high_water_mark(
+        feature_set_dir,
+        HighWaterMark(
+            timestamp=timestamps.max().isoformat(),
+            lookahead_days=lookahead_days,
+            feature_fingerprint=feature_fingerprint,
+        ),
+    )
+    log.info(f"Wrote {len(written_paths)} partitions to {feature_set_dir}")
+
+    return written_paths
@@ -0,0 +1,264 @@
+"""Numba kernels for windowed aggregations.
+
+The other engines compute each window with a few vectorized numpy passes over
+all prediction times, each allocating arrays of the prediction times' length.
+Here, one compiled kernel per aggregation family loops over the prediction
+times, and scans each prediction time's events within the largest window once,
+nearest first. As windows are nested, each window's aggregate is the running
+aggregate when the scan passes the window's length, so all windows of a
+prediction time are emitted from that one scan, into preallocated columns.
+
+Numba is an optional dependency. The kernels are compiled on first use, and
+cached on disk, so importing this module does not import numba. Sums are
+accumulated nearest first, so they may differ from the other engines in the
+last few digits.
+"""
+import importlib.util
+from collections.abc import Sequence
+from functools import cache, lru_cache
+from typing import Any, Callable
+
+import numpy as np
+
+from t2d_feature_generation.flattening.events import WindowIndex
+
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+
+NUMBA_AGGREGATIONS = (
+    "latest",
+    "earliest",
+    "max",
+    "min",
+    "mean",
+    "sum",
+    "count",
+    "bool",
+)
+
+
+def is_numba_spec(spec: Any) -> bool:
+    """Whether the kernels support the spec's aggregation."""
+    return spec.aggregation in NUMBA_AGGREGATIONS
+
+
+def _extrema_kernel(
+    event_timestamps: np.ndarray,
+    event_values: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    timestamps: np.ndarray,
+    intervals_ns: np.ndarray,
+    is_behind: bool,
+    is_max: bool,
+    out: np.ndarray,
+) -> None:
+    """Max or min of the non-null values within each window, NaN without one."""
+    n_windows = len(intervals_ns)
+
+    for i in range(len(timestamps)):
+        window = 0
+        extremum = np.nan
+
+        for k in range(ends[i] - starts[i]):
+            j = ends[i] - 1 - k if is_behind else starts[i] + k
+            distance = abs(event_timestamps[j] - timestamps[i])
+            while window < n_windows and distance > intervals_ns[window]:
+                out[window, i] = extremum
+                window += 1
+
+            value = event_values[j]
+            if np.isnan(value):
+                continue
+            if np.isnan(extremum) or (value > extremum if is_max else value < extremum):
+                extremum = value
+
+        while window < n_windows:
+            out[window, i] = extremum
+            window += 1
+
+
+def _moments_kernel(
+    event_timestamps: np.ndarray,
+    event_values: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    timestamps: np.ndarray,
+    intervals_ns: np.ndarray,
+    is_behind: bool,
+    out_n_events: np.ndarray,
+    out_count: np.ndarray,
+    out_sum: np.ndarray,
+) -> None:
+    """Number of events, of non-null values, and the sum of the values within
+    each window."""
+    n_windows = len(intervals_ns)
+
+    for i in range(len(timestamps)):
+        window = 0
+        n_events = 0
+        count = 0
+        summed = 0.0
+
+        for k in range(ends[i] - starts[i]):
+            j = ends[i] - 1 - k if is_behind else starts[i] + k
+            distance = abs(event_timestamps[j] - timestamps[i])
+            while window < n_windows and distance > intervals_ns[window]:
+                out_n_events[window, i] = n_events
+                out_count[window, i] = count
+                out_sum[window, i] = summed
+                window += 1
+
+            n_events += 1
+            value = event_values[j]
+            if not np.isnan(value):
+                count += 1
+                summed += value
+
+        while window < n_windows:
+            out_n_events[window, i] = n_events
+            out_count[window, i] = count
+            out_sum[window, i] = summed
+            window += 1
+
+
+def _picks_kernel(
+    event_timestamps: np.ndarray,
+    event_values: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    timestamps: np.ndarray,
+    intervals_ns: np.ndarray,
+    is_behind: bool,
+    is_nearest: bool,
+    out: np.ndarray,
+) -> None:
+    """Nearest or farthest non-null value within each window, NaN without one.
+
+    Scanning nearest first, the nearest value is the first non-null value seen,
+    and the farthest the last. Of events at the same time, the scan sees the
+    last one first looking behind, and the first one first looking ahead.
+    """
+    n_windows = len(intervals_ns)
+
+    for i in range(len(timestamps)):
+        window = 0
+        pick = np.nan
+
+        for k in range(ends[i] - starts[i]):
+            j = ends[i] - 1 - k if is_behind else starts[i] + k
+            distance = abs(event_timestamps[j] - timestamps[i])
+            while window < n_windows and distance > intervals_ns[window]:
+                out[window, i] = pick
+                window += 1
+
+            value = event_values[j]
+            if np.isnan(value):
+                continue
+            pick = value
+            if is_nearest:
+                break
+
+        while window < n_windows:
+            out[window, i] = pick
+            window += 1
+
+
+@cache
+def get_kernels() -> dict[str, Callable[..., None]]:
+    """Compile the kernels, by aggregation family."""
+    import numba  # pylint: disable=import-outside-toplevel
+
+    jit = numba.njit(cache=True, nogil=True)
+
+    return {
+        "extrema": jit(_extrema_kernel),
+        "moments": jit(_moments_kernel),
+        "picks": jit(_picks_kernel),
+    }
+
+
+def _flatten_direction(
+    window_index: WindowIndex,
+    specs: Sequence[Any],
+    direction: str,
+) -> dict[str, np.ndarray]:
+    """Compute the specs of one direction, with one kernel call per family."""
+    kernels = get_kernels()
+    intervals_ns = np.array(sorted({spec.interval_ns for spec in specs}))
+    window_by_interval = {
+        interval: i for i, interval in enumerate(intervals_ns.tolist())
+    }
+    starts, ends = window_index.get_bounds(direction, int(intervals_ns[-1]))
+
+    shape = (len(intervals_ns), len(starts))
+    kernel_args = (
+        window_index.events.timestamps,
+        window_index.events.values,
+        starts,
+        ends,
+        window_index.timestamps,
+        intervals_ns,
+        direction == "behind",
+    )
+    aggregations = {spec.aggregation for spec in specs}
+
+    outputs: dict[str, np.ndarray] = {}
+    for aggregation in aggregations & {"max", "min"}:
+        outputs[aggregation] = np.empty(shape)
+        kernels["extrema"](*kernel_args, aggregation == "max", outputs[aggregation])
+
+    # The nearest value is the latest looking behind, the earliest looking ahead
+    for aggregation in aggregations & {"latest", "earliest"}:
+        is_nearest = (aggregation == "latest") == (direction == "behind")
+        outputs[aggregation] = np.empty(shape)
+        kernels["picks"](*kernel_args, is_nearest, outputs[aggregation])
+
+    if aggregations & {"count", "sum", "mean", "bool"}:
+        n_events, count, summed = np.empty(shape), np.empty(shape), np.empty(shape)
+        kernels["moments"](*kernel_args, n_events, count, summed)
+
+        has_events = n_events > 0
+        del n_events
+        if "mean" in aggregations:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                outputs["mean"] = np.where(has_events, summed / count, np.nan)
+        if "count" in aggregations:
+            outputs["count"] = np.where(has_events, count, np.nan)
+        if "sum" in aggregations:
+            outputs["sum"] = np.where(has_events, summed, np.nan)
+        if "bool" in aggregations:
+            outputs["bool"] = np.where(has_events, 1.0, np.nan)
+
+    # Copied, as specs that only differ in fallback would share a row
+    return {
+        spec.col_name: outputs[spec.aggregation][
+            window_by_interval[spec.interval_ns]
+        ].copy()
+        for spec in specs
+    }
+
+
+def flatten_numba(
+    window_index: WindowIndex,
+    specs: Sequence[Any],
+) -> dict[str, np.ndarray]:
+    """Compute specs of a source with the numba kernels.
+
+    Matches the planner's expansion: prediction times without events in the
+    window get NaN, and so do those with only null values, except for counts
+    and sums, which are 0.
+
+    Args:
+        window_index (WindowIndex): Events of the specs' source, and the prediction times.
+        specs (Sequence[Any]): WindowSpecs for which is_numba_spec is true.
+
+    Returns:
+        dict[str, np.ndarray]: float64 column of each spec, NaN without a value in the window.
+    """
+    columns = {}
+    for direction in ("behind", "ahead"):
+        direction_specs = [spec for spec in specs if spec.direction == direction]
+        if direction_specs:
+            columns.update(_flatten_direction(window_index, direction_specs, direction))
+
+    return columns
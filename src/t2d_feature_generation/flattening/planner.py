@@ -0,0 +1,697 @@
+"""Grouped execution of temporal feature specs.
+
+timeseriesflattener resolves every temporal spec on its own: for each of the
+~1,000 specs, the prediction times are merged with the spec's values and the
+merge is filtered and grouped. Most of those specs only differ in their window
+and aggregation, e.g. hba1c within 30, 180, ..., 1825 days by max, min, mean
+and latest.
+
+The planner groups specs by their source (values_loader, loader_kwargs and
+input column), loads and sorts each source once, and expands prediction times to
+the events within the largest window of the group once. All window x aggregation
+columns of the group are then emitted from that single expansion, by masking on
+the distance between prediction time and event. Loader I/O and sorting thus
+scale with the number of distinct loaders, not with the number of specs. Given
+an EventTable, sources are gathered from it instead, so all sources are coded
+and sorted once per run.
+
+Specs that a specialized engine can compute without the expansion are left to
+it, see ENGINES. Sources whose specs are all claimed by engines are never
+expanded.
+"""
+import logging
+import time
+from collections.abc import Iterable, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.dtypes import cast_column, timestamps_to_int64
+from t2d_feature_generation.event_table import EventTable
+from t2d_feature_generation.flattening.as_of import flatten_as_of, is_as_of_spec
+from t2d_feature_generation.flattening.column_cache import (
+    Column,
+    ColumnCache,
+    assemble_columns,
+    get_array_fingerprint,
+    get_fingerprint,
+)
+from t2d_feature_generation.flattening.events import PatientSortedEvents, WindowIndex
+from t2d_feature_generation.flattening.numba_engine import (
+    HAS_NUMBA,
+    flatten_numba,
+    is_numba_spec,
+)
+from t2d_feature_generation.flattening.range_extrema import (
+    flatten_range_extrema,
+    is_range_extremum_spec,
+)
+from t2d_feature_generation.flattening.window_counts import (
+    flatten_window_counts,
+    is_window_count_spec,
+)
+from t2d_feature_generation.flattening.worker_pool import SourcePool
+from t2d_feature_generation.instrumentation import Instrumentation, measure_stage
+
+log = logging.getLogger(__name__)
+
+SUPPORTED_AGGREGATIONS = (
+    "latest",
+    "earliest",
+    "max",
+    "min",
+    "mean",
+    "sum",
+    "count",
+    "bool",
+)
+
+DIRECTIONS = ("behind", "ahead")
+
+# Engines that compute some specs of a source without expanding it:
+# - numba: all aggregations, with one compiled kernel per aggregation family.
+#   Requires numba, and is not used by default. See flattening.numba_engine.
+# - as_of: latest values looking behind and earliest looking ahead, with one
+#   as-of lookup per direction. See flattening.as_of.
+# - window_counts: counts, sums, means and bools, from prefix sums at the
+#   window bounds. See flattening.window_counts.
+# - range_extrema: maxima and minima, from sparse tables of the values. See
+#   flattening.range_extrema.
+ENGINES = ("numba", "as_of", "window_counts", "range_extrema")
+DEFAULT_ENGINES = ("as_of", "window_counts", "range_extrema")
+
+# Whether an engine supports a spec, and the function computing the columns of
+# the supported specs of a source, by engine. Specs go to the first engine in
+# ENGINES that supports them.
+_ENGINE_FUNCTIONS: dict[str, tuple[Callable[[Any], bool], Callable[..., dict]]] = {
+    "numba": (is_numba_spec, flatten_numba),
+    "as_of": (is_as_of_spec, flatten_as_of),
+    "window_counts": (is_window_count_spec, flatten_window_counts),
+    "range_extrema": (is_range_extremum_spec, flatten_range_extrema),
+}
+
+# Bounds memory use of the expansion to about 1.5 GB
+MAX_PAIRS_PER_BATCH = 50_000_000
+
+
+@dataclass(frozen=True)
+class WindowSpec:
+    """A temporal feature: an aggregation of a source's values within a window
+    before or after each prediction time.
+
+    Windows match timeseriesflattener. Looking behind, an event is within the
+    window if prediction time - interval_days <= event time < prediction time.
+    Looking ahead, if prediction time < event time <= prediction time + interval_days.
+    Prediction times without values in the window get the fallback. The column
+    is cast to dtype once it is computed.
+    """
+
+    loader_name: str
+    col_name: str
+    interval_days: float
+    direction: str
+    aggregation: str
+    fallback: Any
+    input_col_name: str = "value"
+    loader_kwargs: tuple[tuple[str, Any], ...] = ()
+    dtype: str = "float64"
+
+    @property
+    def source_key(self) -> tuple[str, tuple[tuple[str, Any], ...], str]:
+        """Specs with the same source key are computed from the same events."""
+        return (self.loader_name, self.loader_kwargs, self.input_col_name)
+
+    @property
+    def interval_ns(self) -> int:
+        return pd.Timedelta(days=self.interval_days).value
+
+    @classmethod
+    def from_spec(cls, spec: Any) -> "WindowSpec":
+        """Create from a timeseriesflattener PredictorSpec or OutcomeSpec."""
+        return cls(
+            loader_name=spec.feature_name,
+            col_name=spec.get_col_str(),
+            interval_days=float(spec.interval_days),
+            direction="ahead" if hasattr(spec, "lookahead_days") else "behind",
+            aggregation=spec.key_for_resolve_multiple,
+            fallback=spec.fallback,
+            input_col_name=spec.input_col_name_override or "value",
+            loader_kwargs=tuple(sorted((spec.loader_kwargs or {}).items())),
+        )
+
+
+def group_specs_by_source(
+    specs: Sequence[WindowSpec],
+) -> dict[tuple, list[WindowSpec]]:
+    """Group specs by source, keeping the order of first appearance."""
+    groups: dict[tuple, list[WindowSpec]] = {}
+
+    for spec in specs:
+        if spec.aggregation not in SUPPORTED_AGGREGATIONS:
+            raise ValueError(
+                f"{spec.col_name}: Aggregation {spec.aggregation} is not supported by the planner. Supported: {SUPPORTED_AGGREGATIONS}",
+            )
+        if spec.direction not in DIRECTIONS:
+            raise ValueError(f"{spec.col_name}: Unknown direction {spec.direction}")
+
+        groups.setdefault(spec.source_key, []).append(spec)
+
+    return groups
+
+
+def _get_batches(lengths: np.ndarray, max_pairs: int) -> list[tuple[int, int]]:
+    """Split prediction times into consecutive batches with at most max_pairs
+    events in total, or a single prediction time if it alone exceeds it."""
+    n_pairs_before = np.concatenate([[0], np.cumsum(lengths)])
+
+    batches = []
+    start = 0
+    while start < len(lengths):
+        end = int(
+            np.searchsorted(
+                n_pairs_before,
+                n_pairs_before[start] + max_pairs,
+                side="right",
+            ),
+        )
+        end = min(max(end - 1, start + 1), len(lengths))
+        batches.append((start, end))
+        start = end
+
+    return batches
+
+
+def _aggregate_window(
+    columns: dict[str, np.ndarray],
+    specs: Sequence[WindowSpec],
+    pair_prediction_time: np.ndarray,
+    pair_values: np.ndarray,
+    pair_is_null: np.ndarray,
+    is_in_window: np.ndarray,
+) -> None:
+    """Aggregate the event pairs within one window, for all specs of the window.
+
+    Pairs are sorted by prediction time, then event time, so each prediction
+    time's events are a contiguous segment and reduceat can aggregate them.
+    """
+    in_window = np.flatnonzero(is_in_window)
+    if len(in_window) == 0:
+        return
+
+    prediction_times = pair_prediction_time[in_window]
+    values = pair_values[in_window]
+    is_null = pair_is_null[in_window]
+
+    segment_starts = np.flatnonzero(
+        np.concatenate([[True], prediction_times[1:] != prediction_times[:-1]]),
+    )
+    segment_prediction_times = prediction_times[segment_starts]
+
+    for spec in specs:
+        if spec.aggregation in ("latest", "earliest"):
+            # Last or first non-null value, as pandas' groupby.last() and first()
+            not_null = np.flatnonzero(~is_null)
+            if len(not_null) == 0:
+                continue
+
+            not_null_prediction_times = prediction_times[not_null]
+            is_boundary = (
+                not_null_prediction_times[1:] != not_null_prediction_times[:-1]
+            )
+
+            if spec.aggregation == "latest":
+                picked = np.flatnonzero(np.concatenate([is_boundary, [True]]))
+            else:
+                picked = np.flatnonzero(np.concatenate([[True], is_boundary]))
+
+            columns[spec.col_name][not_null_prediction_times[picked]] = values[
+                not_null[picked]
+            ]
+            continue
+
+        if spec.aggregation == "max":
+            aggregated = np.fmax.reduceat(values, segment_starts)
+        elif spec.aggregation == "min":
+            aggregated = np.fmin.reduceat(values, segment_starts)
+        elif spec.aggregation == "bool":
+            aggregated = np.ones(len(segment_starts))
+        else:
+            count = np.add.reduceat(~is_null, segment_starts)
+            summed = np.add.reduceat(np.where(is_null, 0.0, values), segment_starts)
+
+            if spec.aggregation == "count":
+                aggregated = count.astype(np.float64)
+            elif spec.aggregation == "sum":
+                aggregated = summed
+            else:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    aggregated = summed / count
+
+        columns[spec.col_name][segment_prediction_times] = aggregated
+
+
+def _flatten_source(
+    events: PatientSortedEvents,
+    codes: np.ndarray,
+    timestamps: np.ndarray,
+    specs: Sequence[WindowSpec],
+    max_pairs_per_batch: int,
+    engines: Sequence[str] = DEFAULT_ENGINES,
+) -> dict[str, np.ndarray]:
+    """Compute all columns of a source, with the engines for the specs they
+    support, and from a single expansion per direction for the rest."""
+    columns = {spec.col_name: np.full(len(codes), np.nan) for spec in specs}
+
+    window_index = WindowIndex(events=events, codes=codes, timestamps=timestamps)
+    expanded_specs = list(specs)
+    for engine in ENGINES:
+        if engine not in engines:
+            continue
+
+        is_supported, flatten_engine_specs = _ENGINE_FUNCTIONS[engine]
+        engine_specs = [spec for spec in expanded_specs if is_supported(spec)]
+        if not engine_specs:
+            continue
+
+        columns.update(
+            flatten_engine_specs(window_index=window_index, specs=engine_specs),
+        )
+        expanded_specs = [spec for spec in expanded_specs if not is_supported(spec)]
+
+    for direction in DIRECTIONS:
+        direction_specs = [
+            spec for spec in expanded_specs if spec.direction == direction
+        ]
+        if not direction_specs:
+            continue
+
+        specs_by_interval: dict[int, list[WindowSpec]] = {}
+        for spec in direction_specs:
+            specs_by_interval.setdefault(spec.interval_ns, []).append(spec)
+
+        starts, ends = window_index.get_bounds(direction, max(specs_by_interval))
+        lengths = ends - starts
+
+        for batch_start, batch_end in _get_batches(lengths, max_pairs_per_batch):
+            batch_lengths = lengths[batch_start:batch_end]
+            n_pairs = int(batch_lengths.sum())
+            if n_pairs == 0:
+                continue
+
+            # One row per (prediction time, event within the largest window)
+            pair_prediction_time = np.repeat(
+                np.arange(batch_start, batch_end),
+                batch_lengths,
+            )
+            first_pair = np.cumsum(batch_lengths) - batch_lengths
+            pair_event = np.arange(n_pairs) + np.repeat(
+                starts[batch_start:batch_end] - first_pair,
+                batch_lengths,
+            )
+
+            distance = events.timestamps[pair_event] - timestamps[pair_prediction_time]
+            if direction == "behind":
+                distance = -distance
+
+            pair_values = events.values[pair_event]
+            pair_is_null = np.isnan(pair_values)
+
+            for interval_ns, interval_specs in specs_by_interval.items():
+                _aggregate_window(
+                    columns=columns,
+                    specs=interval_specs,
+                    pair_prediction_time=pair_prediction_time,
+                    pair_values=pair_values,
+                    pair_is_null=pair_is_null,
+                    is_in_window=distance <= interval_ns,
+                )
+
+    for spec in specs:
+        column = columns[spec.col_name]
+        column[np.isnan(column)] = spec.fallback
+        columns[spec.col_name] = cast_column(column, spec.dtype, spec.col_name)
+
+    return columns
+
+
+def _load_source(
+    source_specs: Sequence[WindowSpec],
+    load_values: Optional[Callable[[WindowSpec], pd.DataFrame]],
+    event_table: Optional[EventTable],
+    patients: pd.Index,
+    entity_id_col_name: str,
+    timestamp_col_name: str,
+    patient_hashes: Optional[np.ndarray],
+) -> tuple[Callable[[], PatientSortedEvents], int, Optional[str]]:
+    """Load the events of a source, from the event table if set, otherwise with
+    load_values.
+
+    Returns:
+        tuple[Callable[[], PatientSortedEvents], int, Optional[str]]: A function sorting the events, only called
+            if columns are computed, the number of rows of the source, and the fingerprint of its values for the
+            column cache, if patient_hashes is set.
+    """
+    spec = source_specs[0]
+
+    if event_table is not None:
+        events = PatientSortedEvents.from_event_table(event_table, spec.source_key)
+        values_fingerprint = None
+        if patient_hashes is not None:
+            # Codes index into the table's patients, so they are fingerprinted
+            # by the ids they stand for
+            values_fingerprint = get_array_fingerprint(
+                [patient_hashes[events.codes], events.timestamps, events.values],
+            )
+
+        return lambda: events, len(events), values_fingerprint
+
+    values_df = load_values(spec)
+    values_fingerprint = None
+    if patient_hashes is not None:
+        values_fingerprint = get_fingerprint(
+            values_df,
+            [entity_id_col_name, timestamp_col_name, spec.input_col_name],
+        )
+
+    def sort_events() -> PatientSortedEvents:
+        return PatientSortedEvents.from_df(
+            df=values_df,
+            patients=patients,
+            value_col_name=spec.input_col_name,
+            entity_id_col_name=entity_id_col_name,
+            timestamp_col_name=timestamp_col_name,
+        )
+
+    return sort_events, len(values_df), values_fingerprint
+
+
+def _read_cached_columns(
+    source_specs: Sequence[WindowSpec],
+    column_cache: Optional[ColumnCache],
+    prediction_times_fingerprint: Optional[str],
+    values_fingerprint: Optional[str],
+) -> tuple[dict[str, Column], list[WindowSpec], dict[str, str]]:
+    """Read the columns of a source's specs from the cache.
+
+    Returns:
+        tuple[dict[str, Column], list[WindowSpec], dict[str, str]]: The cached columns, the specs to
+            compute, and the cache key of each spec's column, which is empty without a cache.
+    """
+    if column_cache is None:
+        return {}, list(source_specs), {}
+
+    keys = {
+        spec.col_name: column_cache.get_key(
+            spec=spec,
+            prediction_times_fingerprint=prediction_times_fingerprint,
+            values_fingerprint=values_fingerprint,
+        )
+        for spec in source_specs
+    }
+
+    columns: dict[str, Column] = {}
+    missing_specs = []
+    for spec in source_specs:
+        cached_column = column_cache.read(keys[spec.col_name])
+
+        if cached_column is None:
+            missing_specs.append(spec)
+        else:
+            columns[spec.col_name] = cached_column
+
+    return columns, missing_specs, keys
+
+
+def _resolve_source(
+    source_specs: Sequence[WindowSpec],
+    sort_events: Callable[[], PatientSortedEvents],
+    values_fingerprint: Optional[str],
+    codes: np.ndarray,
+    timestamps: np.ndarray,
+    max_pairs_per_batch: int,
+    column_cache: Optional[ColumnCache],
+    prediction_times_fingerprint: Optional[str],
+    engines: Sequence[str] = DEFAULT_ENGINES,
+) -> dict[str, Column]:
+    """Read the columns of a source's specs from the cache, and compute the
+    missing ones."""
+    loader_name = source_specs[0].loader_name
+    start_time = time.time()
+
+    columns, missing_specs, keys = _read_cached_columns(
+        source_specs=source_specs,
+        column_cache=column_cache,
+        prediction_times_fingerprint=prediction_times_fingerprint,
+        values_fingerprint=values_fingerprint,
+    )
+
+    if not missing_specs:
+        log.info(f"{loader_name}: Read {len(source_specs)} columns from cache")
+        return columns
+
+    events = sort_events()
+    computed_columns = _flatten_source(
+        events=events,
+        codes=codes,
+        timestamps=timestamps,
+        specs=missing_specs,
+        max_pairs_per_batch=max_pairs_per_batch,
+        engines=engines,
+    )
+    columns.update(computed_columns)
+
+    if column_cache is not None:
+        for col_name, column in computed_columns.items():
+            column_cache.write(keys[col_name], column)
+
+    log.info(
+        f"{loader_name}: Computed {len(missing_specs)} of {len(source_specs)} columns from {len(events)} events in {time.time() - start_time:.2f} seconds",
+    )
+
+    return columns
+
+
+def _resolve_sources_in_pool(
+    groups: dict[tuple, list[WindowSpec]],
+    load_source: Callable[
+        [Sequence[WindowSpec]],
+        tuple[Callable[[], PatientSortedEvents], int, Optional[str]],
+    ],
+    codes: np.ndarray,
+    timestamps: np.ndarray,
+    max_pairs_per_batch: int,
+    column_cache: Optional[ColumnCache],
+    prediction_times_fingerprint: Optional[str],
+    engines: Sequence[str],
+    max_workers: int,
+    shared_dir: Optional[Path],
+) -> dict[str, Column]:
+    """Load and sort each source in this process, and compute its missing
+    columns in a SourcePool, while the next source is loaded."""
+    columns: dict[str, Column] = {}
+    pending: dict[Future, tuple[list[WindowSpec], dict[str, str], int]] = {}
+
+    def collect(futures: Iterable[Future]) -> None:
+        for future in futures:
+            missing_specs, keys, n_events = pending.pop(future)
+            computed_columns, seconds = pool.get_columns(future)
+            columns.update(computed_columns)
+
+            if column_cache is not None:
+                for col_name, column in computed_columns.items():
+                    column_cache.write(keys[col_name], column)
+
+            log.info(
+                f"{missing_specs[0].loader_name}: Computed {len(missing_specs)} columns from {n_events} events in a worker in {seconds:.2f} seconds",
+            )
+
+    with SourcePool(
+        flatten_fn=_flatten_source,
+        codes=codes,
+        timestamps=timestamps,
+        max_workers=max_workers,
+        shared_dir=shared_dir,
+    ) as pool:
+        for (loader_name, _, _), source_specs in groups.items():
+            sort_events, _, values_fingerprint = load_source(source_specs)
+            cached_columns, missing_specs, keys = _read_cached_columns(
+                source_specs=source_specs,
+                column_cache=column_cache,
+                prediction_times_fingerprint=prediction_times_fingerprint,
+                values_fingerprint=values_fingerprint,
+            )
+            columns.update(cached_columns)
+
+            if not missing_specs:
+                log.info(f"{loader_name}: Read {len(source_specs)} columns from cache")
+                continue
+
+            events = sort_events()
+
+            # Publish at most max_workers sources at a time, so the events of
+            # every source are not held in shared memory at once
+            if len(pending) >= pool.max_workers:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
+            future = pool.submit(
+                events=events,
+                specs=missing_specs,
+                max_pairs_per_batch=max_pairs_per_batch,
+                engines=engines,
+            )
+            pending[future] = (missing_specs, keys, len(events))
+
+        collect(wait(pending).done)
+
+    return columns
+
+
+def flatten_temporal_specs(
+    prediction_times: pd.DataFrame,
+    specs: Sequence[WindowSpec],
+    load_values: Optional[Callable[[WindowSpec], pd.DataFrame]] = None,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+    max_pairs_per_batch: int = MAX_PAIRS_PER_BATCH,
+    column_cache: Optional[ColumnCache] = None,
+    instrumentation: Optional[Instrumentation] = None,
+    engines: Sequence[str] = DEFAULT_ENGINES,
+    max_workers: Optional[int] = None,
+    shared_dir: Optional[Path] = None,
+    event_table: Optional[EventTable] = None,
+) -> pd.DataFrame:
+    """Compute temporal features for each prediction time, grouped by source.
+
+    Args:
+        prediction_times (pd.DataFrame): Prediction times with an id and a timestamp column.
+        specs (Sequence[WindowSpec]): Features to compute.
+        load_values (Optional[Callable[[WindowSpec], pd.DataFrame]]): Loads the events of a spec's source.
+            Called once per source. Required unless event_table is set. Defaults to None.
+        entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+        max_pairs_per_batch (int): Maximum number of (prediction time, event) pairs to expand at once.
+            Bounds memory use. Defaults to MAX_PAIRS_PER_BATCH.
+        column_cache (Optional[ColumnCache]): If set, columns are read from the cache, and only
+            missing columns are computed and written to it. Defaults to None.
+        instrumentation (Optional[Instrumentation]): If set, resolving each source is measured as a
+            resolve stage. Defaults to None.
+        engines (Sequence[str]): Engines to compute the specs they support with, instead of the
+            expansion, see ENGINES. The numba engine is skipped if numba is not installed. Defaults to
+            DEFAULT_ENGINES.
+        max_workers (Optional[int]): If set, sources are computed in this many worker processes, which
+            attach to the prediction times and events without copying them, see flattening.worker_pool.
+            Sources are still loaded one at a time in this process, and measured as one resolve stage.
+            Defaults to None, which computes them in this process.
+        shared_dir (Optional[Path]): Directory to publish the arrays of the worker processes in, e.g. /dev/shm.
+            Defaults to None, which uses the system's temporary directory.
+        event_table (Optional[EventTable]): If set, the events of each source are gathered from the table,
+            keyed by the specs' source_key, instead of loaded and sorted one source at a time. Defaults to None.
+
+    Returns:
+        pd.DataFrame: One column per spec, with the spec's dtype, in the order of specs, with the index of
+            prediction_times.
+    """
+    if load_values is None and event_table is None:
+        raise ValueError("Either load_values or event_table must be provided.")
+
+    if event_table is not None:
+        # Patients without events get code -1, which no event has
+        patients = event_table.patients
+        codes = patients.get_indexer(prediction_times[entity_id_col_name])
+    else:
+        codes, uniques = pd.factorize(prediction_times[entity_id_col_name])
+        patients = pd.Index(uniques)
+    codes = codes.astype(np.int64)
+    timestamps = timestamps_to_int64(prediction_times[timestamp_col_name])
+
+    prediction_times_fingerprint = None
+    patient_hashes = None
+    if column_cache is not None:
+        prediction_times_fingerprint = get_fingerprint(
+            prediction_times,
+            [entity_id_col_name, timestamp_col_name],
+        )
+        patient_hashes = pd.util.hash_array(patients.to_numpy())
+
+    unknown_engines = set(engines) - set(ENGINES)
+    if unknown_engines:
+        raise ValueError(f"Unknown engines {unknown_engines}. Supported: {ENGINES}")
+
+    if "numba" in engines and not HAS_NUMBA:
+        log.warning("numba is not installed, so the numba engine is skipped")
+        engines = [engine for engine in engines if engine != "numba"]
+
+    groups = group_specs_by_source(specs)
+    log.info(f"Planned {len(specs)} temporal specs from {len(groups)} sources")
+
+    def load_source(
+        source_specs: Sequence[WindowSpec],
+    ) -> tuple[Callable[[], PatientSortedEvents], int, Optional[str]]:
+        return _load_source(
+            source_specs=source_specs,
+            load_values=load_values,
+            event_table=event_table,
+            patients=patients,
+            entity_id_col_name=entity_id_col_name,
+            timestamp_col_name=timestamp_col_name,
+            patient_hashes=patient_hashes,
+        )
+
+    columns: dict[str, Column] = {}
+    if max_workers is not None:
+        with measure_stage(
+            instrumentation,
+            stage="resolve",
+            name="worker_pool",
+            spec_names=[spec.col_name for spec in specs],
+        ) as record:
+            columns.update(
+                _resolve_sources_in_pool(
+                    groups=groups,
+                    load_source=load_source,
+                    codes=codes,
+                    timestamps=timestamps,
+                    max_pairs_per_batch=max_pairs_per_batch,
+                    column_cache=column_cache,
+                    prediction_times_fingerprint=prediction_times_fingerprint,
+                    engines=engines,
+                    max_workers=max_workers,
+                    shared_dir=shared_dir,
+                ),
+            )
+            record.rows_out = len(prediction_times)
+    else:
+        for (loader_name, _, _), source_specs in groups.items():
+            with measure_stage(
+                instrumentation,
+                stage="resolve",
+                name=loader_name,
+                spec_names=[spec.col_name for spec in source_specs],
+            ) as record:
+                sort_events, n_rows, values_fingerprint = load_source(
+                    source_specs,
+                )
+                record.rows_in = n_rows
+                columns.update(
+                    _resolve_source(
+                        source_specs=source_specs,
+                        sort_events=sort_events,
+                        values_fingerprint=values_fingerprint,
+                        codes=codes,
+                        timestamps=timestamps,
+                        max_pairs_per_batch=max_pairs_per_batch,
+                        column_cache=column_cache,
+                        prediction_times_fingerprint=prediction_times_fingerprint,
+                        engines=engines,
+                    ),
+                )
+                record.rows_out = len(prediction_times)
+
+    return assemble_columns(
+        {spec.col_name: columns[spec.col_name] for spec in specs},
+        index=prediction_times.index,
+    )
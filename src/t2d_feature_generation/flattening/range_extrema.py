@@ -0,0 +1,148 @@
+"""Sparse tables for windowed minima and maxima.
+
+Each lab result source has max and min features within seven windows. The
+expansion pairs each prediction time with every result within the largest
+window, so its work grows with the number of results per window, while the
+prediction times x windows cells are what is needed.
+
+Events are sorted by patient and time, so each window of a prediction time is a
+contiguous range of events. A sparse table holds the extremum of every range of
+2^k events starting at each event, for k up to the longest window's length. Any
+range is covered by the two, possibly overlapping, ranges of 2^k events at its
+start and end, with 2^k the largest power of two within its length. Each cell
+thus takes the window's binary searches and one comparison.
+
+A sparse table holds about log2(longest window) copies of the values, so levels
+are only built as far as the longest window needs.
+"""
+from collections.abc import Sequence
+from typing import Any, Optional
+
+import numpy as np
+
+from t2d_feature_generation.flattening.events import WindowIndex
+
+# Extremum of a range ignoring null values, by aggregation
+RANGE_EXTREMA_UFUNCS = {"max": np.fmax, "min": np.fmin}
+
+
+def is_range_extremum_spec(spec: Any) -> bool:
+    """Whether the spec's aggregation is an extremum of the window's values."""
+    return spec.aggregation in RANGE_EXTREMA_UFUNCS
+
+
+class SparseTable:
+    """Extrema of ranges of values, in constant time per range.
+
+    Level k holds the extremum of values[i:i + 2^k] at position i, for 2^k up to
+    max_length. Null values are ignored, so a range of only null values has a
+    null extremum. Levels are concatenated into one table, followed by a null
+    that empty ranges read, so a batch of ranges is answered with one gather per
+    range end. Tables of the same number of values and max_length share
+    positions.
+    """
+
+    def __init__(self, values: np.ndarray, ufunc: np.ufunc, max_length: int) -> None:
+        levels = [values]
+        while 2 ** len(levels) <= max_length:
+            half = 2 ** (len(levels) - 1)
+            levels.append(ufunc(levels[-1][:-half], levels[-1][half:]))
+
+        self.ufunc = ufunc
+        self.table = np.concatenate([*levels, [np.nan]])
+
+        # Offset of the level of ranges of each length, and the length of the
+        # level's ranges. A range is covered by two entries of that level: the
+        # one starting at the range's start, and the one ending at its end.
+        level_offsets = np.cumsum([0] + [len(level) for level in levels])
+        level_by_length = np.zeros(max_length + 1, dtype=np.int64)
+        level_by_length[1:] = np.floor(np.log2(np.arange(1, max_length + 1)))
+        self._offset_by_length = level_offsets[level_by_length]
+        self._level_length_by_length = 2**level_by_length
+
+    def get_positions(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get the positions in the table of the two ranges covering each range."""
+        lengths = ends - starts
+        offsets = self._offset_by_length[lengths]
+        first = offsets + starts
+        last = offsets + ends - self._level_length_by_length[lengths]
+
+        is_empty = lengths == 0
+        first[is_empty] = len(self.table) - 1
+        last[is_empty] = len(self.table) - 1
+
+        return first, last
+
+    def query(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        positions: Optional[tuple[np.ndarray, np.ndarray]] = None,
+    ) -> np.ndarray:
+        """Get the extremum of values[start:end] for each range.
+
+        Args:
+            starts (np.ndarray): Start position of each range.
+            ends (np.ndarray): End position of each range, exclusive. At most max_length after start.
+            positions (Optional[tuple[np.ndarray, np.ndarray]]): Positions of the ranges from get_positions
+                of a table sharing positions with this one. Defaults to None, i.e. get them.
+
+        Returns:
+            np.ndarray: float64 extremum of each range, NaN for empty ranges.
+        """
+        first, last = positions or self.get_positions(starts, ends)
+        return self.ufunc(self.table[first], self.table[last])
+
+
+def flatten_range_extrema(
+    window_index: WindowIndex,
+    specs: Sequence[Any],
+) -> dict[str, np.ndarray]:
+    """Compute max and min specs of a source from sparse tables.
+
+    Matches the planner's expansion: prediction times without non-null values
+    in the window get NaN.
+
+    Args:
+        window_index (WindowIndex): Events of the specs' source, and the prediction times.
+        specs (Sequence[Any]): WindowSpecs for which is_range_extremum_spec is true.
+
+    Returns:
+        dict[str, np.ndarray]: float64 column of each spec, NaN without a value in the window.
+    """
+    bounds_by_window = {
+        (spec.direction, spec.interval_ns): window_index.get_bounds(
+            spec.direction,
+            spec.interval_ns,
+        )
+        for spec in specs
+    }
+    max_length = max(
+        int((ends - starts).max(initial=0))
+        for starts, ends in bounds_by_window.values()
+    )
+
+    tables = {
+        aggregation: SparseTable(window_index.events.values, ufunc, max_length)
+        for aggregation, ufunc in RANGE_EXTREMA_UFUNCS.items()
+        if any(spec.aggregation == aggregation for spec in specs)
+    }
+
+    # The tables share positions, so the max and min of a window are read from
+    # the same positions
+    positions_by_window = {
+        window: next(iter(tables.values())).get_positions(*bounds)
+        for window, bounds in bounds_by_window.items()
+    }
+
+    return {
+        spec.col_name: tables[spec.aggregation].query(
+            *bounds_by_window[(spec.direction, spec.interval_ns)],
+            positions=positions_by_window[(spec.direction, spec.interval_ns)],
+        )
+        for spec in specs
+    }
@@ -0,0 +1,262 @@
+"""Patient-sharded flattening in a process pool.
+
+Features of a prediction time only depend on events of the same patient, so
+prediction times and events can be hash-partitioned by patient and each shard
+flattened on its own. Each worker only holds its shard's prediction times and
+events, and writes its result to a Parquet file instead of returning it, so
+peak memory per worker is bounded by shard size. At most max_workers shards
+are submitted at a time, which bounds the memory of the parent's pending
+inputs too.
+
+Each shard file keeps the position of its rows in the input prediction times.
+load_shards uses them to restore the row order of flattening all prediction
+times at once. Consumers that do not need that order, e.g. writing splits, can
+read one shard at a time with read_shard instead.
+"""
+import logging
+import os
+import time
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from t2d_feature_generation.file_utils import atomic_write
+
+log = logging.getLogger(__name__)
+
+SHARD_GLOB = "shard-*.parquet"
+ROW_POSITION_COL_NAME = "_row_position"
+
+
+def get_shard_numbers(patient_ids: pd.Series, n_shards: int) -> np.ndarray:
+    """Hash-partition patient ids into n_shards shards. Stable across runs and
+    processes, unlike Python's hash()."""
+    patient_ids = np.asarray(patient_ids)
+
+    # Hashes depend on the dtype, and sources may store ids with different widths
+    if np.issubdtype(patient_ids.dtype, np.integer):
+        patient_ids = patient_ids.astype(np.int64)
+
+    hashes = pd.util.hash_array(patient_ids)
+    return (hashes % np.uint64(n_shards)).astype(np.int64)
+
+
+class _ShardSplitter:
+    """Restricts dataframes, and specs with a values_df, to the patients of a
+    shard. Many specs share their source's values_df, so shard numbers are
+    computed once per dataframe, and specs of the same source share one
+    restricted dataframe, which is then pickled once per shard."""
+
+    def __init__(self, n_shards: int, entity_id_col_name: str) -> None:
+        self.n_shards = n_shards
+        self.entity_id_col_name = entity_id_col_name
+        self._shard_numbers: dict[int, tuple[pd.DataFrame, np.ndarray]] = {}
+        # Only the restricted dataframes of the latest shard are kept
+        self._restricted: dict[tuple[int, int], pd.DataFrame] = {}
+
+    def _get_shard_numbers(self, df: pd.DataFrame) -> np.ndarray:
+        if id(df) not in self._shard_numbers:
+            # Keep a reference to df, so its id is not reused
+            self._shard_numbers[id(df)] = (
+                df,
+                get_shard_numbers(df[self.entity_id_col_name], self.n_shards),
+            )
+
+        return self._shard_numbers[id(df)][1]
+
+    def restrict(self, obj: Any, shard: int) -> Any:
+        if isinstance(obj, pd.DataFrame):
+            if self.entity_id_col_name not in obj.columns:
+                return obj
+
+            key = (id(obj), shard)
+            if key not in self._restricted:
+                if any(cached_shard != shard for _, cached_shard in self._restricted):
+                    self._restricted.clear()
+                self._restricted[key] = obj[
+                    self._get_shard_numbers(obj) == shard
+                ].reset_index(drop=True)
+
+            return self._restricted[key]
+
+        if isinstance(obj, (list, tuple)):
+            return [self.restrict(item, shard) for item in obj]
+
+        values_df = getattr(obj, "values_df", None)
+        if isinstance(values_df, pd.DataFrame):
+            # timeseriesflattener specs are pydantic models
+            return obj.copy(update={"values_df": self.restrict(values_df, shard)})
+
+        return obj
+
+
+def _flatten_shard(
+    flatten_fn: Callable[..., pd.DataFrame],
+    prediction_times: pd.DataFrame,
+    inputs: Mapping[str, Any],
+    path: Path,
+    entity_id_col_name: str,
+    timestamp_col_name: str,
+) -> int:
+    """Flatten a shard and write it to path. Runs in a worker process.
+
+    Returns:
+        int: Number of rows written.
+    """
+    key_col_names = [entity_id_col_name, timestamp_col_name]
+    # timeseriesflattener expects a RangeIndex
+    flattened = flatten_fn(
+        prediction_times_df=prediction_times.drop(
+            columns=ROW_POSITION_COL_NAME,
+        ).reset_index(drop=True),
+        **inputs,
+    )
+
+    # flatten_fn may drop prediction times, but keeps the order of the rest.
+    # Duplicated prediction times are dropped together, so the n-th occurrence
+    # of a prediction time in the output is its n-th occurrence in the input.
+    positions = prediction_times.assign(
+        _occurrence=prediction_times.groupby(key_col_names).cumcount(),
+    ).set_index([*key_col_names, "_occurrence"])[ROW_POSITION_COL_NAME]
+    flattened[ROW_POSITION_COL_NAME] = positions.reindex(
+        pd.MultiIndex.from_arrays(
+            [
+                flattened[entity_id_col_name],
+                flattened[timestamp_col_name],
+                flattened.groupby(key_col_names).cumcount(),
+            ],
+        ),
+    ).to_numpy()
+
+    with atomic_write(path) as tmp_path:
+        flattened.to_parquet(tmp_path, index=False)
+
+    return len(flattened)
+
+
+def flatten_sharded(
+    prediction_times: pd.DataFrame,
+    flatten_fn: Callable[..., pd.DataFrame],
+    output_dir: Path,
+    n_shards: int,
+    sharded_inputs: Optional[Mapping[str, Any]] = None,
+    max_workers: Optional[int] = None,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+) -> list[Path]:
+    """Flatten prediction times in patient shards, in a process pool.
+
+    Args:
+        prediction_times (pd.DataFrame): Prediction times to flatten.
+        flatten_fn (Callable[..., pd.DataFrame]): Flattens a shard. Called with the shard's prediction times as
+            prediction_times_df, and the shard's sharded_inputs as keyword arguments. Must keep the order of
+            the prediction times it does not drop, and be picklable, e.g. a functools.partial of a module-level
+            function.
+        output_dir (Path): Directory to write the shards to. Existing shards are removed.
+        n_shards (int): Number of shards. More shards means less memory per worker.
+        sharded_inputs (Optional[Mapping[str, Any]]): Keyword arguments to flatten_fn that are restricted to each
+            shard's patients: dataframes with an entity id column, specs with a values_df, or lists of those.
+            Other values are passed as is. Defaults to None.
+        max_workers (Optional[int]): Maximum number of worker processes. Defaults to the number of CPUs.
+        entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+
+    Returns:
+        list[Path]: Paths of the written shards. Read them with load_shards.
+    """
+    start_time = time.perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for path in output_dir.glob(SHARD_GLOB):
+        path.unlink()
+
+    max_workers = max_workers or os.cpu_count() or 1
+    splitter = _ShardSplitter(n_shards=n_shards, entity_id_col_name=entity_id_col_name)
+
+    prediction_times = prediction_times.assign(
+        **{ROW_POSITION_COL_NAME: np.arange(len(prediction_times))},
+    )
+    shard_numbers = get_shard_numbers(
+        prediction_times[entity_id_col_name],
+        n_shards,
+    )
+
+    paths = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending: dict[Future, Path] = {}
+
+        for shard in range(n_shards):
+            shard_prediction_times = prediction_times[shard_numbers == shard]
+            if len(shard_prediction_times) == 0:
+                continue
+
+            # Submit at most max_workers shards at a time, so the inputs of
+            # every shard are not pickled and held at once
+            if len(pending) >= max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    paths.append(pending.pop(future))
+                    future.result()
+
+            path = output_dir / f"shard-{shard:05d}.parquet"
+            future = executor.submit(
+                _flatten_shard,
+                flatten_fn=flatten_fn,
+                prediction_times=shard_prediction_times,
+                inputs={
+                    name: splitter.restrict(value, shard)
+                    for name, value in (sharded_inputs or {}).items()
+                },
+                path=path,
+                entity_id_col_name=entity_id_col_name,
+                timestamp_col_name=timestamp_col_name,
+            )
+            pending[future] = path
+
+        for future in wait(pending).done:
+            paths.append(pending.pop(future))
+            future.result()
+
+    log.info(
+        f"Flattened {len(prediction_times)} prediction times in {len(paths)} shards in {time.perf_counter() - start_time:.2f} seconds",
+    )
+
+    return sorted(paths)
+
+
+def read_shard(path: Path) -> pd.DataFrame:
+    """Read a flattened shard, in the row order of its prediction times."""
+    return (
+        pd.read_parquet(path)
+        .sort_values(ROW_POSITION_COL_NAME, kind="stable")
+        .drop(columns=ROW_POSITION_COL_NAME)
+        .reset_index(drop=True)
+    )
+
+
+def count_shard_rows(paths: list[Path]) -> int:
+    """Count the rows of flattened shards from their Parquet metadata."""
+    return sum(pq.read_metadata(path).num_rows for path in paths)
+
+
+def load_shards(shards: Union[Path, list[Path]]) -> pd.DataFrame:
+    """Load flattened shards, in the row order of flattening all prediction
+    times at once.
+
+    Args:
+        shards (Union[Path, list[Path]]): Paths of the shards, or the directory they were written to.
+    """
+    paths = sorted(shards.glob(SHARD_GLOB)) if isinstance(shards, Path) else shards
+
+    df = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+
+    return (
+        df.sort_values(ROW_POSITION_COL_NAME, kind="stable")
+        .drop(columns=ROW_POSITION_COL_NAME)
+        .reset_index(drop=True)
+    )
@@ -0,0 +1,94 @@
+"""Prefix sums for windowed counts, sums and means.
+
+The diagnoses and medications are sources with many events per patient, and
+their features are aggregations over seven windows. The expansion pairs each
+prediction time with every event within the largest window, so its work grows
+with the number of events per patient and window.
+
+Events are sorted by patient and time, so each window of a prediction time is a
+contiguous range of events, found with a searchsorted per window bound. With
+prefix sums of the non-null count and of the values, its count and sum are the
+differences of the prefix sums at the range's bounds, and its mean their ratio.
+Each cell thus takes two binary searches and a subtraction, without expanding
+any events.
+
+Sums are differences of prefix sums over all events of a source, so they may
+differ from summing each window's values in the last few digits.
+"""
+from collections.abc import Sequence
+from typing import Any
+
+import numpy as np
+
+from t2d_feature_generation.flattening.events import PatientSortedEvents, WindowIndex
+
+WINDOW_COUNT_AGGREGATIONS = ("count", "sum", "mean", "bool")
+
+
+def is_window_count_spec(spec: Any) -> bool:
+    """Whether the spec's aggregation is a function of the window's count and
+    sum."""
+    return spec.aggregation in WINDOW_COUNT_AGGREGATIONS
+
+
+def get_prefix_sums(events: PatientSortedEvents) -> tuple[np.ndarray, np.ndarray]:
+    """Get the number of non-null values and their sum before each event.
+
+    Args:
+        events (PatientSortedEvents): Events of a source.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: int64 counts and float64 sums, of length len(events) + 1, so the
+            non-null values of events[start:end] are counts[end] - counts[start] and sum to
+            sums[end] - sums[start].
+    """
+    is_null = np.isnan(events.values)
+
+    counts = np.zeros(len(events) + 1, dtype=np.int64)
+    np.cumsum(~is_null, out=counts[1:])
+
+    sums = np.zeros(len(events) + 1)
+    np.cumsum(np.where(is_null, 0.0, events.values), out=sums[1:])
+
+    return counts, sums
+
+
+def flatten_window_counts(
+    window_index: WindowIndex,
+    specs: Sequence[Any],
+) -> dict[str, np.ndarray]:
+    """Compute count, sum, mean and bool specs of a source from prefix sums.
+
+    Matches the planner's expansion: prediction times without events in the
+    window get NaN, and those with only null values a count and sum of 0.
+
+    Args:
+        window_index (WindowIndex): Events of the specs' source, and the prediction times.
+        specs (Sequence[Any]): WindowSpecs for which is_window_count_spec is true.
+
+    Returns:
+        dict[str, np.ndarray]: float64 column of each spec, NaN without events in the window.
+    """
+    counts, sums = get_prefix_sums(window_index.events)
+
+    columns = {}
+    for spec in specs:
+        starts, ends = window_index.get_bounds(spec.direction, spec.interval_ns)
+
+        if spec.aggregation == "bool":
+            aggregated = np.ones(len(starts))
+        else:
+            count = (counts[ends] - counts[starts]).astype(np.float64)
+            summed = sums[ends] - sums[starts]
+
+            if spec.aggregation == "count":
+                aggregated = count
+            elif spec.aggregation == "sum":
+                aggregated = summed
+            else:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    aggregated = summed / count
+
+        columns[spec.col_name] = np.where(ends > starts, aggregated, np.nan)
+
+    return columns
@@ -0,0 +1,207 @@
+"""Process pool resolving the planner's sources from published arrays.
+
+Submitting a source to a process pool would pickle the prediction times and
+the source's events into the task, so every worker would hold its own copy of
+them, and starting a task would take as long as copying the data. Instead, the
+pool publishes the prediction times once, and each source's sorted events
+once, as Arrow IPC (Feather V2) files, and tasks only carry their paths and
+specs. Workers memory-map the files, and view their buffers as numpy arrays
+without copying, so all workers share the page cache's copy of the data, and
+attaching to it takes the same time for any data size. Workers write the
+columns of their source to an Arrow IPC file too, which the parent reads into
+memory and removes, so no file of the pool is mapped once it closes. Windows
+cannot remove mapped files.
+
+Files are written to a temporary directory, in shared_dir if set. A tmpfs such
+as /dev/shm keeps them in shared memory instead of on disk.
+"""
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Mapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+
+from t2d_feature_generation.file_utils import atomic_write
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+
+
+def publish_arrays(arrays: Mapping[str, np.ndarray], path: Path) -> Path:
+    """Write 1D arrays of equal length to an Arrow IPC file, as one record batch.
+
+    Returns:
+        Path: path, for attach_arrays.
+    """
+    batch = pa.record_batch(
+        [pa.array(array) for array in arrays.values()],
+        names=list(arrays),
+    )
+
+    with atomic_write(path) as tmp_path, pa.OSFile(
+        str(tmp_path),
+        "wb",
+    ) as sink, pa.ipc.new_file(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+
+    return path
+
+
+def attach_arrays(path: Path) -> dict[str, np.ndarray]:
+    """Memory-map arrays written by publish_arrays.
+
+    Returns:
+        dict[str, np.ndarray]: Read-only views of the file's buffers, by name. The file stays mapped
+            while any of them is referenced.
+    """
+    with pa.ipc.open_file(pa.memory_map(str(path))) as reader:
+        batch = reader.get_batch(0)
+
+    return {
+        name: column.to_numpy(zero_copy_only=True)
+        for name, column in zip(batch.schema.names, batch.columns)
+    }
+
+
+def read_arrays(path: Path) -> dict[str, np.ndarray]:
+    """Read arrays written by publish_arrays into memory. Unlike attach_arrays,
+    the file is released once this returns, so it can be removed.
+
+    Returns:
+        dict[str, np.ndarray]: Writable copies of the arrays, by name.
+    """
+    with pa.memory_map(str(path)) as source:
+        batch = pa.ipc.open_file(source).get_batch(0)
+        arrays = {
+            name: column.to_numpy(zero_copy_only=False, writable=True)
+            for name, column in zip(batch.schema.names, batch.columns)
+        }
+        # Buffers of the batch keep the file mapped
+        del batch
+
+    return arrays
+
+
+def _resolve_published_source(
+    flatten_fn: Callable[..., dict[str, np.ndarray]],
+    prediction_times_path: Path,
+    events_path: Path,
+    output_path: Path,
+    flatten_kwargs: Mapping[str, Any],
+) -> float:
+    """Compute the columns of a source from its published events, and publish
+    them to output_path. Runs in a worker process.
+
+    Returns:
+        float: Seconds taken.
+    """
+    start_time = time.perf_counter()
+    prediction_times = attach_arrays(prediction_times_path)
+
+    columns = flatten_fn(
+        events=PatientSortedEvents(**attach_arrays(events_path)),
+        codes=prediction_times["codes"],
+        timestamps=prediction_times["timestamps"],
+        **flatten_kwargs,
+    )
+    publish_arrays(columns, output_path)
+
+    return time.perf_counter() - start_time
+
+
+class SourcePool:
+    """Worker processes computing the columns of sources, from prediction times
+    published once for all of them.
+
+    Use as a context manager, which shuts down the workers and removes the
+    published files on exit. get_columns reads a source's columns into memory,
+    so they stay valid after that.
+    """
+
+    def __init__(
+        self,
+        flatten_fn: Callable[..., dict[str, np.ndarray]],
+        codes: np.ndarray,
+        timestamps: np.ndarray,
+        max_workers: Optional[int] = None,
+        shared_dir: Optional[Union[str, Path]] = None,
+    ) -> None:
+        self.flatten_fn = flatten_fn
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.dir = Path(tempfile.mkdtemp(prefix="source-pool-", dir=shared_dir))
+        self._prediction_times_path = publish_arrays(
+            {"codes": codes, "timestamps": timestamps},
+            self.dir / "prediction_times.arrow",
+        )
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._paths: dict[Future, tuple[Path, Path]] = {}
+        self._n_tasks = 0
+
+    def __enter__(self) -> "SourcePool":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shut down the workers, and remove the published files."""
+        # Workers release the files they attached to when their task returns
+        self._executor.shutdown(cancel_futures=True)
+        shutil.rmtree(self.dir)
+
+    def submit(
+        self,
+        events: PatientSortedEvents,
+        **flatten_kwargs: Any,
+    ) -> Future:
+        """Publish a source's events, and compute its columns in a worker.
+
+        Args:
+            events (PatientSortedEvents): Events of the source, coded by the patients of the prediction times.
+            **flatten_kwargs: Further keyword arguments to flatten_fn, e.g. the specs. Pickled into the task.
+
+        Returns:
+            Future: Pass to get_columns once done.
+        """
+        task = self._n_tasks
+        self._n_tasks += 1
+        events_path = publish_arrays(
+            {
+                "codes": events.codes,
+                "timestamps": events.timestamps,
+                "values": events.values,
+            },
+            self.dir / f"events-{task:05d}.arrow",
+        )
+        output_path = self.dir / f"columns-{task:05d}.arrow"
+
+        future = self._executor.submit(
+            _resolve_published_source,
+            flatten_fn=self.flatten_fn,
+            prediction_times_path=self._prediction_times_path,
+            events_path=events_path,
+            output_path=output_path,
+            flatten_kwargs=flatten_kwargs,
+        )
+        self._paths[future] = (events_path, output_path)
+
+        return future
+
+    def get_columns(self, future: Future) -> tuple[dict[str, np.ndarray], float]:
+        """Wait for a submitted source, and read its columns. Its events and
+        columns are removed, as no other task reads them.
+
+        Returns:
+            tuple[dict[str, np.ndarray], float]: Columns by name, and the seconds the worker took.
+        """
+        seconds = future.result()
+        events_path, output_path = self._paths.pop(future)
+        columns = read_arrays(output_path)
+        events_path.unlink()
+        output_path.unlink()
+
+        return columns, seconds
@@ -0,0 +1,329 @@
+"""Per-loader and per-spec instrumentation of feature generation runs.
+
+A run spends its time in two stages: loading each source from the warehouse,
+and resolving the specs computed from it. Instrumentation records the wall-clock
+time, rows in and out and peak memory delta of each stage, logs progress with
+throughput and an ETA as specs are resolved, and writes a report next to the
+feature set, so slow loaders and specs can be found without profiling a rerun.
+
+Peak memory is the resident set size of the process, sampled in a background
+thread, so it includes allocations outside of numpy and pandas (e.g. by
+database drivers and pyarrow).
+"""
+import contextlib
+import functools
+import json
+import logging
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import pandas as pd
+import psutil
+from timeseriesflattener.utils import data_loaders
+
+log = logging.getLogger(__name__)
+
+REPORT_FILE_NAME = "instrumentation"
+STAGES = ("load", "resolve")
+
+
+@dataclass
+class StageRecord:
+    """Measurements of loading a source, or of resolving specs from it.
+
+    Load stages have no rows in. Resolve stages list the specs they resolve,
+    with rows in being the source's events and rows out the prediction times.
+    """
+
+    stage: str
+    name: str
+    spec_names: tuple[str, ...] = ()
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    seconds: float = 0.0
+    peak_memory_delta_mb: float = 0.0
+
+
+class _PeakMemorySampler:
+    """Samples the resident set size of the process in a daemon thread, and
+    tracks the peak of each active measurement."""
+
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self._process = psutil.Process()
+        self._peaks: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> int:
+        rss = self._process.memory_info().rss
+
+        with self._lock:
+            for token, peak in self._peaks.items():
+                self._peaks[token] = max(peak, rss)
+
+        return rss
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            self._sample()
+
+    def start(self, token: int) -> int:
+        """Start tracking the peak for token. Returns the current resident set size."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run,
+                name="peak-memory-sampler",
+                daemon=True,
+            )
+            self._thread.start()
+
+        rss = self._process.memory_info().rss
+        with self._lock:
+            self._peaks[token] = rss
+
+        return rss
+
+    def stop(self, token: int) -> int:
+        """Stop tracking token. Returns its peak resident set size."""
+        self._sample()
+
+        with self._lock:
+            return self._peaks.pop(token)
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class Instrumentation:
+    """Records load and resolve stages of a run.
+
+    Use as a context manager, which stops the memory sampler on exit.
+    """
+
+    def __init__(self, sample_interval_seconds: float = 0.05) -> None:
+        """Initialise the instrumentation.
+
+        Args:
+            sample_interval_seconds (float): Interval between memory samples. Peaks shorter than
+                this may be missed. Defaults to 0.05.
+        """
+        self.records: list[StageRecord] = []
+        self._sampler = _PeakMemorySampler(interval_seconds=sample_interval_seconds)
+        self._next_token = 0
+        self._n_specs_total: Optional[int] = None
+        self._n_specs_resolved = 0
+        self._progress_start_time = time.perf_counter()
+
+    def __enter__(self) -> "Instrumentation":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the memory sampler."""
+        self._sampler.close()
+
+    def start_progress(self, n_specs: int) -> None:
+        """Start reporting progress towards resolving n_specs specs."""
+        self._n_specs_total = n_specs
+        self._n_specs_resolved = 0
+        self._progress_start_time = time.perf_counter()
+
+    @contextlib.contextmanager
+    def measure(
+        self,
+        stage: str,
+        name: str,
+        spec_names: Sequence[str] = (),
+        rows_in: Optional[int] = None,
+    ) -> Iterator[StageRecord]:
+        """Measure a stage. Set rows_out on the yielded record within the block.
+
+        The record is only kept if the block succeeds.
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage}. Supported: {STAGES}")
+
+        record = StageRecord(
+            stage=stage,
+            name=name,
+            spec_names=tuple(spec_names),
+            rows_in=rows_in,
+        )
+        token = self._next_token
+        self._next_token += 1
+
+        start_rss = self._sampler.start(token)
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start_time
+            peak_rss = self._sampler.stop(token)
+            record.peak_memory_delta_mb = (peak_rss - start_rss) / 1024**2
+
+        self.records.append(record)
+        self._log_record(record)
+
+    def _log_record(self, record: StageRecord) -> None:
+        log.info(
+            f"{record.name}: {record.stage.capitalize()} of {record.rows_out} rows took {record.seconds:.2f} seconds, peak memory +{record.peak_memory_delta_mb:.0f} MB",
+        )
+
+        if record.stage != "resolve" or not record.spec_names:
+            return
+
+        self._n_specs_resolved += len(record.spec_names)
+        elapsed_seconds = time.perf_counter() - self._progress_start_time
+        specs_per_second = self._n_specs_resolved / max(elapsed_seconds, 1e-9)
+
+        progress = f"Resolved {self._n_specs_resolved}"
+        if self._n_specs_total:
+            n_remaining = max(self._n_specs_total - self._n_specs_resolved, 0)
+            eta = pd.Timedelta(seconds=round(n_remaining / specs_per_second))
+            progress += f"/{self._n_specs_total} specs ({self._n_specs_resolved / self._n_specs_total:.0%}), ETA {eta}"
+        else:
+            progress += " specs"
+
+        log.info(f"{progress}, {specs_per_second:.1f} specs/s")
+
+    def wrap_loader(
+        self,
+        loader_name: str,
+        loader_fn: Callable[..., pd.DataFrame],
+    ) -> Callable[..., pd.DataFrame]:
+        """Wrap a loader so each call is measured as a load stage."""
+
+        @functools.wraps(loader_fn)
+        def wrapper(*args: Any, **kwargs: Any) -> pd.DataFrame:
+            with self.measure(stage="load", name=loader_name) as record:
+                df = loader_fn(*args, **kwargs)
+                record.rows_out = len(df)
+
+            return df
+
+        wrapper.instrumentation = self  # type: ignore
+        return wrapper
+
+    def instrument_loaders(self, registry: Any = data_loaders) -> int:
+        """Replace each loader in the registry with a measured wrapper.
+
+        Loaders are resolved from the registry when specs are created, so this
+        must be called before creating them. Loaders registered later are not
+        instrumented.
+
+        Returns:
+            int: Number of instrumented loaders.
+        """
+        n_instrumented = 0
+
+        for loader_name, loader_fn in registry.get_all().items():
+            if getattr(loader_fn, "instrumentation", None) is self:
+                continue
+
+            registry.register(
+                loader_name,
+                func=self.wrap_loader(loader_name, loader_fn),
+            )
+            n_instrumented += 1
+
+        return n_instrumented
+
+    def get_report(self) -> pd.DataFrame:
+        """One row per stage, in the order they finished."""
+        report = pd.DataFrame(
+            [asdict(record) for record in self.records],
+            columns=[record_field.name for record_field in fields(StageRecord)],
+        )
+        report["n_specs"] = report["spec_names"].map(len)
+        return report.drop(columns="spec_names")
+
+    def get_summary(self, n_slowest: int = 10) -> dict[str, Any]:
+        """Totals per stage, and the slowest loaders and resolve stages."""
+        report = self.get_report()
+
+        summary: dict[str, Any] = {}
+        for stage in STAGES:
+            stage_report = report[report["stage"] == stage]
+            summary[stage] = {
+                "n": len(stage_report),
+                "seconds": float(stage_report["seconds"].sum()),
+                "max_peak_memory_delta_mb": float(
+                    stage_report["peak_memory_delta_mb"].max()
+                    if len(stage_report)
+                    else 0.0,
+                ),
+                "slowest": stage_report.nlargest(n_slowest, "seconds")[
+                    ["name", "seconds", "rows_out"]
+                ].to_dict(orient="records"),
+            }
+
+        return summary
+
+    def write_report(self, output_dir: Path) -> tuple[Path, Path]:
+        """Write the stages as CSV, and the stages, specs and summary as JSON.
+
+        Returns:
+            tuple[Path, Path]: Paths of the JSON and CSV reports.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        json_path = output_dir / f"{REPORT_FILE_NAME}.json"
+        csv_path = output_dir / f"{REPORT_FILE_NAME}.csv"
+
+        json_path.write_text(
+            json.dumps(
+                {
+                    "summary": self.get_summary(),
+                    "stages": [asdict(record) for record in self.records],
+                },
+                indent=2,
+                default=str,
+            ),
+        )
+        self.get_report().to_csv(csv_path, index=False)
+
+        return json_path, csv_path
+
+    def log_summary(self, n_slowest: int = 10) -> None:
+        """Log totals per stage and the slowest stages."""
+        for stage, stage_summary in self.get_summary(n_slowest=n_slowest).items():
+            slowest = "\n".join(
+                f"    {row['name']}: {row['seconds']:.2f} seconds, {row['rows_out']} rows"
+                for row in stage_summary["slowest"]
+            )
+            log.info(
+                f"{stage_summary['n']} {stage} stages took {stage_summary['seconds']:.2f} seconds, max peak memory +{stage_summary['max_peak_memory_delta_mb']:.0f} MB. Slowest:\n{slowest}",
+            )
+
+
+def measure_stage(
+    instrumentation: Optional[Instrumentation],
+    stage: str,
+    name: str,
+    spec_names: Sequence[str] = (),
+    rows_in: Optional[int] = None,
+) -> contextlib.AbstractContextManager[StageRecord]:
+    """Measure a stage if instrumentation is set, otherwise yield a record that
+    is discarded."""
+    if instrumentation is None:
+        return contextlib.nullcontext(
+            StageRecord(stage=stage, name=name, spec_names=tuple(spec_names)),
+        )
+
+    return instrumentation.measure(
+        stage=stage,
+        name=name,
+        spec_names=spec_names,
+        rows_in=rows_in,
+    )
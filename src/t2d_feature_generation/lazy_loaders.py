@@ -0,0 +1,184 @@
+"""Lazy registration of data loaders.
+
+Loaders are registered in timeseriesflattener's data_loaders catalogue as a
+side effect of importing the module that defines them. For psycop's raw
+loaders and the outcome loaders in outcome_specification, that imports the
+database drivers and every raw loader, just to validate and resolve loader
+names.
+
+Instead, each loader name is registered with a LazyLoader, which records the
+import path of the loader as "module:attribute" and only imports the module
+when a spec resolves and calls it. Importing the module still runs its
+@data_loaders.register side effects, so the entries of the registry from
+before the import are restored, keeping lazy loaders, and wrappers of them
+such as those of Instrumentation, registered.
+"""
+import importlib
+import logging
+import threading
+from collections.abc import Mapping
+from typing import Any, Callable, Optional
+
+import pandas as pd
+from timeseriesflattener.utils import data_loaders
+
+log = logging.getLogger(__name__)
+
+_RAW = "psycop_feature_generation.loaders.raw"
+
+LOADER_IMPORT_PATHS: dict[str, str] = {
+    # Outcomes
+    "first_diabetes_indicator": "t2d_feature_generation.outcome_specification.combined:get_first_diabetes_indicator",
+    "first_diabetes_lab_result": "t2d_feature_generation.outcome_specification.lab_results:get_first_diabetes_lab_result_above_threshold",
+    # Lab results
+    **{
+        loader_name: f"{_RAW}.load_lab_results:{loader_name}"
+        for loader_name in (
+            "alat",
+            "hdl",
+            "ldl",
+            "triglycerides",
+            "fasting_ldl",
+            "crp",
+            "arterial_p_glc",
+            "hba1c",
+            "scheduled_glc",
+            "unscheduled_p_glc",
+            "ogtt",
+            "fasting_p_glc",
+            "egfr",
+            "albumine_creatinine_ratio",
+        )
+    },
+    "urinary_glc": f"{_RAW}.load_lab_results:urinary_p_glc",
+    # Medications
+    **{
+        loader_name: f"{_RAW}.load_medications:{loader_name}"
+        for loader_name in (
+            "antipsychotics",
+            "clozapine",
+            "top_10_weight_gaining_antipsychotics",
+            "lithium",
+            "valproate",
+            "lamotrigine",
+            "benzodiazepines",
+            "pregabaline",
+            "ssri",
+            "snri",
+            "tca",
+            "selected_nassa",
+            "benzodiazepine_related_sleeping_agents",
+            "gerd_drugs",
+            "statins",
+            "antihypertensives",
+            "diuretics",
+        )
+    },
+    # Diagnoses
+    **{
+        loader_name: f"{_RAW}.load_diagnoses:{loader_name}"
+        for loader_name in (
+            "essential_hypertension",
+            "hyperlipidemia",
+            "polycystic_ovarian_syndrome",
+            "sleep_apnea",
+            "gerd",
+            "f0_disorders",
+            "f1_disorders",
+            "f2_disorders",
+            "f3_disorders",
+            "f4_disorders",
+            "f5_disorders",
+            "f6_disorders",
+            "f7_disorders",
+            "f8_disorders",
+            "hyperkinetic_disorders",
+        )
+    },
+    # Demographics
+    **{
+        loader_name: f"{_RAW}.load_structured_sfi:{loader_name}"
+        for loader_name in ("weight_in_kg", "height_in_cm", "bmi")
+    },
+    "sex_female": f"{_RAW}.load_demographic:sex_female",
+}
+
+# Loaders may be called from several threads, e.g. by load_concurrently, and
+# the registry must not change between taking and restoring its entries
+_IMPORT_LOCK = threading.RLock()
+
+
+class LazyLoader:
+    """A data loader that imports its implementation on the first call."""
+
+    def __init__(
+        self,
+        loader_name: str,
+        import_path: str,
+        registry: Any = data_loaders,
+    ) -> None:
+        self.loader_name = loader_name
+        self.import_path = import_path
+        self.registry = registry
+        self._loader_fn: Optional[Callable[..., pd.DataFrame]] = None
+
+    def __repr__(self) -> str:
+        return f"LazyLoader({self.loader_name!r}, {self.import_path!r})"
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loader_fn is not None
+
+    def load(self) -> Callable[..., pd.DataFrame]:
+        """Import the implementation of the loader, restoring the entries of
+        the registry that the import replaced."""
+        with _IMPORT_LOCK:
+            if self._loader_fn is None:
+                module_name, attribute = self.import_path.split(":")
+                previous_entries = self.registry.get_all()
+
+                log.debug(f"{self.loader_name}: Importing {module_name}")
+                loader_fn = getattr(importlib.import_module(module_name), attribute)
+
+                for loader_name, entry in self.registry.get_all().items():
+                    previous_entry = previous_entries.get(loader_name)
+                    if previous_entry is not None and previous_entry is not entry:
+                        self.registry.register(loader_name, func=previous_entry)
+
+                self._loader_fn = loader_fn
+
+        return self._loader_fn
+
+    def __call__(self, *args: Any, **kwargs: Any) -> pd.DataFrame:
+        return self.load()(*args, **kwargs)
+
+
+def register_lazy_loaders(
+    import_paths: Mapping[str, str] = LOADER_IMPORT_PATHS,
+    registry: Any = data_loaders,
+) -> int:
+    """Register a LazyLoader for each loader name, unless the name is already
+    registered, e.g. because its module has been imported.
+
+    Args:
+        import_paths (Mapping[str, str]): Import paths as "module:attribute", by loader name.
+            Defaults to LOADER_IMPORT_PATHS.
+        registry (Any): Catalogue registry. Defaults to timeseriesflattener's data_loaders.
+
+    Returns:
+        int: Number of registered lazy loaders.
+    """
+    registered = registry.get_all()
+    n_registered = 0
+
+    for loader_name, import_path in import_paths.items():
+        if loader_name in registered:
+            continue
+
+        registry.register(
+            loader_name,
+            func=LazyLoader(loader_name, import_path, registry=registry),
+        )
+        n_registered += 1
+
+    return n_registered
@@ -0,0 +1,316 @@
+"""Persistent, content-addressed cache for the data loaders in this package.
+
+Loaders registered with `data_loaders.register` pull complete tables from the
+warehouse, and the same loader is often resolved several times in a single run
+(e.g. `first_diabetes_lab_result` is used both by `first_diabetes_indicator` and
+by the outcome specs). The cache stores each loader's output as a Parquet file,
+keyed by the loader name, its arguments and a fingerprint of the source data, so
+reruns with unchanged inputs skip warehouse I/O entirely.
+
+Caching is opt-in. Enable it with `configure_loader_cache()` or by setting the
+T2D_LOADER_CACHE_DIR environment variable.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+import pandas as pd
+
+from t2d_feature_generation.file_utils import (
+    atomic_write,
+    evict_least_recently_used,
+)
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    LAB_RESULTS_VIEW,
+    read_from_warehouse,
+)
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR_ENV_VAR = "T2D_LOADER_CACHE_DIR"
+MAX_SIZE_GB_ENV_VAR = "T2D_LOADER_CACHE_MAX_GB"
+SOURCE_FINGERPRINT_ENV_VAR = "T2D_SOURCE_FINGERPRINT"
+
+LoaderFn = TypeVar("LoaderFn", bound=Callable[..., pd.DataFrame])
+
+
+# Tables read by the cached loaders, and the timestamp column that grows when
+# they are refreshed
+SOURCE_TABLES = {
+    LAB_RESULTS_VIEW: "datotid_sidstesvar",
+    "[fct].[FOR_kohorte_indhold_pt_journal_psyk_somatik_inkl_2021_feb2022]": "datotid_slut",
+    "[fct].[FOR_Medicin_ordineret_inkl_2021_feb2022]": "datotid_ordinationstart",
+    "[fct].[FOR_Medicin_administreret_inkl_2021_feb2022]": "datotid_administration_start",
+}
+
+
+def get_source_fingerprint(
+    tables: Optional[dict[str, str]] = None,
+    read_sql: Callable[[str], pd.DataFrame] = read_from_warehouse,
+) -> str:
+    """Fingerprint of the row count and latest timestamp of each source table.
+
+    Args:
+        tables (Optional[dict[str, str]]): Timestamp column name, by table. Defaults to None, which uses SOURCE_TABLES.
+        read_sql (Callable[[str], pd.DataFrame]): Runs a query. Defaults to read_from_warehouse.
+    """
+    query = " UNION ALL ".join(
+        f"SELECT '{table}' AS source_table, COUNT(*) AS n_rows, "
+        f"MAX({timestamp_col_name}) AS max_timestamp FROM {table}"
+        for table, timestamp_col_name in (tables or SOURCE_TABLES).items()
+    )
+    summary = read_sql(query).sort_values("source_table")
+
+    return hashlib.sha256(
+        summary.to_json(orient="records", date_format="iso").encode(),
+    ).hexdigest()[:32]
+
+
+@functools.cache
+def _get_warehouse_fingerprint() -> str:
+    return get_source_fingerprint()
+
+
+def default_source_fingerprint() -> str:
+    """Fingerprint of the source data.
+
+    Uses T2D_SOURCE_FINGERPRINT if set. Otherwise, the source tables are
+    summarised with get_source_fingerprint, once per process, so entries are
+    invalidated when a refresh adds or removes rows.
+    """
+    if os.environ.get(SOURCE_FINGERPRINT_ENV_VAR):
+        return os.environ[SOURCE_FINGERPRINT_ENV_VAR]
+
+    return _get_warehouse_fingerprint()
+
+
+class LoaderCache:
+    """Parquet cache for loader outputs with explicit invalidation and
+    size-bounded least-recently-used eviction."""
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_size_bytes: Optional[int] = None,
+        source_fingerprint: Callable[[], str] = default_source_fingerprint,
+    ) -> None:
+        """Initialise the cache.
+
+        Args:
+            cache_dir (Path): Directory to store cached loader outputs in.
+            max_size_bytes (Optional[int]): Maximum total size of the cache. The least
+                recently used entries are evicted when it is exceeded. Defaults to None, i.e. unbounded.
+            source_fingerprint (Callable[[], str]): Returns a fingerprint of the source data.
+                Entries written under a different fingerprint are never read.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        self.source_fingerprint = source_fingerprint
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_key(self, loader_name: str, params: dict[str, Any]) -> str:
+        """Get the cache key for a loader called with params."""
+        content = json.dumps(
+            {
+                "loader_name": loader_name,
+                "params": params,
+                "source_fingerprint": self.source_fingerprint(),
+            },
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.sha256(content.encode()).hexdigest()[:32]
+
+        return f"{loader_name}-{digest}"
+
+    def _get_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.parquet"
+
+    def _get_entries(self) -> list[Path]:
+        return list(self.cache_dir.glob("*.parquet"))
+
+    def read(self, key: str) -> Optional[pd.DataFrame]:
+        """Read a cached entry, or return None on a cache miss."""
+        path = self._get_path(key)
+
+        if not path.exists():
+            return None
+
+        df = pd.read_parquet(path)
+
+        # Mark as recently used for eviction
+        os.utime(path)
+
+        return df
+
+    def write(self, key: str, df: pd.DataFrame) -> None:
+        """Write an entry to the cache, then evict entries if the cache is too big."""
+        path = self._get_path(key)
+
+        with atomic_write(path) as tmp_path:
+            df.to_parquet(tmp_path)
+
+        self.evict()
+
+    def load(
+        self,
+        loader_name: str,
+        params: dict[str, Any],
+        loader_fn: Callable[[], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """Read from the cache, or call loader_fn and cache its output on a miss."""
+        key = self.get_key(loader_name=loader_name, params=params)
+
+        df = self.read(key)
+
+        if df is not None:
+            log.info(f"{loader_name}: Loaded from cache {self._get_path(key)}")
+            return df
+
+        start_time = time.time()
+        df = loader_fn()
+        log.info(
+            f"{loader_name}: Cache miss, loaded in {time.time() - start_time:.2f} seconds",
+        )
+
+        self.write(key=key, df=df)
+
+        return df
+
+    def invalidate(self, loader_name: Optional[str] = None) -> int:
+        """Remove cached entries.
+
+        Args:
+            loader_name (Optional[str]): Only remove entries for this loader. Defaults to None, which removes all entries.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        pattern = f"{loader_name}-*.parquet" if loader_name else "*.parquet"
+        paths = list(self.cache_dir.glob(pattern))
+
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+        log.info(f"Invalidated {len(paths)} cached loader outputs")
+
+        return len(paths)
+
+    def get_size_bytes(self) -> int:
+        """Total size of the cached entries."""
+        return sum(path.stat().st_size for path in self._get_entries())
+
+    def evict(self) -> int:
+        """Evict the least recently used entries until the cache is within
+        max_size_bytes.
+
+        Returns:
+            int: Number of evicted entries.
+        """
+        if self.max_size_bytes is None:
+            return 0
+
+        n_evicted = evict_least_recently_used(
+            self._get_entries(),
+            max_size_bytes=self.max_size_bytes,
+        )
+
+        if n_evicted:
+            log.info(f"Evicted {n_evicted} cached loader outputs")
+
+        return n_evicted
+
+
+_loader_cache: Optional[LoaderCache] = None
+
+
+def configure_loader_cache(
+    cache_dir: Optional[Path],
+    max_size_bytes: Optional[int] = None,
+    source_fingerprint: Callable[[], str] = default_source_fingerprint,
+) -> Optional[LoaderCache]:
+    """Configure the cache used by loaders decorated with `cached_loader`.
+
+    Args:
+        cache_dir (Optional[Path]): Directory to store cached loader outputs in. If None, disables caching.
+        max_size_bytes (Optional[int]): Maximum total size of the cache. Defaults to None, i.e. unbounded.
+        source_fingerprint (Callable[[], str]): Returns a fingerprint of the source data.
+
+    Returns:
+        Optional[LoaderCache]: The configured cache.
+    """
+    global _loader_cache  # noqa: PLW0603
+
+    _loader_cache = (
+        LoaderCache(
+            cache_dir=cache_dir,
+            max_size_bytes=max_size_bytes,
+            source_fingerprint=source_fingerprint,
+        )
+        if cache_dir is not None
+        else None
+    )
+
+    return _loader_cache
+
+
+def get_loader_cache() -> Optional[LoaderCache]:
+    """Get the configured loader cache. Falls back to the environment variables
+    if `configure_loader_cache` has not been called."""
+    if _loader_cache is None and os.environ.get(CACHE_DIR_ENV_VAR):
+        max_size_gb = os.environ.get(MAX_SIZE_GB_ENV_VAR)
+
+        configure_loader_cache(
+            cache_dir=Path(os.environ[CACHE_DIR_ENV_VAR]),
+            max_size_bytes=int(float(max_size_gb) * 1024**3) if max_size_gb else None,
+        )
+
+    return _loader_cache
+
+
+def cached_loader(
+    loader_name: str,
+    ignore: tuple[str, ...] = (),
+) -> Callable[[LoaderFn], LoaderFn]:
+    """Cache the output of a loader on disk. Place it below
+    `data_loaders.register` so the registered function is the cached one.
+
+    Args:
+        loader_name (str): Name of the loader, used in the cache key.
+        ignore (tuple[str, ...]): Names of arguments that do not affect the output, e.g. the
+            number of workers, and are left out of the cache key. Defaults to ().
+    """
+
+    def decorator(loader_fn: LoaderFn) -> LoaderFn:
+        signature = inspect.signature(loader_fn)
+
+        @functools.wraps(loader_fn)
+        def wrapper(*args: Any, **kwargs: Any) -> pd.DataFrame:
+            cache = get_loader_cache()
+
+            if cache is None:
+                return loader_fn(*args, **kwargs)
+
+            bound_args = signature.bind(*args, **kwargs)
+            bound_args.apply_defaults()
+
+            return cache.load(
+                loader_name=loader_name,
+                params={
+                    arg: value
+                    for arg, value in bound_args.arguments.items()
+                    if arg not in ignore
+                },
+                loader_fn=lambda: loader_fn(*args, **kwargs),
+            )
+
+        return wrapper  # type: ignore
+
+    return decorator
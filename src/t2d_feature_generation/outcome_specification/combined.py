@@ -1,4 +1,9 @@
 import pandas as pd
+from t2d_feature_generation.concurrent_loading import load_concurrently
+from t2d_feature_generation.loader_cache import cached_loader
+from t2d_feature_generation.outcome_specification.first_event import (
+    combine_first_events,
+)
 from t2d_feature_generation.outcome_specification.lab_results import (
     get_first_diabetes_lab_result_above_threshold,
 )
@@ -15,29 +20,23 @@ from timeseriesflattener.utils import data_loaders
 
 
 @data_loaders.register("first_diabetes_indicator")
-def get_first_diabetes_indicator() -> pd.DataFrame:
-    dfs = {
-        "t1d_diagnoses": get_first_type_1_diabetes_diagnosis(),
-        "t2d_diagnoses": get_first_type_2_diabetes_diagnosis(),
-        "medications": get_first_antidiabetic_medication(),
-        "lab_results": get_first_diabetes_lab_result_above_threshold(),
-    }
-
-    # Add a source column to each of the dfs
-    for df_type in dfs:
-        dfs[df_type]["source"] = df_type
-
-    combined = pd.concat(
-        [dfs[k] for k in dfs],
-        axis=0,
+@cached_loader("first_diabetes_indicator", ignore=("max_workers",))
+def get_first_diabetes_indicator(max_workers: int = 4) -> pd.DataFrame:
+    # Each source is I/O-bound on the warehouse, so load them concurrently.
+    # The order of the keys is kept, and decides ties between sources.
+    dfs = load_concurrently(
+        {
+            "t1d_diagnoses": get_first_type_1_diabetes_diagnosis,
+            "t2d_diagnoses": get_first_type_2_diabetes_diagnosis,
+            "medications": get_first_antidiabetic_medication,
+            "lab_results": get_first_diabetes_lab_result_above_threshold,
+        },
+        max_workers=max_workers,
     )
 
-    first_diabetes_indicator = (
-        combined.sort_values("timestamp")
-        .groupby("dw_ek_borger")
-        .first()
-        .reset_index(drop=False)
-    )
+    # Each source is already reduced to its first event per patient, and the
+    # keys of dfs become the source column
+    first_diabetes_indicator = combine_first_events(dfs)
 
     first_diabetes_indicator["value"] = 1
     return first_diabetes_indicator[["dw_ek_borger", "timestamp", "value", "source"]]
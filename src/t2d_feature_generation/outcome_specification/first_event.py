@@ -0,0 +1,123 @@
+"""Shared kernel for finding the first event per patient.
+
+Replaces `df.sort_values("timestamp").groupby("dw_ek_borger").first()`, which
+sorts the full frame. Instead, patient ids are integer-coded and the earliest
+int64 timestamp per patient is found with a single unbuffered min-reduction.
+The payload of the first row is then gathered by index, so no sort is needed.
+"""
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.dtypes import timestamps_to_int64
+from t2d_feature_generation.event_table import EventTable
+
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def get_first_index_per_group(
+    group_codes: np.ndarray,
+    timestamps: np.ndarray,
+    n_groups: int,
+) -> np.ndarray:
+    """Get the positional index of the earliest timestamp in each group.
+
+    Ties are broken by position, so the first of several rows sharing the
+    earliest timestamp is chosen.
+
+    Args:
+        group_codes (np.ndarray): Group code in [0, n_groups) for each row.
+        timestamps (np.ndarray): int64 timestamp for each row.
+        n_groups (int): Number of groups.
+
+    Returns:
+        np.ndarray: Positional index of the first row of each group. Groups without rows get len(group_codes).
+    """
+    min_timestamps = np.full(n_groups, INT64_MAX, dtype=np.int64)
+    np.minimum.at(min_timestamps, group_codes, timestamps)
+
+    # Break ties by position among the rows that hit their group's minimum
+    candidates = np.flatnonzero(timestamps == min_timestamps[group_codes])
+    first_indices = np.full(n_groups, len(group_codes), dtype=np.int64)
+    np.minimum.at(first_indices, group_codes[candidates], candidates)
+
+    return first_indices
+
+
+def get_first_event_per_patient(
+    df: pd.DataFrame,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+) -> pd.DataFrame:
+    """Get the earliest row for each patient, keeping all columns of that row.
+
+    Rows with a missing timestamp are ignored. Ties are broken by row order.
+
+    Args:
+        df (pd.DataFrame): Events with an id and a timestamp column.
+        entity_id_col_name (str): Name of the patient id column. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+
+    Returns:
+        pd.DataFrame: One row per patient, sorted by patient id.
+    """
+    has_timestamp = df[timestamp_col_name].notna().to_numpy()
+    if not has_timestamp.all():
+        df = df[has_timestamp]
+
+    codes, uniques = pd.factorize(df[entity_id_col_name], sort=True)
+
+    first_indices = get_first_index_per_group(
+        group_codes=codes,
+        timestamps=timestamps_to_int64(df[timestamp_col_name]),
+        n_groups=len(uniques),
+    )
+
+    return df.iloc[first_indices].reset_index(drop=True)
+
+
+def combine_first_events(
+    first_events: Mapping[str, pd.DataFrame],
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+    source_col_name: str = "source",
+) -> pd.DataFrame:
+    """Combine sources, each already reduced to one row per patient, into the
+    earliest event per patient across sources.
+
+    The reduced sources are coded into an EventTable, so the raw frames are
+    never concatenated, and each patient's first event across sources is the
+    first row of the patient's events in the table.
+
+    Args:
+        first_events (Mapping[str, pd.DataFrame]): Reduced events, keyed by source name. Ties are broken by the order of the sources.
+        entity_id_col_name (str): Name of the patient id column. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+        source_col_name (str): Name of the output column with the source of each event. Defaults to "source".
+
+    Returns:
+        pd.DataFrame: Patient id, timestamp and source of the first event per patient, sorted by patient id.
+            The source is categorical, with the sources in the order of first_events.
+    """
+    table = EventTable.from_frames(
+        first_events,
+        entity_id_col_name=entity_id_col_name,
+        timestamp_col_name=timestamp_col_name,
+    )
+
+    # Every patient of the table has an event
+    first_positions = table.get_first_positions()
+
+    return pd.DataFrame(
+        {
+            entity_id_col_name: table.patients.to_numpy(),
+            timestamp_col_name: table.timestamps[first_positions].view(
+                "datetime64[ns]",
+            ),
+            source_col_name: pd.Categorical.from_codes(
+                table.source_codes[first_positions],
+                categories=table.sources,
+            ),
+        },
+    )
@@ -0,0 +1,245 @@
+"""Threshold queries for diabetes lab results, pushed down to the data source.
+
+The psycop lab loaders (`hba1c()`, `ogtt()` etc.) return every result for a
+blood sample, and the outcome specification only then keeps the results above
+a diagnostic threshold. Here, the threshold (and optionally the "first result
+per patient" reduction) is part of the SQL query, so only the qualifying rows
+ever reach Python. For sources that cannot filter, results are streamed in
+chunks and reduced as they arrive.
+
+Queries mirror `blood_sample()` in psycop_feature_generation.loaders.raw.load_lab_results,
+including its coercion of non-numerical results such as ">130".
+"""
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.outcome_specification.first_event import (
+    get_first_event_per_patient,
+)
+
+LAB_RESULTS_VIEW = "[fct].[FOR_labka_alle_blodprover_inkl_2021_feb2022]"
+
+# Defaults of multiply_inequalities_in_df in psycop_feature_generation, ordered
+# so that "<=" is matched before "<"
+INEQUALITY_MULTIPLIERS = {"<=": 0.8, ">=": 1.2, "<": 0.67, ">": 1.5}
+
+NON_NUMERICAL_WHERE = "numerisksvar IS NULL AND (svar LIKE '>%' OR svar LIKE '<%')"
+
+SqlReader = Callable[[str, Optional[int]], Union[pd.DataFrame, Iterable[pd.DataFrame]]]
+
+
+@dataclass(frozen=True)
+class LabThreshold:
+    """A lab result and the value above which it indicates diabetes."""
+
+    value_type: str
+    blood_sample_ids: tuple[str, ...]
+    threshold: float
+
+
+# Blood sample ids match the corresponding psycop loaders
+DIABETES_LAB_THRESHOLDS = (
+    LabThreshold(
+        value_type="hba1c",
+        blood_sample_ids=("NPU27300", "AAB00093"),
+        threshold=47.9,
+    ),
+    LabThreshold(
+        value_type="unscheduled_p_glc",
+        blood_sample_ids=("NPU02192", "NPU21531"),
+        threshold=11.0,
+    ),
+    LabThreshold(
+        value_type="fasting_p_glc",
+        blood_sample_ids=("DNK35842",),
+        threshold=6.9,
+    ),
+    LabThreshold(value_type="ogtt", blood_sample_ids=("NPU04177",), threshold=11.0),
+)
+
+
+def read_from_warehouse(
+    query: str,
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterable[pd.DataFrame]]:
+    """Run a query against the warehouse."""
+    from psycop_feature_generation.loaders.raw.sql_load import sql_load
+
+    return sql_load(
+        query,
+        database="USR_PS_FORSK",
+        chunksize=chunksize,
+        # Timestamps are parsed here instead, which also works for chunked reads
+        format_timestamp_cols_to_datetime=False,
+    )
+
+
+def _get_where_clause(lab: LabThreshold) -> str:
+    npu_codes = ", ".join(f"'{code}'" for code in lab.blood_sample_ids)
+    return f"datotid_sidstesvar IS NOT NULL AND npukode IN ({npu_codes})"
+
+
+def get_numerical_above_threshold_query(
+    lab: LabThreshold,
+    first_per_patient: bool,
+) -> str:
+    """Query for numerical results above the threshold, optionally reduced to
+    the first result per patient."""
+    where = f"{_get_where_clause(lab)} AND numerisksvar > {lab.threshold}"
+
+    if first_per_patient:
+        return (
+            "SELECT dw_ek_borger, MIN(datotid_sidstesvar) AS datotid_sidstesvar "
+            f"FROM {LAB_RESULTS_VIEW} WHERE {where} GROUP BY dw_ek_borger"
+        )
+
+    return (
+        "SELECT dw_ek_borger, datotid_sidstesvar, numerisksvar "
+        f"FROM {LAB_RESULTS_VIEW} WHERE {where}"
+    )
+
+
+def get_non_numerical_query(lab: LabThreshold) -> str:
+    """Query for results given as inequalities, e.g. ">130". These are rare, and
+    are coerced and filtered in Python."""
+    return (
+        "SELECT dw_ek_borger, datotid_sidstesvar, svar "
+        f"FROM {LAB_RESULTS_VIEW} WHERE {_get_where_clause(lab)} AND {NON_NUMERICAL_WHERE}"
+    )
+
+
+def get_all_results_query(lab: LabThreshold) -> str:
+    """Query for all results, used when the source cannot filter."""
+    return (
+        "SELECT dw_ek_borger, datotid_sidstesvar, numerisksvar, svar "
+        f"FROM {LAB_RESULTS_VIEW} WHERE {_get_where_clause(lab)}"
+    )
+
+
+def coerce_inequalities(results: pd.Series) -> pd.Series:
+    """Coerce results like ">130" to numbers, as psycop's multiply_inequalities_in_df
+    does. Results that are not inequalities become NaN."""
+    results = results.astype(str)
+    numbers = (
+        results.str.replace(",", ".")
+        .str.extract(r"(\d+\.\d+|\d+)", expand=False)
+        .astype(float)
+    )
+
+    multipliers = pd.Series(np.nan, index=results.index)
+    for inequality, multiplier in INEQUALITY_MULTIPLIERS.items():
+        starts_with_inequality = results.str.startswith(inequality) & multipliers.isna()
+        multipliers[starts_with_inequality] = multiplier
+
+    return (numbers * multipliers).round(6)
+
+
+def _to_output_format(
+    df: pd.DataFrame,
+    lab: LabThreshold,
+    first_per_patient: bool,
+) -> pd.DataFrame:
+    df = df.rename(columns={"datotid_sidstesvar": "timestamp"})
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+
+    if first_per_patient:
+        df = get_first_event_per_patient(df)[["dw_ek_borger", "timestamp"]]
+    else:
+        df = df[["dw_ek_borger", "timestamp", "value"]].drop_duplicates(
+            subset=["dw_ek_borger", "timestamp", "value"],
+            keep="first",
+        )
+
+    return df.assign(value_type=lab.value_type).reset_index(drop=True)
+
+
+def _as_chunks(
+    result: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+) -> Iterator[pd.DataFrame]:
+    if isinstance(result, pd.DataFrame):
+        yield result
+    else:
+        yield from result
+
+
+def _filter_chunk(chunk: pd.DataFrame, lab: LabThreshold) -> pd.DataFrame:
+    values = chunk["numerisksvar"].astype(float)
+    is_non_numerical = values.isna() & chunk["svar"].notna()
+
+    if is_non_numerical.any():
+        values = values.where(
+            ~is_non_numerical,
+            coerce_inequalities(chunk.loc[is_non_numerical, "svar"]),
+        )
+
+    chunk = chunk.assign(
+        datotid_sidstesvar=pd.to_datetime(chunk["datotid_sidstesvar"]),
+        value=values,
+    )
+    return chunk.loc[
+        chunk["value"] > lab.threshold,
+        ["dw_ek_borger", "datotid_sidstesvar", "value"],
+    ]
+
+
+def load_lab_results_above_threshold(
+    lab: LabThreshold,
+    first_per_patient: bool = False,
+    pushdown: bool = True,
+    read_sql: SqlReader = read_from_warehouse,
+    chunksize: int = 1_000_000,
+) -> pd.DataFrame:
+    """Load lab results above the lab's threshold.
+
+    Args:
+        lab (LabThreshold): The lab result and its threshold.
+        first_per_patient (bool): Whether to only return the first result above the threshold for each patient. Defaults to False.
+        pushdown (bool): Whether the source can filter. If True, the threshold (and first_per_patient reduction) is
+            part of the query. If False, all results are streamed in chunks of chunksize and filtered as they arrive. Defaults to True.
+        read_sql (SqlReader): Runs a query, given the query and a chunksize. Defaults to reading from the warehouse.
+        chunksize (int): Number of rows per chunk when streaming. Defaults to 1_000_000.
+
+    Returns:
+        pd.DataFrame: dw_ek_borger, timestamp and value_type, plus value if not first_per_patient.
+    """
+    if pushdown:
+        numerical = read_sql(
+            get_numerical_above_threshold_query(
+                lab=lab,
+                first_per_patient=first_per_patient,
+            ),
+            None,
+        ).rename(columns={"numerisksvar": "value"})
+
+        non_numerical = read_sql(get_non_numerical_query(lab), None)
+        non_numerical = non_numerical.assign(
+            value=coerce_inequalities(non_numerical["svar"]),
+        )
+        non_numerical = non_numerical[non_numerical["value"] > lab.threshold]
+
+        df = pd.concat([numerical, non_numerical], ignore_index=True)
+        return _to_output_format(df=df, lab=lab, first_per_patient=first_per_patient)
+
+    filtered_chunks = []
+    for chunk in _as_chunks(read_sql(get_all_results_query(lab), chunksize)):
+        filtered_chunks.append(_filter_chunk(chunk=chunk, lab=lab))
+
+        if first_per_patient:
+            # Keep memory bounded by the number of patients, not the number of results
+            filtered_chunks = [
+                get_first_event_per_patient(
+                    pd.concat(filtered_chunks, ignore_index=True),
+                    timestamp_col_name="datotid_sidstesvar",
+                ),
+            ]
+
+    df = (
+        pd.concat(filtered_chunks, ignore_index=True)
+        if filtered_chunks
+        else pd.DataFrame(columns=["dw_ek_borger", "datotid_sidstesvar", "value"])
+    )
+    return _to_output_format(df=df, lab=lab, first_per_patient=first_per_patient)
@@ -7,16 +7,25 @@ from psycop_feature_generation.loaders.raw.load_lab_results import (
 )
 from timeseriesflattener.utils import data_loaders
 
+from t2d_feature_generation.dtypes import compact_event_df
+from t2d_feature_generation.loader_cache import cached_loader
+from t2d_feature_generation.outcome_specification.first_event import (
+    combine_first_events,
+    get_first_event_per_patient,
+)
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    DIABETES_LAB_THRESHOLDS,
+    load_lab_results_above_threshold,
+)
+
 
 def get_rows_above_value(
     value: float,
     df: pd.DataFrame,
     value_type: str,
 ) -> pd.DataFrame:
-    output_df = df[df["value"] > value]
-    output_df["value_type"] = value_type
-
-    return output_df
+    # Assign on the filtered rows, instead of setting a column on a slice of df
+    return df.loc[df["value"] > value].assign(value_type=value_type)
 
 
 def get_hba1cs_above_threshold() -> pd.DataFrame:
@@ -49,27 +58,50 @@ def get_diabetes_lab_results_above_threshold() -> pd.DataFrame:
     fasting_glc = get_fasting_glc_above_threshold()
     ogtt = get_ogtt_above_threshold()
 
-    return pd.concat(
-        [
-            hba1cs,
-            unscheduled_p_glc,
-            fasting_glc,
-            ogtt,
-        ],
-        axis=0,
+    # Make value_type categorical after concatenating, as concatenating
+    # categoricals with different categories gives object dtype
+    return compact_event_df(
+        pd.concat(
+            [
+                hba1cs,
+                unscheduled_p_glc,
+                fasting_glc,
+                ogtt,
+            ],
+            axis=0,
+        ),
     )
 
 
 @data_loaders.register("first_diabetes_lab_result")
-def get_first_diabetes_lab_result_above_threshold() -> pd.DataFrame:
-    df = get_diabetes_lab_results_above_threshold()
-
-    first_lab_result_above_threshold = (
-        df.sort_values("timestamp")
-        .groupby("dw_ek_borger")
-        .first()
-        .reset_index(drop=False)
-    )
+@cached_loader("first_diabetes_lab_result")
+def get_first_diabetes_lab_result_above_threshold(
+    pushdown: bool = True,
+) -> pd.DataFrame:
+    if pushdown:
+        # Only the first result above the threshold per patient leaves the warehouse
+        first_lab_results = {
+            lab.value_type: load_lab_results_above_threshold(
+                lab=lab,
+                first_per_patient=True,
+            )
+            for lab in DIABETES_LAB_THRESHOLDS
+        }
+    else:
+        # Reduce each lab result to its first row per patient before combining,
+        # so the full above-threshold tables are never concatenated
+        first_lab_results = {
+            "hba1c": get_first_event_per_patient(get_hba1cs_above_threshold()),
+            "unscheduled_p_glc": get_first_event_per_patient(
+                get_unscheduled_p_glc_above_threshold(),
+            ),
+            "fasting_p_glc": get_first_event_per_patient(
+                get_fasting_glc_above_threshold(),
+            ),
+            "ogtt": get_first_event_per_patient(get_ogtt_above_threshold()),
+        }
+
+    first_lab_result_above_threshold = combine_first_events(first_lab_results)
 
     first_lab_result_above_threshold["value"] = 1
     return first_lab_result_above_threshold[["dw_ek_borger", "timestamp", "value"]]
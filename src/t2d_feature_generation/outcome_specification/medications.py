@@ -3,6 +3,10 @@ from psycop_feature_generation.loaders.raw.load_medications import (
     load as load_medications,
 )
 
+from t2d_feature_generation.outcome_specification.first_event import (
+    get_first_event_per_patient,
+)
+
 
 def get_antidiabetic_medications() -> pd.DataFrame:
     df = load_medications(
@@ -18,13 +22,7 @@ def get_antidiabetic_medications() -> pd.DataFrame:
 def get_first_antidiabetic_medication() -> pd.DataFrame:
     df = get_antidiabetic_medications()
 
-    # Group by person id and sort by timestamp, then get the first row for each person
-    df_first_antidiabetic_medication = (
-        df.sort_values("timestamp")
-        .groupby("dw_ek_borger")
-        .first()
-        .reset_index(drop=False)
-    )
+    df_first_antidiabetic_medication = get_first_event_per_patient(df)
 
     return df_first_antidiabetic_medication[["dw_ek_borger", "timestamp"]]
 
@@ -1,16 +1,15 @@
 import pandas as pd
 from psycop_feature_generation.loaders.raw.load_diagnoses import type_1_diabetes
 
+from t2d_feature_generation.outcome_specification.first_event import (
+    get_first_event_per_patient,
+)
+
 
 def get_first_type_1_diabetes_diagnosis() -> pd.DataFrame:
     df = type_1_diabetes()
 
-    df_first_t1d_diag = (
-        df.sort_values("timestamp")
-        .groupby("dw_ek_borger")
-        .first()
-        .reset_index(drop=False)
-    )
+    df_first_t1d_diag = get_first_event_per_patient(df)
 
     return df_first_t1d_diag[["dw_ek_borger", "timestamp"]]
 
@@ -0,0 +1,356 @@
+"""Write feature set splits as partitioned, sorted Parquet datasets.
+
+psycop's split_and_save_dataset_to_disk writes each split as a single file,
+in the order of the flattened dataframe, with default compression and
+dictionary encoding of every column. Readers that only need some patients or
+years then have to scan every row group, as row group statistics span all ids
+and timestamps.
+
+In the partitioned layout, each split is a directory with one file per year of
+prediction time:
+
+    {feature_set_prefix}/split=train/year=2015/part-0.parquet
+
+Rows are sorted by id and timestamp within each file, so the min/max
+statistics of row groups are narrow and FeatureSetReader's filters skip most of
+them. Row groups are sized to about ROW_GROUP_TARGET_BYTES of uncompressed data.
+Columns are compressed with zstd, and only flag columns are dictionary encoded,
+as dictionaries of continuous values are as large as the values.
+
+Feature sets flattened in patient shards are split and saved one shard at a
+time by split_and_save_shards_to_disk, which appends each shard's rows to every
+split, so the flattened dataset is never held in memory at once. In the
+partitioned layout, each shard then writes its own part file to each year.
+"""
+import logging
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from psycop_feature_generation.application_modules.project_setup import ProjectInfo
+from psycop_feature_generation.application_modules.save_dataset_to_disk import (
+    filter_by_split_ids,
+    get_split_id_df,
+    save_split_to_disk,
+)
+
+from t2d_feature_generation.dtypes import timestamps_to_int64
+from t2d_feature_generation.file_utils import atomic_write, atomic_write_dir
+from t2d_feature_generation.flattening.sharding import read_shard
+
+log = logging.getLogger(__name__)
+
+SPLITS = ("train", "val", "test")
+COMPRESSION = "zstd"
+ROW_GROUP_TARGET_BYTES = 128 * 1024**2
+MIN_ROW_GROUP_SIZE = 10_000
+MAX_ROW_GROUP_SIZE = 1_000_000
+
+
+def get_flag_col_names(df: pd.DataFrame) -> list[str]:
+    """Columns with few distinct values by their dtype: booleans, 8-bit integers
+    (dichotomous columns with the compact dtype policy) and categoricals."""
+    return [
+        col_name
+        for col_name, dtype in df.dtypes.items()
+        if pd.api.types.is_bool_dtype(dtype)
+        or isinstance(dtype, pd.CategoricalDtype)
+        or (pd.api.types.is_integer_dtype(dtype) and dtype.itemsize == 1)
+    ]
+
+
+def get_row_group_size(
+    df: pd.DataFrame,
+    target_bytes: int = ROW_GROUP_TARGET_BYTES,
+) -> int:
+    """Number of rows with about target_bytes of uncompressed data, within
+    MIN_ROW_GROUP_SIZE and MAX_ROW_GROUP_SIZE.
+
+    Wide feature sets get shorter row groups, which keeps the memory of
+    reading a row group bounded and makes statistics more selective.
+    """
+    n_bytes = df.memory_usage(index=False, deep=False).sum()
+    bytes_per_row = max(n_bytes / max(len(df), 1), 1)
+    return int(
+        np.clip(target_bytes // bytes_per_row, MIN_ROW_GROUP_SIZE, MAX_ROW_GROUP_SIZE),
+    )
+
+
+def _write_year_partitions(
+    split_df: pd.DataFrame,
+    tmp_dir: Path,
+    part_name: str,
+    entity_id_col_name: str,
+    timestamp_col_name: str,
+    row_group_size: Optional[int],
+    compression_level: Optional[int],
+) -> list[Path]:
+    """Write the rows of each year to year={year}/{part_name}.parquet in
+    tmp_dir, sorted by id and timestamp.
+
+    Returns:
+        list[Path]: Paths of the written files relative to tmp_dir, by year.
+    """
+    if len(split_df) == 0:
+        return []
+
+    if row_group_size is None:
+        row_group_size = get_row_group_size(split_df)
+    flag_col_names = get_flag_col_names(split_df)
+
+    years = split_df[timestamp_col_name].dt.year.to_numpy()
+    # Sorted by year, then id and timestamp, so each year is a contiguous slice
+    order = np.lexsort(
+        (
+            timestamps_to_int64(split_df[timestamp_col_name]),
+            split_df[entity_id_col_name].to_numpy(),
+            years,
+        ),
+    )
+    sorted_years = years[order]
+    year_starts = np.flatnonzero(
+        np.concatenate([[True], sorted_years[1:] != sorted_years[:-1]]),
+    )
+    year_ends = np.append(year_starts[1:], len(order))
+
+    relative_paths = []
+    for start, end in zip(year_starts, year_ends):
+        year = int(sorted_years[start])
+        relative_path = Path(f"year={year}") / f"{part_name}.parquet"
+        (tmp_dir / relative_path).parent.mkdir(parents=True, exist_ok=True)
+
+        table = pa.Table.from_pandas(
+            split_df.take(order[start:end]),
+            preserve_index=False,
+        )
+        pq.write_table(
+            table,
+            tmp_dir / relative_path,
+            row_group_size=row_group_size,
+            compression=COMPRESSION,
+            compression_level=compression_level,
+            use_dictionary=flag_col_names,
+            write_statistics=True,
+        )
+        relative_paths.append(relative_path)
+
+    return relative_paths
+
+
+def write_partitioned_split(
+    split_df: pd.DataFrame,
+    split_dir: Path,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+    row_group_size: Optional[int] = None,
+    compression_level: Optional[int] = None,
+) -> list[Path]:
+    """Write a split as one Parquet file per year of timestamp, sorted by id and
+    timestamp.
+
+    The split is written to a temporary directory, which then replaces
+    split_dir, see file_utils.atomic_write_dir. Readers never see a partially
+    written split, but find none in the instant between the old split being
+    renamed aside and the new one being renamed into place.
+
+    Args:
+        split_df (pd.DataFrame): Rows of the split.
+        split_dir (Path): Directory of the split. Replaced if it exists.
+        entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+        row_group_size (Optional[int]): Rows per row group. Defaults to None, see get_row_group_size.
+        compression_level (Optional[int]): zstd compression level. Defaults to None, i.e. Arrow's default.
+
+    Returns:
+        list[Path]: Paths of the written files, by year.
+    """
+    split_dir = Path(split_dir)
+
+    if row_group_size is None:
+        row_group_size = get_row_group_size(split_df)
+
+    with atomic_write_dir(split_dir) as tmp_dir:
+        paths = [
+            split_dir / relative_path
+            for relative_path in _write_year_partitions(
+                split_df=split_df,
+                tmp_dir=tmp_dir,
+                part_name="part-0",
+                entity_id_col_name=entity_id_col_name,
+                timestamp_col_name=timestamp_col_name,
+                row_group_size=row_group_size,
+                compression_level=compression_level,
+            )
+        ]
+
+    log.info(
+        f"{split_dir.name}: Wrote {len(split_df)} rows to {len(paths)} yearly partitions, {row_group_size} rows per row group",
+    )
+
+    return paths
+
+
+def split_and_save_dataset_to_disk(
+    flattened_df: pd.DataFrame,
+    project_info: ProjectInfo,
+    partitioned: bool = False,
+) -> None:
+    """Split and save to disk.
+
+    Mirrors split_and_save_dataset_to_disk from psycop_feature_generation, with
+    an optional partitioned layout.
+
+    Args:
+        flattened_df (pd.DataFrame): Flattened dataframe.
+        project_info (ProjectInfo): Project info.
+        partitioned (bool): Whether to write each split as a directory of yearly partitions, see
+            write_partitioned_split. Defaults to False, i.e. one file per split.
+    """
+    for split_name in SPLITS:
+        split_df = filter_by_split_ids(
+            df_to_split=flattened_df,
+            split_id_df=get_split_id_df(split_name=split_name),  # type: ignore
+            split_name=split_name,
+        )
+
+        if not partitioned:
+            save_split_to_disk(
+                project_info=project_info,
+                split_df=split_df,
+                split_name=split_name,
+            )
+            continue
+
+        write_partitioned_split(
+            split_df=split_df,
+            split_dir=project_info.feature_set_path
+            / project_info.feature_set_prefix
+            / f"split={split_name}",
+            entity_id_col_name=project_info.col_names.id,
+            timestamp_col_name=project_info.col_names.timestamp,
+        )
+
+
+class _SplitFileAppender:
+    """Appends rows to a split file, in one of the dataset formats of
+    ProjectInfo. Parquet files are written with one row group per append, and
+    take the schema of the first append."""
+
+    def __init__(self, path: Path, dataset_format: str) -> None:
+        if dataset_format not in ("csv", "parquet"):
+            raise ValueError(f"Invalid dataset format {dataset_format}")
+
+        self.path = path
+        self.dataset_format = dataset_format
+        self._parquet_writer: Optional[pq.ParquetWriter] = None
+        self._has_header = False
+
+    def append(self, df: pd.DataFrame) -> None:
+        if self.dataset_format == "csv":
+            df.to_csv(self.path, mode="a", header=not self._has_header, index=False)
+            self._has_header = True
+            return
+
+        table = pa.Table.from_pandas(
+            df,
+            schema=self._parquet_writer.schema if self._parquet_writer else None,
+            preserve_index=False,
+        )
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+        self._parquet_writer.write_table(table)
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def split_and_save_shards_to_disk(
+    shard_paths: list[Path],
+    project_info: ProjectInfo,
+    partitioned: bool = False,
+) -> None:
+    """Split and save a dataset flattened in patient shards to disk, reading
+    one shard at a time.
+
+    Rows of a split are in the order of the shards, and within a shard in the
+    order of its prediction times. In the partitioned layout, rows are sorted
+    by id and timestamp within each shard's part-{i}.parquet file of a year.
+
+    Args:
+        shard_paths (list[Path]): Paths of the flattened shards, see t2d_feature_generation.flattening.sharding.
+        project_info (ProjectInfo): Project info.
+        partitioned (bool): Whether to write each split as a directory of yearly partitions, see
+            write_partitioned_split. Defaults to False, i.e. one file per split.
+
+    Raises:
+        ValueError: If there are no shards.
+    """
+    if not shard_paths:
+        raise ValueError("No shards to split and save")
+
+    split_id_dfs = {
+        split_name: get_split_id_df(split_name=split_name)  # type: ignore
+        for split_name in SPLITS
+    }
+    n_rows = dict.fromkeys(SPLITS, 0)
+
+    # Splits replace the previous ones only once every shard is written
+    with ExitStack() as stack:
+        if partitioned:
+            tmp_dirs = {
+                split_name: stack.enter_context(
+                    atomic_write_dir(
+                        project_info.feature_set_path
+                        / project_info.feature_set_prefix
+                        / f"split={split_name}",
+                    ),
+                )
+                for split_name in SPLITS
+            }
+        else:
+            appenders = {}
+            for split_name in SPLITS:
+                tmp_path = stack.enter_context(
+                    atomic_write(
+                        project_info.feature_set_path
+                        / f"{project_info.feature_set_prefix}_{split_name}.{project_info.dataset_format}",
+                    ),
+                )
+                appenders[split_name] = _SplitFileAppender(
+                    tmp_path,
+                    dataset_format=project_info.dataset_format,
+                )
+                # Closed before the file replaces the split
+                stack.callback(appenders[split_name].close)
+
+        for i, shard_path in enumerate(shard_paths):
+            shard_df = read_shard(shard_path)
+
+            for split_name, split_id_df in split_id_dfs.items():
+                split_df = pd.merge(shard_df, split_id_df, how="inner", validate="m:1")
+                n_rows[split_name] += len(split_df)
+
+                if partitioned:
+                    _write_year_partitions(
+                        split_df=split_df,
+                        tmp_dir=tmp_dirs[split_name],
+                        part_name=f"part-{i}",
+                        entity_id_col_name=project_info.col_names.id,
+                        timestamp_col_name=project_info.col_names.timestamp,
+                        row_group_size=None,
+                        compression_level=None,
+                    )
+                else:
+                    appenders[split_name].append(split_df)
+
+            del shard_df
+
+    for split_name, split_n_rows in n_rows.items():
+        log.info(
+            f"{split_name}: Saved {split_n_rows} rows from {len(shard_paths)} shards",
+        )
@@ -0,0 +1,176 @@
+"""Exclusion of prediction times within a quarantine, e.g. after moving into
+the region.
+
+psycop's PredictionTimeFilterer merges the prediction times with every
+quarantine timestamp of their patient, and checks each pair. Here, quarantine
+start times are sorted by patient and time once. A prediction time is within a
+quarantine if the latest start at least a day before it is less than the
+quarantine length before it, so one searchsorted over all prediction times
+finds the start that decides it, for any number of quarantine lengths.
+"""
+import logging
+from collections.abc import Sequence
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.dtypes import NAT_INT64, timestamps_to_int64
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+
+log = logging.getLogger(__name__)
+
+ONE_DAY_NS = pd.Timedelta(days=1).value
+
+
+class QuarantineIndex:
+    """Quarantine start times, sorted by patient and time.
+
+    Matches PredictionTimeFilterer, which excludes a prediction time if
+    0 < (prediction time - quarantine start).days < quarantine_days for any of its
+    patient's quarantine starts.
+    """
+
+    def __init__(
+        self,
+        quarantine_timestamps: pd.DataFrame,
+        entity_id_col_name: str = "dw_ek_borger",
+        timestamp_col_name: str = "timestamp",
+    ) -> None:
+        self.entity_id_col_name = entity_id_col_name
+        self.timestamp_col_name = timestamp_col_name
+        self.patients = pd.Index(quarantine_timestamps[entity_id_col_name].unique())
+
+        codes = self.patients.get_indexer(quarantine_timestamps[entity_id_col_name])
+        timestamps = timestamps_to_int64(
+            pd.to_datetime(quarantine_timestamps[timestamp_col_name]),
+        )
+        keep = np.flatnonzero(timestamps != NAT_INT64)
+        order = keep[np.lexsort((timestamps[keep], codes[keep]))]
+
+        # Quarantine starts have no values
+        self.starts = PatientSortedEvents(
+            codes=codes[order].astype(np.int64),
+            timestamps=timestamps[order],
+            values=np.zeros(len(order)),
+        )
+
+    def get_latest_start(self, prediction_times: pd.DataFrame) -> np.ndarray:
+        """Get the latest quarantine start at least a day before each prediction
+        time.
+
+        Returns:
+            np.ndarray: int64 timestamp of the start, or NAT_INT64 if there is none, aligned with
+                prediction_times.
+        """
+        codes = self.patients.get_indexer(prediction_times[self.entity_id_col_name])
+        timestamps = timestamps_to_int64(prediction_times[self.timestamp_col_name])
+
+        latest = np.full(len(prediction_times), NAT_INT64, dtype=np.int64)
+        has_patient = np.flatnonzero(codes >= 0)
+        if len(self.starts) == 0 or len(has_patient) == 0:
+            return latest
+
+        patient_codes = codes[has_patient].astype(np.int64)
+        positions = (
+            self.starts.searchsorted(
+                patient_codes,
+                timestamps[has_patient] - ONE_DAY_NS,
+                side="right",
+            )
+            - 1
+        )
+
+        # Positions before the first start, or of a preceding patient, have no start
+        clipped = np.maximum(positions, 0)
+        has_start = (positions >= 0) & (self.starts.codes[clipped] == patient_codes)
+        latest[has_patient[has_start]] = self.starts.timestamps[clipped[has_start]]
+
+        return latest
+
+    def get_exclusions(
+        self,
+        prediction_times: pd.DataFrame,
+        quarantine_days: Sequence[int],
+    ) -> dict[int, np.ndarray]:
+        """Decide which prediction times are within a quarantine, for each
+        quarantine length, and log the number excluded by each.
+
+        Args:
+            prediction_times (pd.DataFrame): Prediction times with an id and a timestamp column.
+            quarantine_days (Sequence[int]): Quarantine lengths in days.
+
+        Returns:
+            dict[int, np.ndarray]: Boolean mask of excluded prediction times, aligned with prediction_times,
+                by quarantine length.
+        """
+        latest_start = self.get_latest_start(prediction_times)
+        has_start = latest_start != NAT_INT64
+        timestamps = timestamps_to_int64(prediction_times[self.timestamp_col_name])
+
+        exclusions = {}
+        for days in quarantine_days:
+            exclusions[days] = has_start & (
+                latest_start > timestamps - days * ONE_DAY_NS
+            )
+            log.info(
+                f"Quarantine of {days} days: Excluded {int(exclusions[days].sum())} of {len(prediction_times)} prediction times",
+            )
+
+        return exclusions
+
+    def count_exclusions(
+        self,
+        prediction_times: pd.DataFrame,
+        quarantine_days: Sequence[int],
+    ) -> pd.Series:
+        """Count the prediction times within a quarantine, by quarantine length."""
+        return pd.Series(
+            {
+                days: int(is_excluded.sum())
+                for days, is_excluded in self.get_exclusions(
+                    prediction_times,
+                    quarantine_days,
+                ).items()
+            },
+            name="n_excluded",
+        ).rename_axis("quarantine_days")
+
+
+def filter_prediction_times(
+    prediction_times_df: pd.DataFrame,
+    quarantine_df: Optional[pd.DataFrame] = None,
+    quarantine_days: Optional[int] = None,
+    entity_id_col_name: str = "dw_ek_borger",
+    timestamp_col_name: str = "timestamp",
+) -> pd.DataFrame:
+    """Drop prediction times within quarantine_days after a quarantine start.
+
+    Mirrors filter_prediction_times from psycop_feature_generation.
+
+    Args:
+        prediction_times_df (pd.DataFrame): Prediction times with an id and a timestamp column.
+        quarantine_df (Optional[pd.DataFrame]): Quarantine starts with an id and a timestamp column.
+            Defaults to None.
+        quarantine_days (Optional[int]): Length of the quarantine. Defaults to None.
+        entity_id_col_name (str): Name of the id column. Defaults to "dw_ek_borger".
+        timestamp_col_name (str): Name of the timestamp column. Defaults to "timestamp".
+
+    Returns:
+        pd.DataFrame: The kept prediction times, with their index, or prediction_times_df without a quarantine.
+    """
+    if (quarantine_df is None) != (quarantine_days is None):
+        raise ValueError(
+            "If either of quarantine_df and quarantine_days are provided, both must be provided.",
+        )
+
+    if quarantine_df is None or quarantine_days is None:
+        return prediction_times_df
+
+    is_excluded = QuarantineIndex(
+        quarantine_timestamps=quarantine_df,
+        entity_id_col_name=entity_id_col_name,
+        timestamp_col_name=timestamp_col_name,
+    ).get_exclusions(prediction_times_df, [quarantine_days])[quarantine_days]
+
+    return prediction_times_df[~is_excluded]
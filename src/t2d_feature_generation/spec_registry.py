@@ -0,0 +1,273 @@
+"""Lazy, indexed registry of feature specs.
+
+Creating a timeseriesflattener spec resolves its values_loader, i.e. loads the
+source from the warehouse, so building every spec of the feature set to select
+a few of them loads every source. The registry instead stores each combination
+of a group spec as a SpecEntry: the keyword arguments of the spec, without its
+values. Entries are indexed by kind, loader, prefix, window and aggregation, and
+specs are only created for the entries that are asked for.
+"""
+import bisect
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union
+
+from timeseriesflattener.feature_spec_objects import (
+    OutcomeGroupSpec,
+    OutcomeSpec,
+    PredictorGroupSpec,
+    PredictorSpec,
+    StaticSpec,
+    _AnySpec,
+    _MinGroupSpec,
+    create_feature_combinations_from_dict,
+)
+
+SPEC_KINDS = {
+    PredictorSpec: "predictor",
+    OutcomeSpec: "outcome",
+    StaticSpec: "static",
+}
+GROUP_SPEC_CLASSES = {
+    PredictorGroupSpec: PredictorSpec,
+    OutcomeGroupSpec: OutcomeSpec,
+}
+
+Criterion = Optional[Union[str, Sequence[str]]]
+
+
+@dataclass(frozen=True)
+class SpecEntry:
+    """An uncreated spec: its class and keyword arguments, and its position in
+    the registry."""
+
+    spec_class: type
+    position: int
+    kwargs: dict[str, Any] = field(compare=False, hash=False)
+
+    @property
+    def kind(self) -> str:
+        return SPEC_KINDS[self.spec_class]
+
+    @property
+    def values_loader(self) -> Optional[str]:
+        values_loader = self.kwargs.get("values_loader")
+        return values_loader if isinstance(values_loader, str) else None
+
+    @property
+    def prefix(self) -> str:
+        # Specs with an output column name override get no prefix
+        if self.kwargs.get("output_col_name_override"):
+            return ""
+
+        return self.kwargs.get("prefix", "")
+
+    @property
+    def interval_days(self) -> Optional[float]:
+        for key in ("interval_days", "lookbehind_days", "lookahead_days"):
+            if self.kwargs.get(key) is not None:
+                return float(self.kwargs[key])
+
+        return None
+
+    @property
+    def aggregation(self) -> Optional[str]:
+        resolve_multiple_fn = self.kwargs.get("resolve_multiple_fn")
+        if resolve_multiple_fn is None or isinstance(resolve_multiple_fn, str):
+            return resolve_multiple_fn
+
+        return resolve_multiple_fn.__name__
+
+    def create(self) -> _AnySpec:
+        """Create the spec, which loads its values."""
+        return self.spec_class(**self.kwargs)
+
+
+def _as_set(criterion: Union[str, Sequence[str]]) -> set[str]:
+    return {criterion} if isinstance(criterion, str) else set(criterion)
+
+
+class SpecRegistry:
+    """Registry of spec entries, indexed by kind, loader, prefix, window and
+    aggregation. Specs are created on demand, and at most once per entry."""
+
+    def __init__(self) -> None:
+        self.entries: list[SpecEntry] = []
+        self._indices: dict[str, dict[Any, list[int]]] = {
+            "kind": {},
+            "values_loader": {},
+            "prefix": {},
+            "aggregation": {},
+        }
+        # Sorted intervals, and the positions of entries with each interval
+        self._intervals: list[float] = []
+        self._by_interval: dict[float, list[int]] = {}
+        self._specs: dict[int, _AnySpec] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[SpecEntry]:
+        return iter(self.entries)
+
+    def add(self, spec_class: type, **kwargs: Any) -> SpecEntry:
+        """Register a spec of spec_class, created with kwargs when needed."""
+        if spec_class not in SPEC_KINDS:
+            raise ValueError(
+                f"Unsupported spec class {spec_class.__name__}. Supported: {[cls.__name__ for cls in SPEC_KINDS]}",
+            )
+
+        position = len(self.entries)
+        entry = SpecEntry(spec_class=spec_class, position=position, kwargs=kwargs)
+        self.entries.append(entry)
+
+        for name, index in self._indices.items():
+            index.setdefault(getattr(entry, name), []).append(position)
+
+        interval_days = entry.interval_days
+        if interval_days is not None:
+            if interval_days not in self._by_interval:
+                bisect.insort(self._intervals, interval_days)
+            self._by_interval.setdefault(interval_days, []).append(position)
+
+        return entry
+
+    def add_group(self, group_spec: _MinGroupSpec) -> list[SpecEntry]:
+        """Register every combination of a group spec, in the order of its
+        create_combinations()."""
+        spec_class = GROUP_SPEC_CLASSES[type(group_spec)]
+
+        return [
+            self.add(spec_class, **kwargs)
+            for kwargs in create_feature_combinations_from_dict(
+                d=group_spec.__dict__,
+            )
+        ]
+
+    def _get_interval_buckets(
+        self,
+        min_interval_days: Optional[float],
+        max_interval_days: Optional[float],
+    ) -> list[list[int]]:
+        start = (
+            0
+            if min_interval_days is None
+            else bisect.bisect_left(self._intervals, min_interval_days)
+        )
+        end = (
+            len(self._intervals)
+            if max_interval_days is None
+            else bisect.bisect_right(self._intervals, max_interval_days)
+        )
+
+        return [
+            self._by_interval[interval_days]
+            for interval_days in self._intervals[start:end]
+        ]
+
+    def query(
+        self,
+        kind: Criterion = None,
+        values_loader: Criterion = None,
+        prefix: Criterion = None,
+        aggregation: Criterion = None,
+        min_interval_days: Optional[float] = None,
+        max_interval_days: Optional[float] = None,
+    ) -> list[SpecEntry]:
+        """Entries matching all criteria, in the order they were registered.
+
+        Each criterion is a value or a sequence of allowed values. Candidates
+        are taken from the most selective index, so a query costs about the
+        size of its smallest matching index bucket, not the size of the
+        registry.
+
+        Args:
+            kind (Criterion): "predictor", "outcome" or "static". Defaults to None.
+            values_loader (Criterion): Name of the loader. Defaults to None.
+            prefix (Criterion): Column name prefix, "" for specs with an output column name override. Defaults to None.
+            aggregation (Criterion): Name of the resolve multiple function. Defaults to None.
+            min_interval_days (Optional[float]): Minimum lookbehind or lookahead, inclusive. Defaults to None.
+            max_interval_days (Optional[float]): Maximum lookbehind or lookahead, inclusive. Defaults to None.
+
+        Returns:
+            list[SpecEntry]: Matching entries.
+        """
+        criteria = {
+            name: _as_set(criterion)
+            for name, criterion in (
+                ("kind", kind),
+                ("values_loader", values_loader),
+                ("prefix", prefix),
+                ("aggregation", aggregation),
+            )
+            if criterion is not None
+        }
+
+        # Buckets of positions per criterion, as a criterion's buckets are
+        # cheap to count but not to concatenate
+        candidate_buckets = [
+            [self._indices[name].get(value, []) for value in allowed]
+            for name, allowed in criteria.items()
+        ]
+        if min_interval_days is not None or max_interval_days is not None:
+            candidate_buckets.append(
+                self._get_interval_buckets(min_interval_days, max_interval_days),
+            )
+
+        if not candidate_buckets:
+            return list(self.entries)
+
+        candidates = [
+            position
+            for bucket in min(
+                candidate_buckets,
+                key=lambda buckets: sum(len(bucket) for bucket in buckets),
+            )
+            for position in bucket
+        ]
+
+        def matches(entry: SpecEntry) -> bool:
+            interval_days = entry.interval_days
+            if min_interval_days is not None and (
+                interval_days is None or interval_days < min_interval_days
+            ):
+                return False
+            if max_interval_days is not None and (
+                interval_days is None or interval_days > max_interval_days
+            ):
+                return False
+
+            return all(
+                getattr(entry, name) in allowed for name, allowed in criteria.items()
+            )
+
+        return [
+            self.entries[position]
+            for position in sorted(candidates)
+            if matches(self.entries[position])
+        ]
+
+    def create_specs(
+        self,
+        entries: Optional[Sequence[SpecEntry]] = None,
+    ) -> list[_AnySpec]:
+        """Create the specs of entries, loading their values. Specs are created
+        once per entry and reused.
+
+        Args:
+            entries (Optional[Sequence[SpecEntry]]): Entries of this registry, e.g. from query().
+                Defaults to None, i.e. all entries.
+
+        Returns:
+            list[_AnySpec]: Specs, in the order of entries.
+        """
+        if entries is None:
+            entries = self.entries
+
+        specs = []
+        for entry in entries:
+            if entry.position not in self._specs:
+                self._specs[entry.position] = entry.create()
+            specs.append(self._specs[entry.position])
+
+        return specs
@@ -0,0 +1,424 @@
+"""Synthetic cohorts for tests and benchmarks.
+
+Generates the sources of the outcome specification and the eligibility
+criteria, in the layout of the psycop loaders, without warehouse access. Every
+patient has an observation period, and patients are either without diabetes,
+with type 2 diabetes before (prevalent) or during (incident) their observation
+period, or with type 1 diabetes. Events are drawn per patient:
+
+- Visits and lab results: negative binomial counts, so a few patients have
+  many events, uniformly within the observation period. Patients with diabetes
+  are measured more often, and their lab results are above the diabetes
+  thresholds after onset.
+- Diagnoses and antidiabetic medications: from diabetes onset onwards.
+- Moves into the region: for a fraction of patients.
+
+Generation is vectorized, so cohorts with tens of millions of events take
+well under a minute. Lab results are kept in the layout of the warehouse's lab
+results view, so they can also back the pushdown queries.
+"""
+import sqlite3
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    DIABETES_LAB_THRESHOLDS,
+    INEQUALITY_MULTIPLIERS,
+    LAB_RESULTS_VIEW,
+    LabThreshold,
+)
+
+START = pd.Timestamp("2011-01-01")
+END = pd.Timestamp("2022-01-01")
+
+ONE_YEAR_NS = pd.Timedelta(days=365).value
+
+# (mean, standard deviation) of lab results without and with diabetes. With
+# diabetes, about half of the results are above the threshold.
+LAB_RESULT_DISTRIBUTIONS = {
+    "hba1c": ((36.0, 4.0), (50.0, 8.0)),
+    "unscheduled_p_glc": ((6.0, 1.2), (11.0, 3.0)),
+    "fasting_p_glc": ((5.4, 0.5), (7.0, 1.5)),
+    "ogtt": ((6.5, 1.5), (11.0, 3.0)),
+}
+
+# Proportion of results reported as an upper limit, e.g. ">40"
+INEQUALITY_PROP = 0.002
+
+
+@dataclass
+class SyntheticCohort:
+    """Sources of a synthetic cohort. All event tables have a dw_ek_borger
+    column, and are in no particular order."""
+
+    patients: pd.DataFrame
+    """One row per patient, with the observation period, diabetes status and onset."""
+
+    visits: pd.DataFrame
+    """Physical visits to psychiatry, as prediction times: dw_ek_borger, timestamp."""
+
+    lab_results: pd.DataFrame
+    """Lab results in the layout of the lab results view: dw_ek_borger, datotid_sidstesvar,
+    npukode, numerisksvar, and svar for results reported as an inequality."""
+
+    t1d_diagnoses: pd.DataFrame
+    """dw_ek_borger, timestamp, value."""
+
+    t2d_diagnoses: pd.DataFrame
+    """dw_ek_borger, timestamp, value."""
+
+    antidiabetic_medications: pd.DataFrame
+    """dw_ek_borger, timestamp, value."""
+
+    moves: pd.DataFrame
+    """Moves into the region: dw_ek_borger, timestamp."""
+
+    def get_lab_results(self, lab: LabThreshold) -> pd.DataFrame:
+        """Get a lab's results in the layout of the psycop lab loaders, e.g.
+        hba1c(): dw_ek_borger, timestamp, value, with inequalities coerced."""
+        df = self.lab_results[self.lab_results["npukode"].isin(lab.blood_sample_ids)]
+
+        values = df["numerisksvar"]
+        is_inequality = values.isna() & df["svar"].notna()
+        values = values.where(
+            ~is_inequality,
+            df["svar"].str[1:].astype(float) * INEQUALITY_MULTIPLIERS[">"],
+        )
+
+        return pd.DataFrame(
+            {
+                "dw_ek_borger": df["dw_ek_borger"].to_numpy(),
+                "timestamp": df["datotid_sidstesvar"].to_numpy(),
+                "value": values.to_numpy(),
+            },
+        )
+
+    def write_lab_results_view(self, con: sqlite3.Connection) -> None:
+        """Write the lab results to a SQLite database, as a table with the name
+        and layout of the warehouse's lab results view. Its schema must be
+        attached to con."""
+        table_name = LAB_RESULTS_VIEW.replace("[", "").replace("]", "")
+
+        con.execute(
+            f"""CREATE TABLE {table_name} (
+                dw_ek_borger INTEGER,
+                datotid_sidstesvar TEXT,
+                npukode TEXT,
+                numerisksvar REAL,
+                svar TEXT
+            )""",
+        )
+        con.executemany(
+            f"INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?)",
+            zip(
+                self.lab_results["dw_ek_borger"].tolist(),
+                self.lab_results["datotid_sidstesvar"]
+                .dt.strftime("%Y-%m-%d %H:%M:%S")
+                .tolist(),
+                self.lab_results["npukode"].astype(str).tolist(),
+                self.lab_results["numerisksvar"]
+                .astype(object)
+                .where(self.lab_results["numerisksvar"].notna(), None)
+                .tolist(),
+                self.lab_results["svar"].tolist(),
+            ),
+        )
+
+    def get_n_rows(self) -> dict[str, int]:
+        """Number of rows of each source."""
+        return {
+            name: len(getattr(self, name))
+            for name in (
+                "patients",
+                "visits",
+                "lab_results",
+                "t1d_diagnoses",
+                "t2d_diagnoses",
+                "antidiabetic_medications",
+                "moves",
+            )
+        }
+
+
+def _get_negative_binomial_counts(
+    rng: np.random.Generator,
+    means: np.ndarray,
+    dispersion: float = 1.0,
+) -> np.ndarray:
+    """Counts with the given means, overdispersed like the number of contacts per
+    patient. Lower dispersion gives a heavier tail."""
+    return rng.negative_binomial(dispersion, dispersion / (dispersion + means))
+
+
+def _draw_events(
+    rng: np.random.Generator,
+    patient_ids: np.ndarray,
+    counts: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Draw counts events per patient, uniformly between the patient's start and end.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Patient position, patient id and
+            int64 timestamp of each event.
+    """
+    positions = np.repeat(np.arange(len(patient_ids)), counts)
+    starts = starts[positions]
+    timestamps = starts + (rng.random(len(positions)) * (ends[positions] - starts))
+
+    return positions, patient_ids[positions], timestamps.astype(np.int64)
+
+
+def _to_datetime(timestamps: np.ndarray) -> np.ndarray:
+    """Convert int64 timestamps to datetimes, rounded to seconds like the warehouse."""
+    return (timestamps // 10**9 * 10**9).view("datetime64[ns]")
+
+
+def _generate_patients(
+    rng: np.random.Generator,
+    n_patients: int,
+    prevalent_t2d_prop: float,
+    incident_t2d_prop: float,
+    t1d_prop: float,
+) -> pd.DataFrame:
+    start, end = START.value, END.value
+
+    entry = start + (rng.random(n_patients) * 0.6 * (end - start)).astype(np.int64)
+    exit_ = np.minimum(
+        entry + ((0.5 + rng.exponential(6, n_patients)) * ONE_YEAR_NS).astype(np.int64),
+        end,
+    )
+
+    status = rng.choice(
+        ["none", "prevalent_t2d", "incident_t2d", "t1d"],
+        size=n_patients,
+        p=[
+            1 - prevalent_t2d_prop - incident_t2d_prop - t1d_prop,
+            prevalent_t2d_prop,
+            incident_t2d_prop,
+            t1d_prop,
+        ],
+    )
+
+    # Prevalent diabetes started up to 10 years before entry, incident during observation
+    onset = np.full(n_patients, np.iinfo(np.int64).max)
+    is_prevalent = np.isin(status, ["prevalent_t2d", "t1d"])
+    onset[is_prevalent] = entry[is_prevalent] - (
+        rng.random(is_prevalent.sum()) * 10 * ONE_YEAR_NS
+    ).astype(np.int64)
+    is_incident = status == "incident_t2d"
+    onset[is_incident] = entry[is_incident] + (
+        rng.random(is_incident.sum()) * (exit_[is_incident] - entry[is_incident])
+    ).astype(np.int64)
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.permutation(n_patients).astype(np.int64) + 1,
+            "entry": entry,
+            "exit": exit_,
+            "status": pd.Categorical(status),
+            "onset": onset,
+        },
+    )
+
+
+def _generate_lab_results(
+    rng: np.random.Generator,
+    patients: pd.DataFrame,
+    lab_results_per_patient: float,
+) -> pd.DataFrame:
+    has_diabetes = (patients["status"] != "none").to_numpy()
+    patient_ids = patients["dw_ek_borger"].to_numpy()
+    onset = patients["onset"].to_numpy()
+
+    dfs = []
+    for lab in DIABETES_LAB_THRESHOLDS:
+        # Patients with diabetes are measured three times as often
+        means = np.where(has_diabetes, 3.0, 1.0) * lab_results_per_patient
+        means = means / len(DIABETES_LAB_THRESHOLDS) / (1 + 2 * has_diabetes.mean())
+
+        positions, ids, timestamps = _draw_events(
+            rng=rng,
+            patient_ids=patient_ids,
+            counts=_get_negative_binomial_counts(rng, means),
+            starts=patients["entry"].to_numpy(),
+            ends=patients["exit"].to_numpy(),
+        )
+
+        (mean, sd), (diabetic_mean, diabetic_sd) = LAB_RESULT_DISTRIBUTIONS[
+            lab.value_type
+        ]
+        is_diabetic = timestamps >= onset[positions]
+        values = np.where(
+            is_diabetic,
+            rng.normal(diabetic_mean, diabetic_sd, len(ids)),
+            rng.normal(mean, sd, len(ids)),
+        ).round(1)
+
+        is_inequality = rng.random(len(ids)) < INEQUALITY_PROP
+        svar = np.full(len(ids), None, dtype=object)
+        svar[is_inequality] = [
+            f">{value / INEQUALITY_MULTIPLIERS['>']:.0f}"
+            for value in values[is_inequality]
+        ]
+
+        dfs.append(
+            pd.DataFrame(
+                {
+                    "dw_ek_borger": ids,
+                    "datotid_sidstesvar": _to_datetime(timestamps),
+                    "npukode": pd.Categorical.from_codes(
+                        rng.integers(0, len(lab.blood_sample_ids), len(ids)),
+                        categories=list(lab.blood_sample_ids),
+                    ),
+                    "numerisksvar": np.where(is_inequality, np.nan, values),
+                    "svar": svar,
+                },
+            ),
+        )
+
+    df = pd.concat(dfs, ignore_index=True)
+    df["npukode"] = df["npukode"].astype("category")
+
+    return df
+
+
+def _generate_diabetes_events(
+    rng: np.random.Generator,
+    patients: pd.DataFrame,
+    statuses: list[str],
+    mean_events: float,
+    patient_prop: float = 1.0,
+) -> pd.DataFrame:
+    """Events from diabetes onset until the end of observation, for patient_prop
+    of the patients with one of statuses."""
+    patients = patients[
+        patients["status"].isin(statuses) & (rng.random(len(patients)) < patient_prop)
+    ]
+
+    _, ids, timestamps = _draw_events(
+        rng=rng,
+        patient_ids=patients["dw_ek_borger"].to_numpy(),
+        counts=1 + rng.poisson(mean_events - 1, len(patients)),
+        starts=patients["onset"].to_numpy(),
+        ends=np.maximum(patients["exit"].to_numpy(), patients["onset"].to_numpy()),
+    )
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": ids,
+            "timestamp": _to_datetime(timestamps),
+            "value": 1,
+        },
+    )
+
+
+def generate_synthetic_cohort(
+    n_patients: int = 10_000,
+    visits_per_patient: float = 20,
+    lab_results_per_patient: float = 30,
+    prevalent_t2d_prop: float = 0.04,
+    incident_t2d_prop: float = 0.04,
+    t1d_prop: float = 0.005,
+    moved_prop: float = 0.1,
+    seed: int = 0,
+) -> SyntheticCohort:
+    """Generate a synthetic cohort.
+
+    The number of events scales linearly with n_patients, e.g. 1,000,000 patients
+    give about 20 million visits and 30 million lab results with the defaults.
+
+    Args:
+        n_patients (int): Number of patients. Defaults to 10_000.
+        visits_per_patient (float): Mean number of visits per patient. Defaults to 20.
+        lab_results_per_patient (float): Mean number of diabetes lab results per patient, across
+            hba1c and glucose measurements. Defaults to 30.
+        prevalent_t2d_prop (float): Proportion of patients with type 2 diabetes before entry. Defaults to 0.04.
+        incident_t2d_prop (float): Proportion of patients with type 2 diabetes during observation. Defaults to 0.04.
+        t1d_prop (float): Proportion of patients with type 1 diabetes before entry. Defaults to 0.005.
+        moved_prop (float): Proportion of patients that moved into the region. Defaults to 0.1.
+        seed (int): Seed of the random number generator. Defaults to 0.
+
+    Returns:
+        SyntheticCohort: The generated sources.
+    """
+    rng = np.random.default_rng(seed)
+
+    patients = _generate_patients(
+        rng=rng,
+        n_patients=n_patients,
+        prevalent_t2d_prop=prevalent_t2d_prop,
+        incident_t2d_prop=incident_t2d_prop,
+        t1d_prop=t1d_prop,
+    )
+    patient_ids = patients["dw_ek_borger"].to_numpy()
+
+    _, visit_ids, visit_timestamps = _draw_events(
+        rng=rng,
+        patient_ids=patient_ids,
+        counts=_get_negative_binomial_counts(
+            rng,
+            np.full(n_patients, float(visits_per_patient)),
+        ),
+        starts=patients["entry"].to_numpy(),
+        ends=patients["exit"].to_numpy(),
+    )
+
+    moved = patients[rng.random(n_patients) < moved_prop]
+    _, move_ids, move_timestamps = _draw_events(
+        rng=rng,
+        patient_ids=moved["dw_ek_borger"].to_numpy(),
+        counts=1 + rng.poisson(0.3, len(moved)),
+        starts=np.full(len(moved), START.value),
+        ends=np.full(len(moved), END.value),
+    )
+
+    return SyntheticCohort(
+        patients=patients.assign(
+            entry=_to_datetime(patients["entry"].to_numpy()),
+            exit=_to_datetime(patients["exit"].to_numpy()),
+            onset=pd.Series(_to_datetime(patients["onset"].to_numpy())).where(
+                patients["status"] != "none",
+            ),
+        ),
+        visits=pd.DataFrame(
+            {
+                "dw_ek_borger": visit_ids,
+                "timestamp": _to_datetime(visit_timestamps),
+            },
+        ),
+        lab_results=_generate_lab_results(
+            rng=rng,
+            patients=patients,
+            lab_results_per_patient=lab_results_per_patient,
+        ),
+        t1d_diagnoses=_generate_diabetes_events(
+            rng=rng,
+            patients=patients,
+            statuses=["t1d"],
+            mean_events=3,
+        ),
+        t2d_diagnoses=_generate_diabetes_events(
+            rng=rng,
+            patients=patients,
+            statuses=["prevalent_t2d", "incident_t2d"],
+            mean_events=3,
+            patient_prop=0.7,
+        ),
+        antidiabetic_medications=_generate_diabetes_events(
+            rng=rng,
+            patients=patients,
+            statuses=["prevalent_t2d", "incident_t2d", "t1d"],
+            mean_events=8,
+            patient_prop=0.8,
+        ),
+        moves=pd.DataFrame(
+            {
+                "dw_ek_borger": move_ids,
+                "timestamp": _to_datetime(move_timestamps),
+            },
+        ),
+    )
@@ -0,0 +1,38 @@
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pytest
+
+EventsFactory = Callable[..., pd.DataFrame]
+
+
+@pytest.fixture
+def make_events() -> EventsFactory:
+    """Factory of events on whole days, so many share a timestamp, with
+    missing values. Values are multiples of 1/4, so sums are exact in any
+    order."""
+
+    def make(
+        n_rows: int,
+        seed: int = 0,
+        n_patients: int = 30,
+        missing_timestamps: float = 0,
+    ) -> pd.DataFrame:
+        rng = np.random.default_rng(seed)
+        values = rng.integers(-200, 200, n_rows) / 4
+        values[rng.random(n_rows) < 0.3] = np.nan
+        timestamps = pd.Series(
+            pd.Timestamp("2015-01-01")
+            + pd.to_timedelta(rng.integers(0, 1_500, n_rows), unit="D"),
+        )
+
+        return pd.DataFrame(
+            {
+                "dw_ek_borger": rng.integers(0, n_patients, n_rows),
+                "timestamp": timestamps.where(rng.random(n_rows) >= missing_timestamps),
+                "value": values,
+            },
+        )
+
+    return make
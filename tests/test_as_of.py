@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.flattening.as_of import get_nearest_events
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+
+
+def test_nearest_events_respect_window_bounds():
+    day = pd.Timedelta(days=1).value
+    events = PatientSortedEvents(
+        codes=np.array([0, 0, 0, 1]),
+        timestamps=np.array([0, 10, 10, 5]) * day,
+        values=np.array([1.0, 2.0, 3.0, 4.0]),
+    )
+
+    # Patient 0 at day 10, which has two events, and at day 20; patient 2
+    # without events
+    codes = np.array([0, 0, 2])
+    timestamps = np.array([10, 20, 10]) * day
+
+    values, distance, has_event = get_nearest_events(
+        events,
+        codes,
+        timestamps,
+        direction="behind",
+    )
+    # Events at the prediction time are not behind it, and of two events at the
+    # same time the last one is the latest
+    np.testing.assert_array_equal(has_event, [True, True, False])
+    np.testing.assert_array_equal(values[has_event], [1.0, 3.0])
+    np.testing.assert_array_equal(distance[has_event], [10 * day, 10 * day])
+
+    values, distance, has_event = get_nearest_events(
+        events,
+        codes,
+        timestamps,
+        direction="ahead",
+    )
+    np.testing.assert_array_equal(has_event, [False, False, False])
+
+    values, distance, has_event = get_nearest_events(
+        events,
+        np.array([0, 1]),
+        np.array([5, 0]) * day,
+        direction="ahead",
+    )
+    np.testing.assert_array_equal(values, [2.0, 4.0])
+    np.testing.assert_array_equal(distance, [5 * day, 5 * day])
@@ -0,0 +1,163 @@
+import os
+from dataclasses import replace
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from t2d_feature_generation.flattening import planner
+from t2d_feature_generation.flattening.column_cache import ColumnCache
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+
+SPECS = [
+    WindowSpec(
+        loader_name=loader_name,
+        col_name=f"pred_{loader_name}_within_{interval_days}_days_{aggregation}_fallback_nan",
+        interval_days=interval_days,
+        direction="behind",
+        aggregation=aggregation,
+        fallback=np.nan,
+    )
+    for loader_name in ("hba1c", "ldl")
+    for interval_days in (30, 365)
+    for aggregation in ("max", "latest")
+]
+
+
+@pytest.fixture
+def prediction_times() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 20, 200),
+            "timestamp": pd.Timestamp("2015-01-01")
+            + pd.to_timedelta(rng.choice(1_000 * 24, 200, replace=False), unit="h"),
+        },
+    )
+
+
+@pytest.fixture
+def values_df() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 20, 1_000),
+            "timestamp": pd.Timestamp("2014-01-01")
+            + pd.to_timedelta(rng.choice(1_500 * 24, 1_000, replace=False), unit="h"),
+            "value": rng.normal(50, 10, 1_000),
+        },
+    )
+
+
+@pytest.fixture
+def computed_col_names(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Names of the columns computed by the planner, rather than read from the cache."""
+    col_names = []
+    flatten_source = planner._flatten_source
+
+    def spy(**kwargs: Any) -> dict[str, np.ndarray]:
+        col_names.extend(spec.col_name for spec in kwargs["specs"])
+        return flatten_source(**kwargs)
+
+    monkeypatch.setattr(planner, "_flatten_source", spy)
+
+    return col_names
+
+
+def test_column_cache_only_computes_changed_columns(
+    tmp_path: Path,
+    prediction_times: pd.DataFrame,
+    values_df: pd.DataFrame,
+    computed_col_names: list[str],
+):
+    column_cache = ColumnCache(tmp_path)
+    values_by_loader = {"hba1c": values_df, "ldl": values_df.iloc[::2]}
+
+    def flatten(specs: list[WindowSpec]) -> pd.DataFrame:
+        return flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=specs,
+            load_values=lambda spec: values_by_loader[spec.loader_name],
+            column_cache=column_cache,
+        )
+
+    expected = flatten_temporal_specs(
+        prediction_times=prediction_times,
+        specs=SPECS,
+        load_values=lambda spec: values_by_loader[spec.loader_name],
+    )
+    computed_col_names.clear()
+
+    pd.testing.assert_frame_equal(flatten(SPECS), expected)
+    assert computed_col_names == [spec.col_name for spec in SPECS]
+
+    # All columns are cached
+    computed_col_names.clear()
+    pd.testing.assert_frame_equal(flatten(SPECS), expected)
+    assert computed_col_names == []
+
+    # A changed spec is recomputed, even if its column name is the same
+    changed_spec = replace(SPECS[0], fallback=0)
+    computed_col_names.clear()
+    flattened = flatten([changed_spec, *SPECS[1:]])
+    assert computed_col_names == [changed_spec.col_name]
+    pd.testing.assert_series_equal(
+        flattened[changed_spec.col_name],
+        expected[changed_spec.col_name].fillna(0),
+    )
+
+    # Changed values only recompute the columns of their source
+    values_by_loader["ldl"] = values_df.iloc[1::2]
+    computed_col_names.clear()
+    flatten(SPECS)
+    assert computed_col_names == [
+        spec.col_name for spec in SPECS if spec.loader_name == "ldl"
+    ]
+
+
+def test_column_cache_recomputes_for_new_prediction_times(
+    tmp_path: Path,
+    prediction_times: pd.DataFrame,
+    values_df: pd.DataFrame,
+    computed_col_names: list[str],
+):
+    column_cache = ColumnCache(tmp_path)
+
+    for df in (prediction_times, prediction_times.iloc[:100]):
+        computed_col_names.clear()
+        flatten_temporal_specs(
+            prediction_times=df,
+            specs=SPECS,
+            load_values=lambda _: values_df,
+            column_cache=column_cache,
+        )
+        assert computed_col_names == [spec.col_name for spec in SPECS]
+
+    assert column_cache.clear() == 2 * len(SPECS)
+
+
+def test_column_cache_evicts_least_recently_used(tmp_path: Path):
+    column_cache = ColumnCache(tmp_path)
+    column = np.linspace(0, 1, 1_000)
+    keys = [f"hba1c-{i}" for i in range(3)]
+
+    column_cache.write(keys[0], column)
+    column_cache.write(keys[1], column)
+    column_size = column_cache.get_size_bytes() // 2
+    column_cache.max_size_bytes = 2 * column_size
+
+    # Make the second column the least recently used
+    os.utime(tmp_path / f"{keys[1]}.arrow", (0, 0))
+    column_cache.write(keys[2], column)
+
+    assert column_cache.read(keys[0]) is not None
+    assert column_cache.read(keys[1]) is None
+    assert column_cache.read(keys[2]) is not None
+    assert column_cache.get_size_bytes() <= column_cache.max_size_bytes
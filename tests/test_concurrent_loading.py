@@ -0,0 +1,64 @@
+import threading
+from typing import Callable
+
+import pandas as pd
+import pytest
+
+from t2d_feature_generation.concurrent_loading import LoaderError, load_concurrently
+from t2d_feature_generation.outcome_specification.first_event import (
+    combine_first_events,
+)
+
+
+def make_loader(
+    df: pd.DataFrame,
+    barrier: threading.Barrier,
+) -> Callable[[], pd.DataFrame]:
+    def loader() -> pd.DataFrame:
+        # Only passes if all loaders run at the same time
+        barrier.wait(timeout=5)
+        return df
+
+    return loader
+
+
+def test_load_concurrently_keeps_source_order():
+    dfs = {
+        "t1d_diagnoses": pd.DataFrame(
+            {"dw_ek_borger": [1], "timestamp": pd.to_datetime(["2020-01-01"])},
+        ),
+        "t2d_diagnoses": pd.DataFrame(
+            {"dw_ek_borger": [1, 2], "timestamp": pd.to_datetime(["2020-01-01"] * 2)},
+        ),
+        "medications": pd.DataFrame(
+            {"dw_ek_borger": [2], "timestamp": pd.to_datetime(["2019-01-01"])},
+        ),
+    }
+    barrier = threading.Barrier(len(dfs))
+
+    loaded = load_concurrently(
+        {name: make_loader(df, barrier) for name, df in dfs.items()},
+        max_workers=len(dfs),
+    )
+
+    assert list(loaded) == list(dfs)
+    pd.testing.assert_frame_equal(
+        combine_first_events(loaded),
+        combine_first_events(dfs),
+    )
+
+
+def test_load_concurrently_propagates_errors():
+    def failing_loader() -> pd.DataFrame:
+        raise ConnectionError("Warehouse unavailable")
+
+    with pytest.raises(LoaderError, match="medications") as exc_info:
+        load_concurrently(
+            {
+                "t1d_diagnoses": pd.DataFrame,
+                "medications": failing_loader,
+            },
+            max_workers=1,
+        )
+
+    assert isinstance(exc_info.value.__cause__, ConnectionError)
@@ -0,0 +1,201 @@
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from psycop_feature_generation.application_modules.project_setup import ProjectInfo
+from timeseriesflattener.feature_spec_objects import PredictorSpec
+
+from t2d_feature_generation.dtypes import (
+    compact_flattened_df,
+    get_compact_dtype,
+    get_memory_report,
+)
+from t2d_feature_generation.flattening import flatten
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+
+
+def make_synthetic_data() -> tuple[pd.DataFrame, dict[str, pd.DataFrame]]:
+    rng = np.random.default_rng(0)
+    start = pd.Timestamp("2015-01-01")
+
+    prediction_times = pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 30, 500),
+            "timestamp": start + pd.to_timedelta(rng.integers(0, 3 * 365, 500), "D"),
+        },
+    )
+
+    def make_events(values: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "dw_ek_borger": rng.integers(0, 30, len(values)),
+                "timestamp": start
+                + pd.to_timedelta(rng.integers(0, 3 * 365, len(values)), "D"),
+                "value": values,
+            },
+        )
+
+    events = {
+        "statins": make_events(np.ones(300)),
+        "hba1c": make_events(rng.normal(45, 10, 1_000)),
+    }
+
+    return prediction_times, events
+
+
+def test_compact_dtypes_keep_values():
+    prediction_times, events = make_synthetic_data()
+    specs = [
+        WindowSpec(
+            loader_name=loader_name,
+            col_name=f"pred_{loader_name}_within_{interval_days}_days_{aggregation}_fallback_{fallback}",
+            interval_days=interval_days,
+            direction="behind",
+            aggregation=aggregation,
+            fallback=fallback,
+        )
+        for loader_name, fallback in (("statins", 0), ("hba1c", np.nan))
+        for interval_days in (30, 365)
+        for aggregation in ("max", "mean", "latest")
+    ]
+    compact_specs = [
+        replace(spec, dtype=get_compact_dtype(spec.aggregation, spec.fallback))
+        for spec in specs
+    ]
+
+    flattened = flatten_temporal_specs(
+        prediction_times=prediction_times,
+        specs=specs,
+        load_values=lambda spec: events[spec.loader_name],
+    )
+    compact = flatten_temporal_specs(
+        prediction_times=prediction_times,
+        specs=compact_specs,
+        load_values=lambda spec: events[spec.loader_name],
+    )
+
+    for spec in specs:
+        expected_dtype = "int8" if spec.loader_name == "statins" else "float32"
+        assert compact[spec.col_name].dtype == expected_dtype
+
+        np.testing.assert_allclose(
+            compact[spec.col_name],
+            flattened[spec.col_name],
+            rtol=1e-6,
+        )
+
+
+def test_create_flattened_dataset_with_compact_dtypes(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    prediction_times, events = make_synthetic_data()
+    monkeypatch.setattr(
+        flatten,
+        "birthdays",
+        lambda: pd.DataFrame(
+            {
+                "dw_ek_borger": np.arange(30),
+                "date_of_birth": pd.Timestamp("1960-01-01"),
+            },
+        ),
+    )
+    specs = [
+        PredictorSpec(
+            values_df=events[loader_name],
+            feature_name=loader_name,
+            lookbehind_days=365,
+            resolve_multiple_fn=resolve_multiple_fn,
+            fallback=fallback,
+            prefix="pred",
+        )
+        for loader_name, fallback in (("statins", 0), ("hba1c", np.nan))
+        # Variance is left to timeseriesflattener
+        for resolve_multiple_fn in ("max", "variance")
+    ]
+
+    flattened_df = flatten.create_flattened_dataset(
+        feature_specs=specs,
+        prediction_times_df=prediction_times.drop_duplicates(),
+        project_info=ProjectInfo(
+            project_name="t2d",
+            project_path=tmp_path,
+            feature_set_path=tmp_path,
+            feature_set_prefix="t2d",
+        ),
+        compact_dtypes=True,
+    )
+
+    assert flattened_df["dw_ek_borger"].dtype == "int32"
+    assert flattened_df["pred_age_in_years"].dtype == "float32"
+    for spec in specs:
+        expected_dtype = (
+            "int8"
+            if spec.feature_name == "statins" and spec.key_for_resolve_multiple == "max"
+            else "float32"
+        )
+        assert flattened_df[spec.get_col_str()].dtype == expected_dtype
+
+
+def test_lossy_dichotomous_cast_raises():
+    prediction_times, events = make_synthetic_data()
+    # Max of lab values is not dichotomous, even with a 0 fallback
+    spec = WindowSpec(
+        loader_name="hba1c",
+        col_name="pred_hba1c_within_365_days_max_fallback_0",
+        interval_days=365,
+        direction="behind",
+        aggregation="max",
+        fallback=0,
+        dtype="int8",
+    )
+
+    with pytest.raises(ValueError, match="pred_hba1c_within_365_days_max"):
+        flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=[spec],
+            load_values=lambda _: events["hba1c"],
+        )
+
+
+def test_compact_flattened_df_and_memory_report():
+    n_rows = 1_000
+    df = pd.DataFrame(
+        {
+            "dw_ek_borger": np.arange(n_rows, dtype=np.int64),
+            "timestamp": pd.Timestamp("2015-01-01"),
+            "outc_t2d_within_365_days_max_fallback_0_dichotomous": np.tile(
+                [0, 1],
+                n_rows // 2,
+            ),
+            "pred_age_in_years": np.linspace(18, 90, n_rows),
+            "source": np.tile(["t2d_diagnoses", "lab_results"], n_rows // 2),
+        },
+    )
+
+    compact = compact_flattened_df(
+        df,
+        dtypes={"outc_t2d_within_365_days_max_fallback_0_dichotomous": "int8"},
+    )
+
+    assert compact.dtypes.astype(str).to_dict() == {
+        "dw_ek_borger": "int32",
+        "timestamp": "datetime64[ns]",
+        "outc_t2d_within_365_days_max_fallback_0_dichotomous": "int8",
+        "pred_age_in_years": "float32",
+        "source": "category",
+    }
+
+    report = get_memory_report(compact)
+    assert report.loc["total", "n_columns"] == len(df.columns)
+    # The baseline is the memory of the frame without the policy
+    assert report.loc["total", "baseline_mb"] == pytest.approx(
+        df.memory_usage(index=False, deep=True).sum() / 1024**2,
+        abs=1e-3,
+    )
+    assert report.loc["total", "mb"] < report.loc["total", "baseline_mb"] / 2
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.eligibility import get_eligible_prediction_times
+from t2d_feature_generation.utils_for_testing import str_to_df
+
+
+def test_get_eligible_prediction_times():
+    prediction_times = str_to_df(
+        """dw_ek_borger,timestamp,
+        1,2012-06-01,
+        1,2014-01-01,
+        2,2014-01-01,
+        3,2014-01-01,
+        3,2016-01-01,
+        4,2014-01-01,
+        4,2016-01-01,
+        5,2014-01-01,
+        """,
+    )
+    first_diabetes_indicator = str_to_df(
+        """dw_ek_borger,timestamp,
+        2,2012-01-01,
+        3,2015-01-01,
+        """,
+    )
+    first_diabetes_lab_result = str_to_df(
+        """dw_ek_borger,timestamp,
+        3,2015-01-01,
+        """,
+    )
+    quarantine_timestamps = str_to_df(
+        """dw_ek_borger,timestamp,
+        4,2013-06-01,
+        5,2014-01-01,
+        """,
+    )
+
+    eligible, funnel = get_eligible_prediction_times(
+        prediction_times=prediction_times,
+        first_diabetes_indicator=first_diabetes_indicator,
+        first_diabetes_lab_result=first_diabetes_lab_result,
+        quarantine_timestamps=quarantine_timestamps,
+    )
+
+    expected = str_to_df(
+        """dw_ek_borger,timestamp,
+        1,2014-01-01,
+        3,2014-01-01,
+        4,2016-01-01,
+        5,2014-01-01,
+        """,
+    )
+    pd.testing.assert_frame_equal(eligible, expected)
+    assert funnel["n_excluded"].tolist() == [0, 1, 1, 1, 1]
+    assert funnel["n_remaining"].tolist() == [8, 7, 6, 5, 4]
+
+
+def test_quarantine_matches_merge():
+    rng = np.random.default_rng(42)
+    origin = pd.Timestamp("2014-01-01")
+    prediction_times = pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 100, 2_000),
+            "timestamp": origin + pd.to_timedelta(rng.integers(0, 5_000, 2_000), "h"),
+        },
+    )
+    quarantine_timestamps = pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 150, 300),
+            "timestamp": origin
+            + pd.to_timedelta(rng.integers(-5_000, 5_000, 300), "h"),
+        },
+    )
+    quarantine_days = 30
+
+    eligible, _ = get_eligible_prediction_times(
+        prediction_times=prediction_times,
+        first_diabetes_indicator=prediction_times.iloc[:0],
+        first_diabetes_lab_result=prediction_times.iloc[:0],
+        quarantine_timestamps=quarantine_timestamps,
+        quarantine_days=quarantine_days,
+    )
+
+    # Reference: the merge used by PredictionTimeFilterer
+    df = prediction_times.reset_index().merge(
+        quarantine_timestamps,
+        on="dw_ek_borger",
+        how="left",
+        suffixes=("", "_quarantine"),
+    )
+    days_since_quarantine = (df["timestamp"] - df["timestamp_quarantine"]).dt.days
+    hit = df.loc[
+        (days_since_quarantine > 0) & (days_since_quarantine < quarantine_days),
+        "index",
+    ]
+    expected = prediction_times.drop(index=hit.unique()).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(eligible, expected)
@@ -0,0 +1,132 @@
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from timeseriesflattener.feature_spec_objects import PredictorSpec
+
+from t2d_feature_generation.event_table import EventTable
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+from t2d_feature_generation.flattening.flatten import flatten_with_planner
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+from t2d_feature_generation.utils_for_testing import str_to_df
+
+
+def test_event_table_is_sorted_by_patient_and_time():
+    frames = {
+        "diagnoses": str_to_df(
+            """dw_ek_borger,timestamp,
+            2,2021-01-03,
+            1,2021-01-02,
+            3,NaN,
+            """,
+        ),
+        "lab_results": str_to_df(
+            """dw_ek_borger,timestamp,value,
+            1,2021-01-02,7,
+            2,2021-01-01,5,
+            1,2021-01-01,6,
+            """,
+        ),
+    }
+
+    table = EventTable.from_frames(frames)
+
+    assert table.patients.tolist() == [1, 2]
+    assert table.sources == ["diagnoses", "lab_results"]
+    np.testing.assert_array_equal(table.codes, [0, 0, 0, 1, 1])
+    np.testing.assert_array_equal(
+        table.timestamps.view("datetime64[ns]"),
+        pd.to_datetime(
+            ["2021-01-01", "2021-01-02", "2021-01-02", "2021-01-01", "2021-01-03"],
+        ),
+    )
+    # Ties on timestamp are in the order of the sources
+    np.testing.assert_array_equal(table.source_codes, [1, 0, 1, 1, 0])
+    np.testing.assert_array_equal(table.values, [6, np.nan, 7, 5, np.nan])
+    np.testing.assert_array_equal(table.offsets, [0, 3, 5])
+    np.testing.assert_array_equal(table.get_first_positions(), [0, 3])
+
+    assert table.codes.dtype == np.int32
+    assert table.timestamps.dtype == np.int64
+    assert table.values.dtype == np.float64
+
+
+def test_event_table_can_store_float32_values():
+    frames = {
+        "lab_results": str_to_df(
+            """dw_ek_borger,timestamp,value,
+            1,2021-01-01,6.5,
+            """,
+        ),
+    }
+
+    table = EventTable.from_frames(frames, value_dtype=np.float32)
+
+    assert table.values.dtype == np.float32
+    np.testing.assert_array_equal(table.values, [6.5])
+
+
+def test_source_events_match_sorting_each_source(
+    make_events: Callable[..., pd.DataFrame],
+):
+    frames = {
+        source: make_events(2_000, seed, n_patients=60, missing_timestamps=0.02)
+        for seed, source in enumerate("abc")
+    }
+    patients = pd.Index(np.arange(0, 60, 2))
+
+    table = EventTable.from_frames(frames, patients=patients)
+
+    for source, df in frames.items():
+        events = PatientSortedEvents.from_event_table(table, source)
+        expected = PatientSortedEvents.from_df(df, patients=patients)
+
+        np.testing.assert_array_equal(events.codes, expected.codes)
+        np.testing.assert_array_equal(events.timestamps, expected.timestamps)
+        np.testing.assert_array_equal(events.values, expected.values)
+
+
+def test_flatten_with_planner_reads_the_event_table(
+    make_events: Callable[..., pd.DataFrame],
+):
+    prediction_times = make_events(
+        400,
+        seed=10,
+        n_patients=60,
+        missing_timestamps=0.02,
+    )[["dw_ek_borger", "timestamp"]]
+    prediction_times = prediction_times.dropna().reset_index(drop=True)
+    values_by_loader_name = {
+        loader_name: make_events(3_000, seed, n_patients=60, missing_timestamps=0.02)
+        for seed, loader_name in enumerate(["hba1c", "ldl"])
+    }
+    specs = [
+        PredictorSpec(
+            values_df=values_df,
+            feature_name=loader_name,
+            lookbehind_days=interval_days,
+            resolve_multiple_fn=resolve_multiple_fn,
+            fallback=np.nan,
+            prefix="pred",
+        )
+        for loader_name, values_df in values_by_loader_name.items()
+        for interval_days in (30, 365)
+        for resolve_multiple_fn in ("max", "mean", "latest", "count")
+    ]
+
+    flattened_df = flatten_with_planner(
+        flattened_df=prediction_times,
+        specs=specs,
+        entity_id_col_name="dw_ek_borger",
+        timestamp_col_name="timestamp",
+    )
+
+    expected = flatten_temporal_specs(
+        prediction_times=prediction_times,
+        specs=[WindowSpec.from_spec(spec) for spec in specs],
+        load_values=lambda spec: values_by_loader_name[spec.loader_name],
+    )
+    pd.testing.assert_frame_equal(flattened_df[expected.columns], expected)
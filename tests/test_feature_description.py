@@ -0,0 +1,183 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from psycop_feature_generation.data_checks.flattened import feature_describer
+from psycop_feature_generation.data_checks.flattened.feature_describer import (
+    UNICODE_HIST,
+    create_unicode_hist,
+)
+from timeseriesflattener.feature_spec_objects import PredictorSpec, StaticSpec
+
+from t2d_feature_generation.feature_description import (
+    ColumnSketch,
+    describe_columns,
+    generate_feature_description_row,
+    save_feature_descriptive_stats_from_dir,
+)
+
+
+def make_feature_set(n_rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    lab_results = rng.lognormal(3.5, 0.3, n_rows)
+    lab_results[rng.random(n_rows) < 0.3] = np.nan
+
+    return pd.DataFrame(
+        {
+            "pred_hba1c_within_730_days_max_fallback_nan": lab_results,
+            "pred_f0_disorders_within_730_days_max_fallback_0": rng.integers(
+                0,
+                2,
+                n_rows,
+            ).astype("int8"),
+            "pred_sex_female": rng.integers(0, 2, n_rows).astype(bool),
+            "pred_age_in_years": rng.normal(size=n_rows).astype("float32"),
+        },
+    )
+
+
+def test_merged_sketches_match_exact_statistics(tmp_path: Path):
+    df = make_feature_set(20_000)
+    paths = []
+    for i, part in enumerate(np.array_split(df, 3)):
+        paths.append(tmp_path / f"train_{i}.parquet")
+        part.to_parquet(paths[-1], row_group_size=1_000)
+
+    sketches = describe_columns(
+        paths=paths,
+        fallbacks={
+            "pred_hba1c_within_730_days_max_fallback_nan": np.nan,
+            "pred_f0_disorders_within_730_days_max_fallback_0": 0.0,
+            "pred_age_in_years": None,
+        },
+        max_workers=2,
+        columns_per_task=2,
+    )
+
+    for col_name, sketch in sketches.items():
+        series = df[col_name].astype(np.float64)
+
+        assert sketch.n == len(series)
+        assert sketch.n_nan == series.isna().sum()
+        assert sketch.mean == pytest.approx(series.mean())
+        assert sketch.min == series.min()
+        assert sketch.max == series.max()
+        for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+            assert sketch.quantiles.quantile(q) == pytest.approx(
+                series.dropna().quantile(q, interpolation="lower"),
+                rel=0.01,
+                abs=1e-9,
+            )
+
+    assert sketches["pred_hba1c_within_730_days_max_fallback_nan"].n_fallback == (
+        df["pred_hba1c_within_730_days_max_fallback_nan"].isna().sum()
+    )
+    assert sketches["pred_f0_disorders_within_730_days_max_fallback_0"].n_fallback == (
+        (df["pred_f0_disorders_within_730_days_max_fallback_0"] == 0).sum()
+    )
+
+
+def test_distinct_count_and_histogram():
+    values = np.random.default_rng(1).normal(size=100_000)
+    values[:50_000] = np.round(values[:50_000], 1)
+
+    sketch = ColumnSketch()
+    for chunk in np.array_split(values, 7):
+        sketch.update(chunk)
+
+    # Exact for few distinct values, an estimate for many
+    rounded = ColumnSketch()
+    rounded.update(values[:50_000])
+    assert rounded.distinct.estimate() == len(np.unique(values[:50_000]))
+    assert sketch.distinct.estimate() == pytest.approx(
+        len(np.unique(values)),
+        rel=0.1,
+    )
+
+    # Bin heights are approximate, by at most one level
+    levels = {char: level for level, char in UNICODE_HIST.items()}
+    histogram = sketch.get_unicode_histogram()
+    expected = create_unicode_hist(pd.Series(values))[0]
+    assert len(histogram) == len(expected) == 8
+    for char, expected_char in zip(histogram, expected):
+        assert abs(levels[char] - levels[expected_char]) <= 1 / 8
+
+
+def test_description_row_matches_psycop():
+    rng = np.random.default_rng(2)
+    series = pd.Series(rng.integers(0, 20, 5_000).astype(np.float64))
+    series[rng.random(len(series)) < 0.2] = np.nan
+    spec = PredictorSpec(
+        values_df=pd.DataFrame(columns=["dw_ek_borger", "timestamp", "value"]),
+        feature_name="hba1c",
+        lookbehind_days=730,
+        resolve_multiple_fn="max",
+        fallback=0,
+    )
+    sketch = ColumnSketch(fallback=0)
+    sketch.update(series.to_numpy())
+
+    row = generate_feature_description_row(sketch=sketch, spec=spec)
+
+    expected = feature_describer.generate_feature_description_row(
+        series=series,
+        predictor_spec=spec,
+    )
+    assert row.keys() == expected.keys()
+    # Histogram and percentiles are approximate
+    for key in (
+        "Predictor df",
+        "Lookbehind days",
+        "Resolve multiple",
+        "N unique",
+        "Fallback strategy",
+        "Proportion missing",
+        "Mean",
+        "Proportion using fallback",
+    ):
+        assert row[key] == pytest.approx(expected[key]), key
+    assert row["Resolve multiple"] == "maximum"
+
+
+def test_save_descriptive_stats(tmp_path: Path):
+    df = make_feature_set(1_000)
+    df.to_parquet(tmp_path / "t2d_features_train.parquet")
+    specs = [
+        PredictorSpec(
+            values_loader=None,
+            values_df=pd.DataFrame(columns=["dw_ek_borger", "timestamp", "value"]),
+            feature_name=feature_name,
+            lookbehind_days=730,
+            resolve_multiple_fn="max",
+            fallback=fallback,
+        )
+        for feature_name, fallback in (("hba1c", np.nan), ("f0_disorders", 0))
+    ] + [
+        StaticSpec(
+            values_df=pd.DataFrame(columns=["dw_ek_borger", "sex_female"]),
+            input_col_name_override="sex_female",
+            feature_name="sex_female",
+            prefix="pred",
+        ),
+    ]
+
+    save_feature_descriptive_stats_from_dir(
+        feature_set_dir=tmp_path,
+        feature_specs=specs,
+        max_workers=1,
+    )
+
+    description = pd.read_csv(
+        tmp_path
+        / "feature_set_descriptive_stats"
+        / "train_feature_descriptive_stats.csv",
+        index_col="Predictor df",
+    )
+    assert description.loc["f0_disorders", "N unique"] == 2
+    assert description.loc["hba1c", "Proportion using fallback"] == round(
+        df["pred_hba1c_within_730_days_max_fallback_nan"].isna().mean(),
+        2,
+    )
+    # Static specs have no fallback, written as N/A
+    assert pd.isna(description.loc["sex_female", "Fallback strategy"])
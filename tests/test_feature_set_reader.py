@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from t2d_feature_generation.feature_set_reader import FeatureSetReader
+
+
+@pytest.fixture
+def feature_set_dir(tmp_path: Path) -> Path:
+    rng = np.random.default_rng(0)
+
+    for split, ids in (("train", range(60)), ("val", range(60, 80))):
+        n_rows = len(ids) * 10
+        df = pd.DataFrame(
+            {
+                "dw_ek_borger": np.repeat(np.array(ids), 10),
+                "timestamp": pd.Timestamp("2015-01-01")
+                + pd.to_timedelta(rng.integers(0, 1_000, n_rows), unit="D"),
+                "outc_t2d_within_1095_days_max_fallback_0_dichotomous": rng.integers(
+                    0,
+                    2,
+                    n_rows,
+                ),
+                **{f"pred_{i}": rng.normal(size=n_rows) for i in range(20)},
+            },
+        )
+        df.to_parquet(tmp_path / f"t2d_features_{split}.parquet", row_group_size=100)
+
+    return tmp_path
+
+
+def test_reads_projected_columns_across_splits(feature_set_dir: Path):
+    reader = FeatureSetReader(feature_set_dir, splits=("train", "val"))
+    columns = ["dw_ek_borger", "timestamp", "pred_3"]
+
+    expected = pd.concat(
+        [
+            pd.read_parquet(feature_set_dir / f"t2d_features_{split}.parquet")
+            for split in ("train", "val")
+        ],
+        ignore_index=True,
+    )[columns]
+
+    pd.testing.assert_frame_equal(reader.read(columns=columns), expected)
+
+    batches = list(reader.iter_batches(columns=columns, batch_size=50))
+    assert all(list(batch.columns) == columns for batch in batches)
+    assert max(len(batch) for batch in batches) == 50
+
+
+def test_filters_are_pushed_down_to_row_groups(feature_set_dir: Path):
+    reader = FeatureSetReader(feature_set_dir, splits=("train", "val"))
+    columns = ["dw_ek_borger", "timestamp"]
+    all_rows = reader.read(columns=columns)
+
+    # Ids are sorted within files, so rows of an id are within one or two row groups
+    ids = [12, 70]
+    fragments = reader.get_fragments(reader.get_filter(ids=ids, for_row_groups=True))
+    assert [fragment.num_row_groups for fragment in fragments] == [1, 1]
+    assert [fragment.num_row_groups for fragment in reader.get_fragments()] == [6, 2]
+
+    start, end = pd.Timestamp("2016-01-01"), pd.Timestamp("2016-07-01")
+    filtered = reader.read(columns=columns, ids=ids, start=start, end=end)
+    expected = all_rows[
+        all_rows["dw_ek_borger"].isin(ids)
+        & (all_rows["timestamp"] >= start)
+        & (all_rows["timestamp"] < end)
+    ].reset_index(drop=True)
+
+    assert len(filtered) > 0
+    pd.testing.assert_frame_equal(filtered, expected)
+
+    # No matches keeps the columns and dtypes
+    empty = reader.read(columns=columns, ids=[1_000])
+    assert len(empty) == 0
+    assert empty.dtypes.to_dict() == all_rows.dtypes.to_dict()
+
+
+def test_missing_split_raises(feature_set_dir: Path):
+    with pytest.raises(FileNotFoundError, match="test"):
+        FeatureSetReader(feature_set_dir, splits=("train", "test"))
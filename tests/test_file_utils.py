@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+from t2d_feature_generation.file_utils import atomic_write, atomic_write_dir
+
+
+def fail_writing_file(path: Path) -> None:
+    with atomic_write(path) as tmp_path:
+        tmp_path.write_text("partial")
+        raise RuntimeError
+
+
+def fail_writing_dir(path: Path) -> None:
+    with atomic_write_dir(path) as tmp_dir:
+        (tmp_dir / "year=2016").mkdir()
+        raise RuntimeError
+
+
+def test_atomic_write_replaces_on_success_only(tmp_path: Path):
+    path = tmp_path / "entry.parquet"
+    path.write_text("old")
+
+    with pytest.raises(RuntimeError):
+        fail_writing_file(path)
+
+    assert path.read_text() == "old"
+
+    with atomic_write(path) as tmp_path_:
+        tmp_path_.write_text("new")
+
+    assert path.read_text() == "new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_atomic_write_dir_swaps_directories(tmp_path: Path):
+    split_dir = tmp_path / "train"
+    (split_dir / "year=2015").mkdir(parents=True)
+    (split_dir / "year=2015" / "part-0.parquet").write_text("old")
+
+    with pytest.raises(RuntimeError):
+        fail_writing_dir(split_dir)
+
+    assert [path.name for path in split_dir.iterdir()] == ["year=2015"]
+
+    with atomic_write_dir(split_dir) as tmp_dir:
+        (tmp_dir / "year=2016").mkdir()
+        (tmp_dir / "year=2016" / "part-0.parquet").write_text("new")
+        # The old split is still in place while the new one is written
+        assert (split_dir / "year=2015").exists()
+
+    assert [path.name for path in split_dir.iterdir()] == ["year=2016"]
+    assert list(tmp_path.iterdir()) == [split_dir]
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.outcome_specification.first_event import (
+    combine_first_events,
+    get_first_event_per_patient,
+)
+from t2d_feature_generation.utils_for_testing import str_to_df
+
+
+def test_get_first_event_per_patient():
+    df = str_to_df(
+        """dw_ek_borger,timestamp,value,
+        2,2021-01-03,3,
+        1,2021-01-02,2,
+        2,2021-01-01,1,
+        1,2021-01-02,4,
+        1,NaN,5,
+        3,NaN,6,
+        """,
+    )
+
+    first_events = get_first_event_per_patient(df)
+
+    expected = str_to_df(
+        """dw_ek_borger,timestamp,value,
+        1,2021-01-02,2,
+        2,2021-01-01,1,
+        """,
+    )
+    pd.testing.assert_frame_equal(first_events, expected, check_dtype=False)
+
+
+def test_get_first_event_per_patient_matches_sort_and_groupby():
+    rng = np.random.default_rng(42)
+    n_rows = 10_000
+    df = pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 500, n_rows),
+            "timestamp": pd.Timestamp("2010-01-01")
+            + pd.to_timedelta(rng.permutation(n_rows), unit="h"),
+            "value": rng.normal(size=n_rows),
+        },
+    )
+
+    expected = (
+        df.sort_values("timestamp")
+        .groupby("dw_ek_borger")
+        .first()
+        .reset_index(drop=False)
+    )
+
+    pd.testing.assert_frame_equal(get_first_event_per_patient(df), expected)
+
+
+def test_combine_first_events():
+    t1d = str_to_df(
+        """dw_ek_borger,timestamp,
+        1,2021-01-02,
+        2,2021-01-05,
+        """,
+    )
+    lab_results = str_to_df(
+        """dw_ek_borger,timestamp,value,
+        1,2021-01-02,1,
+        2,2021-01-03,1,
+        3,2021-01-01,1,
+        """,
+    )
+
+    combined = combine_first_events({"t1d": t1d, "lab_results": lab_results})
+
+    expected = str_to_df(
+        """dw_ek_borger,timestamp,source,
+        1,2021-01-02,t1d,
+        2,2021-01-03,lab_results,
+        3,2021-01-01,lab_results,
+        """,
+    )
+    expected["source"] = pd.Categorical(
+        expected["source"],
+        categories=["t1d", "lab_results"],
+    )
+    pd.testing.assert_frame_equal(combined, expected, check_dtype=False)
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+import pytest
+from timeseriesflattener.feature_spec_objects import OutcomeSpec
+from timeseriesflattener.flattened_dataset import TimeseriesFlattener
+
+from t2d_feature_generation.flattening.flatten import flatten_with_incident_engine
+from t2d_feature_generation.flattening.incident_outcomes import (
+    IncidentOutcomeSpec,
+    flatten_incident_outcomes,
+    get_time_to_event_col_names,
+)
+
+
+@pytest.fixture
+def prediction_times() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n_prediction_times = 500
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 60, n_prediction_times),
+            "timestamp": pd.Timestamp("2015-01-01")
+            + pd.to_timedelta(
+                rng.choice(3_000 * 24, n_prediction_times, replace=False),
+                unit="h",
+            ),
+        },
+    )
+
+
+@pytest.fixture
+def values_df() -> pd.DataFrame:
+    """First event of 40 of the 60 patients, one of them on a prediction time."""
+    rng = np.random.default_rng(1)
+    timestamps = pd.Timestamp("2016-01-01") + pd.to_timedelta(
+        rng.integers(0, 3_000 * 24, 40),
+        unit="h",
+    )
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.choice(60, 40, replace=False),
+            "timestamp": timestamps,
+            "value": 1,
+        },
+    )
+
+
+def get_specs(values_df: pd.DataFrame) -> list[OutcomeSpec]:
+    return [
+        OutcomeSpec(
+            values_df=values_df,
+            feature_name="first_diabetes_lab_result",
+            lookahead_days=year * 365,
+            resolve_multiple_fn="max",
+            fallback=0,
+            incident=True,
+            allowed_nan_value_prop=0,
+            prefix="outc",
+        )
+        for year in (1, 2, 3, 4, 5)
+    ]
+
+
+def test_engine_matches_timeseriesflattener(
+    prediction_times: pd.DataFrame,
+    values_df: pd.DataFrame,
+):
+    # An event at a prediction time is kept, and is an outcome
+    values_df.loc[0, "timestamp"] = prediction_times.loc[
+        prediction_times["dw_ek_borger"] == values_df.loc[0, "dw_ek_borger"],
+        "timestamp",
+    ].iloc[0]
+    specs = get_specs(values_df)
+
+    # timeseriesflattener adds a prediction_time_uuid column in place
+    flattener = TimeseriesFlattener(
+        prediction_times_df=prediction_times.copy(),
+        entity_id_col_name="dw_ek_borger",
+        drop_pred_times_with_insufficient_look_distance=False,
+    )
+    flattener.add_spec(specs)
+    expected = flattener.get_df()
+
+    flattened_df = flatten_with_incident_engine(
+        flattened_df=prediction_times,
+        specs=specs,
+        entity_id_col_name="dw_ek_borger",
+        timestamp_col_name="timestamp",
+    )
+
+    col_names = [spec.get_col_str() for spec in specs]
+    assert list(flattened_df.columns) == ["dw_ek_borger", "timestamp", *col_names]
+    assert 0 < len(flattened_df) < len(prediction_times)
+    pd.testing.assert_frame_equal(
+        flattened_df.reset_index(drop=True),
+        expected[list(flattened_df.columns)].reset_index(drop=True),
+    )
+
+
+def test_time_to_event_is_censored_at_the_largest_lookahead(
+    prediction_times: pd.DataFrame,
+    values_df: pd.DataFrame,
+):
+    specs = get_specs(values_df)
+    flattened_df = flatten_with_incident_engine(
+        flattened_df=prediction_times,
+        specs=specs,
+        entity_id_col_name="dw_ek_borger",
+        timestamp_col_name="timestamp",
+        time_to_event_prefix="eval",
+        compact_dtypes=True,
+    )
+
+    assert get_time_to_event_col_names(specs, prefix="eval") == [
+        "eval_days_to_first_diabetes_lab_result",
+    ]
+    days_to_event = flattened_df["eval_days_to_first_diabetes_lab_result"]
+    assert days_to_event.dtype == np.float32
+    assert flattened_df[specs[0].get_col_str()].dtype == np.int8
+
+    merged = flattened_df.merge(values_df, on="dw_ek_borger", how="left")
+    expected = (merged["timestamp_y"] - merged["timestamp_x"]) / pd.Timedelta(days=1)
+    expected[expected >= 5 * 365] = np.nan
+    np.testing.assert_allclose(days_to_event, expected, rtol=1e-6)
+
+    # The 5 year outcome is 1 exactly when the event is within the censoring horizon
+    np.testing.assert_array_equal(
+        flattened_df[specs[-1].get_col_str()],
+        days_to_event.notna(),
+    )
+
+
+def test_sources_are_joined_separately(prediction_times: pd.DataFrame):
+    first_events = {
+        loader_name: pd.DataFrame(
+            {
+                "dw_ek_borger": [patient, 59],
+                "timestamp": pd.to_datetime([timestamp, "2030-01-01"]),
+            },
+        )
+        for loader_name, patient, timestamp in (
+            ("t2d", 1, "2016-01-01"),
+            ("t1d", 2, "2017-01-01"),
+        )
+    }
+    specs = [
+        IncidentOutcomeSpec(
+            loader_name=loader_name,
+            col_name=f"outc_{loader_name}_within_365_days",
+            lookahead_days=365,
+        )
+        for loader_name in first_events
+    ]
+
+    flattened_df = flatten_incident_outcomes(
+        prediction_times=prediction_times,
+        specs=specs,
+        values_by_source={
+            (loader_name, ()): df for loader_name, df in first_events.items()
+        },
+    )
+
+    # Prediction times after either source's event are dropped
+    is_dropped = (
+        (prediction_times["dw_ek_borger"] == 1)
+        & (prediction_times["timestamp"] > pd.Timestamp("2016-01-01"))
+    ) | (
+        (prediction_times["dw_ek_borger"] == 2)
+        & (prediction_times["timestamp"] > pd.Timestamp("2017-01-01"))
+    )
+    assert flattened_df.index.equals(prediction_times.index[~is_dropped])
+
+    with pytest.raises(ValueError, match="at most one event per patient"):
+        flatten_incident_outcomes(
+            prediction_times=prediction_times,
+            specs=specs[:1],
+            values_by_source={
+                ("t2d", ()): pd.concat([first_events["t2d"], first_events["t2d"]]),
+            },
+        )
@@ -0,0 +1,174 @@
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from timeseriesflattener.feature_spec_objects import StaticSpec
+
+from t2d_feature_generation.flattening.incremental import (
+    flatten_incrementally,
+    get_feature_fingerprint,
+    load_partitions,
+    read_high_water_mark,
+    refresh_static_specs,
+)
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+
+LAST_RUN = pd.Timestamp("2018-06-15")
+
+WINDOW_SPECS = [
+    WindowSpec(
+        loader_name="hba1c",
+        col_name=f"pred_hba1c_within_{interval_days}_days_{aggregation}_fallback_nan",
+        interval_days=interval_days,
+        direction="behind",
+        aggregation=aggregation,
+        fallback=np.nan,
+    )
+    for interval_days in (30, 365)
+    for aggregation in ("max", "latest")
+] + [
+    WindowSpec(
+        loader_name="hba1c",
+        col_name="outc_hba1c_within_90_days_max_fallback_0",
+        interval_days=90,
+        direction="ahead",
+        aggregation="max",
+        fallback=0,
+    ),
+]
+
+
+def make_synthetic_data() -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(0)
+    start = pd.Timestamp("2015-01-01")
+
+    prediction_times = pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 30, 1_000),
+            "timestamp": start
+            + pd.to_timedelta(rng.choice(5 * 365 * 24, 1_000, replace=False), "h"),
+        },
+    ).sort_values("timestamp", ignore_index=True)
+
+    events = pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 30, 3_000),
+            "timestamp": start
+            + pd.to_timedelta(rng.choice(5 * 365 * 24, 3_000, replace=False), "h"),
+            "value": rng.normal(50, 10, 3_000),
+        },
+    )
+    # Some patients get their first event after the last run, which changes
+    # their static features in partitions that are not recomputed
+    events = events[(events["dw_ek_borger"] < 25) | (events["timestamp"] > LAST_RUN)]
+
+    return prediction_times, events
+
+
+def flatten(prediction_times: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
+    temporal = flatten_temporal_specs(
+        prediction_times=prediction_times,
+        specs=WINDOW_SPECS,
+        load_values=lambda _: events,
+    )
+    flattened = pd.concat([prediction_times, temporal], axis=1)
+
+    return refresh_static_specs(flattened, get_static_specs(events))
+
+
+def get_static_specs(events: pd.DataFrame) -> list[StaticSpec]:
+    first_events = events.groupby("dw_ek_borger", as_index=False)["timestamp"].min()
+
+    return [
+        StaticSpec(
+            values_df=first_events,
+            feature_name="first_hba1c",
+            input_col_name_override="timestamp",
+            prefix="pred",
+        ),
+    ]
+
+
+def run(
+    prediction_times: pd.DataFrame,
+    events: pd.DataFrame,
+    feature_set_dir: Path,
+) -> list[Path]:
+    return flatten_incrementally(
+        prediction_times=prediction_times,
+        feature_set_dir=feature_set_dir,
+        flatten_fn=partial(flatten, events=events),
+        lookahead_days=90,
+        feature_fingerprint=get_feature_fingerprint(
+            [spec.col_name for spec in WINDOW_SPECS],
+        ),
+        refresh_fn=partial(
+            refresh_static_specs,
+            static_specs=get_static_specs(events),
+        ),
+    )
+
+
+def test_incremental_run_matches_full_run(tmp_path: Path):
+    prediction_times, events = make_synthetic_data()
+
+    incremental_dir = tmp_path / "incremental"
+    run(
+        prediction_times=prediction_times[prediction_times["timestamp"] <= LAST_RUN],
+        events=events[events["timestamp"] <= LAST_RUN],
+        feature_set_dir=incremental_dir,
+    )
+    assert read_high_water_mark(incremental_dir).timestamp <= LAST_RUN.isoformat()
+
+    written_paths = run(
+        prediction_times=prediction_times,
+        events=events,
+        feature_set_dir=incremental_dir,
+    )
+    # Only recent months, and older months with changed static features, are rewritten
+    n_partitions = len(list(incremental_dir.glob("part-*.parquet")))
+    assert 0 < len(written_paths) < n_partitions
+
+    full_dir = tmp_path / "full"
+    run(prediction_times=prediction_times, events=events, feature_set_dir=full_dir)
+
+    pd.testing.assert_frame_equal(
+        load_partitions(incremental_dir),
+        load_partitions(full_dir),
+    )
+    pd.testing.assert_frame_equal(
+        load_partitions(full_dir),
+        flatten(prediction_times, events),
+    )
+
+
+def test_refreshing_keeps_integer_dtypes_unless_a_patient_has_no_value():
+    df = pd.DataFrame(
+        {
+            "dw_ek_borger": [1, 2, 3],
+            "pred_sex_female": np.array([1, 0, 1], dtype=np.int8),
+        },
+    )
+    static_specs = [
+        StaticSpec(
+            values_df=pd.DataFrame({"dw_ek_borger": [1, 2], "sex_female": [0, 0]}),
+            feature_name="sex_female",
+            input_col_name_override="sex_female",
+            prefix="pred",
+        ),
+    ]
+
+    refreshed = refresh_static_specs(df, static_specs)
+
+    # Patient 3 has no value, so the column falls back to float
+    pd.testing.assert_series_equal(
+        refreshed["pred_sex_female"],
+        pd.Series([0.0, 0.0, np.nan], name="pred_sex_female"),
+    )
+    assert refresh_static_specs(df.iloc[:2], static_specs)[
+        "pred_sex_female"
+    ].dtype == np.dtype(np.int8)
@@ -0,0 +1,103 @@
+import json
+from pathlib import Path
+from typing import Callable
+
+import catalogue
+import numpy as np
+import pandas as pd
+import pytest
+
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+from t2d_feature_generation.instrumentation import Instrumentation
+
+
+def test_loaders_are_measured_once_per_call(make_events: Callable[..., pd.DataFrame]):
+    registry = catalogue.create("t2d_test", "instrumented_loaders")
+    registry.register("hba1c", func=lambda: make_events(100))
+    registry.register("ldl", func=lambda: make_events(50))
+
+    with Instrumentation() as instrumentation:
+        assert instrumentation.instrument_loaders(registry) == 2
+        # Instrumenting again does not wrap the wrappers
+        assert instrumentation.instrument_loaders(registry) == 0
+
+        registry.get("hba1c")()
+        registry.get("ldl")()
+
+    report = instrumentation.get_report()
+    assert report[["stage", "name", "rows_out"]].to_dict(orient="records") == [
+        {"stage": "load", "name": "hba1c", "rows_out": 100},
+        {"stage": "load", "name": "ldl", "rows_out": 50},
+    ]
+    assert (report["seconds"] > 0).all()
+
+
+def test_planned_sources_are_measured_and_reported(
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+    make_events: Callable[..., pd.DataFrame],
+):
+    events = {"hba1c": make_events(1_000), "ldl": make_events(300)}
+    prediction_times = make_events(200)[["dw_ek_borger", "timestamp"]]
+    specs = [
+        WindowSpec(
+            loader_name=loader_name,
+            col_name=f"pred_{loader_name}_within_{interval_days}_days_max_fallback_nan",
+            interval_days=interval_days,
+            direction="behind",
+            aggregation="max",
+            fallback=np.nan,
+        )
+        for loader_name in events
+        for interval_days in (30, 365)
+    ]
+
+    with Instrumentation() as instrumentation:
+        instrumentation.start_progress(n_specs=len(specs))
+        with caplog.at_level("INFO"):
+            flatten_temporal_specs(
+                prediction_times=prediction_times,
+                specs=specs,
+                load_values=lambda spec: events[spec.loader_name],
+                instrumentation=instrumentation,
+            )
+
+    report = instrumentation.get_report()
+    assert report[["stage", "name", "n_specs", "rows_in", "rows_out"]].to_dict(
+        orient="records",
+    ) == [
+        {
+            "stage": "resolve",
+            "name": "hba1c",
+            "n_specs": 2,
+            "rows_in": 1_000,
+            "rows_out": 200,
+        },
+        {
+            "stage": "resolve",
+            "name": "ldl",
+            "n_specs": 2,
+            "rows_in": 300,
+            "rows_out": 200,
+        },
+    ]
+    assert "Resolved 4/4 specs (100%), ETA 0 days" in caplog.text
+
+    json_path, csv_path = instrumentation.write_report(tmp_path)
+    stored = json.loads(json_path.read_text())
+    assert stored["summary"]["resolve"]["n"] == 2
+    assert stored["stages"][0]["spec_names"] == [spec.col_name for spec in specs[:2]]
+    pd.testing.assert_frame_equal(pd.read_csv(csv_path), report, check_dtype=False)
+
+
+def test_failed_stages_are_not_recorded():
+    instrumentation = Instrumentation()
+    measure = instrumentation.measure(stage="load", name="hba1c")
+
+    with instrumentation, pytest.raises(KeyError), measure:
+        raise KeyError("hba1c")
+
+    assert instrumentation.records == []
@@ -0,0 +1,115 @@
+import sqlite3
+from collections.abc import Iterable, Iterator
+from typing import Optional, Union
+
+import pandas as pd
+import pytest
+
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    LabThreshold,
+    SqlReader,
+    load_lab_results_above_threshold,
+)
+
+HBA1C = LabThreshold(
+    value_type="hba1c",
+    blood_sample_ids=("NPU27300", "AAB00093"),
+    threshold=47.9,
+)
+
+
+@pytest.fixture
+def warehouse() -> Iterator[sqlite3.Connection]:
+    """Local stand-in for the warehouse, with the layout of the lab results view."""
+    con = sqlite3.connect(":memory:")
+    con.execute("ATTACH DATABASE ':memory:' AS fct")
+    con.execute(
+        """CREATE TABLE fct.FOR_labka_alle_blodprover_inkl_2021_feb2022 (
+            dw_ek_borger INTEGER,
+            datotid_sidstesvar TEXT,
+            npukode TEXT,
+            numerisksvar REAL,
+            svar TEXT
+        )""",
+    )
+    con.executemany(
+        "INSERT INTO fct.FOR_labka_alle_blodprover_inkl_2021_feb2022 VALUES (?, ?, ?, ?, ?)",
+        [
+            (1, "2020-01-03 10:00:00", "NPU27300", 50.0, "50"),
+            (1, "2020-01-01 10:00:00", "NPU27300", 40.0, "40"),  # Below threshold
+            (1, "2020-01-02 10:00:00", "AAB00093", 60.0, "60"),
+            (2, "2020-01-01 10:00:00", "NPU27300", None, ">40"),  # Coerced to 60
+            (2, "2020-01-05 10:00:00", "NPU27300", 48.0, "48"),
+            (3, "2020-01-01 10:00:00", "NPU27300", None, "<60"),  # Coerced to 40.2
+            (3, "2020-01-01 10:00:00", "NPU04177", 99.0, "99"),  # Other blood sample
+            (4, None, "NPU27300", 99.0, "99"),  # Missing timestamp
+        ],
+    )
+    yield con
+    con.close()
+
+
+def read_sql_from(con: sqlite3.Connection) -> SqlReader:
+    def read_sql(
+        query: str,
+        chunksize: Optional[int] = None,
+    ) -> Union[pd.DataFrame, Iterable[pd.DataFrame]]:
+        return pd.read_sql(query, con, chunksize=chunksize)
+
+    return read_sql
+
+
+@pytest.mark.parametrize("pushdown", [True, False])
+def test_load_lab_results_above_threshold(
+    warehouse: sqlite3.Connection,
+    pushdown: bool,
+):
+    df = load_lab_results_above_threshold(
+        lab=HBA1C,
+        pushdown=pushdown,
+        read_sql=read_sql_from(warehouse),
+        chunksize=2,
+    )
+
+    df = df.sort_values(["dw_ek_borger", "timestamp"]).reset_index(drop=True)
+    expected = pd.DataFrame(
+        {
+            "dw_ek_borger": [1, 1, 2, 2],
+            "timestamp": pd.to_datetime(
+                [
+                    "2020-01-02 10:00:00",
+                    "2020-01-03 10:00:00",
+                    "2020-01-01 10:00:00",
+                    "2020-01-05 10:00:00",
+                ],
+            ),
+            "value": [60.0, 50.0, 60.0, 48.0],
+            "value_type": "hba1c",
+        },
+    )
+    pd.testing.assert_frame_equal(df, expected)
+
+
+@pytest.mark.parametrize("pushdown", [True, False])
+def test_load_first_lab_result_above_threshold(
+    warehouse: sqlite3.Connection,
+    pushdown: bool,
+):
+    df = load_lab_results_above_threshold(
+        lab=HBA1C,
+        first_per_patient=True,
+        pushdown=pushdown,
+        read_sql=read_sql_from(warehouse),
+        chunksize=2,
+    )
+
+    expected = pd.DataFrame(
+        {
+            "dw_ek_borger": [1, 2],
+            "timestamp": pd.to_datetime(
+                ["2020-01-02 10:00:00", "2020-01-01 10:00:00"],
+            ),
+            "value_type": "hba1c",
+        },
+    )
+    pd.testing.assert_frame_equal(df, expected)
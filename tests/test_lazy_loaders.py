@@ -0,0 +1,116 @@
+import importlib
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import catalogue
+import pytest
+from timeseriesflattener.utils import data_loaders
+
+from t2d_feature_generation.instrumentation import Instrumentation
+from t2d_feature_generation.lazy_loaders import (
+    LOADER_IMPORT_PATHS,
+    LazyLoader,
+    register_lazy_loaders,
+)
+
+DEFERRED_MODULES = (
+    "psycop_feature_generation.loaders.raw",
+    "t2d_feature_generation.outcome_specification.combined",
+    "t2d_feature_generation.outcome_specification.lab_results",
+)
+
+
+def test_importing_specify_features_defers_loaders():
+    # In a fresh interpreter, as other tests import the loaders
+    script = textwrap.dedent(
+        f"""
+        import sys
+
+        from timeseriesflattener.utils import data_loaders
+
+        import t2d_feature_generation.specify_features
+
+        imported = [name for name in {DEFERRED_MODULES!r} if name in sys.modules]
+        assert not imported, imported
+
+        loaders = data_loaders.get_all()
+        not_lazy = [
+            name
+            for name in {list(LOADER_IMPORT_PATHS)!r}
+            if type(loaders[name]).__name__ != "LazyLoader"
+        ]
+        assert not not_lazy, not_lazy
+        """,
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize("loader_name", list(LOADER_IMPORT_PATHS))
+def test_import_paths_are_the_registered_loaders(loader_name: str):
+    module_name, attribute = LOADER_IMPORT_PATHS[loader_name].split(":")
+    loader_fn = getattr(importlib.import_module(module_name), attribute)
+
+    registered = data_loaders.get(loader_name)
+    if isinstance(registered, LazyLoader):
+        registered = registered.load()
+
+    assert registered is loader_fn
+
+
+def test_lazy_loaders_import_on_first_call(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    namespace = ("t2d_test", "lazy_loaders")
+    (tmp_path / "t2d_test_lazy_loader_module.py").write_text(
+        textwrap.dedent(
+            f"""
+            import catalogue
+            import pandas as pd
+
+            registry = catalogue.Registry({namespace!r})
+
+
+            @registry.register("sodium")
+            def load_sodium():
+                return pd.DataFrame({{"value": [140.0, 135.0]}})
+            """,
+        ),
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    registry = catalogue.create(*namespace)
+
+    assert (
+        register_lazy_loaders(
+            {"sodium": "t2d_test_lazy_loader_module:load_sodium"},
+            registry=registry,
+        )
+        == 1
+    )
+    lazy_loader = registry.get("sodium")
+    assert not lazy_loader.is_loaded
+    assert "t2d_test_lazy_loader_module" not in sys.modules
+
+    with Instrumentation() as instrumentation:
+        instrumentation.instrument_loaders(registry)
+        wrapper = registry.get("sodium")
+
+        assert len(wrapper()) == 2
+        assert lazy_loader.is_loaded
+
+        # The module's own registration does not replace the wrapper
+        assert registry.get("sodium") is wrapper
+        assert len(wrapper()) == 2
+
+    assert instrumentation.get_report()["name"].tolist() == ["sodium", "sodium"]
+
+    # Registered names are kept
+    assert register_lazy_loaders({"sodium": "elsewhere:load"}, registry=registry) == 0
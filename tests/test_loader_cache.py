@@ -0,0 +1,136 @@
+import os
+from collections.abc import Iterator
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from t2d_feature_generation import loader_cache
+from t2d_feature_generation.loader_cache import (
+    SOURCE_FINGERPRINT_ENV_VAR,
+    LoaderCache,
+    cached_loader,
+    configure_loader_cache,
+    default_source_fingerprint,
+    get_source_fingerprint,
+)
+
+
+@pytest.fixture(autouse=True)
+def source_fingerprint(monkeypatch: pytest.MonkeyPatch) -> None:
+    # There is no warehouse to fingerprint in tests
+    monkeypatch.setenv(SOURCE_FINGERPRINT_ENV_VAR, "test")
+
+
+@pytest.fixture
+def loader_calls(tmp_path: Path) -> Iterator[list[int]]:
+    configure_loader_cache(cache_dir=tmp_path)
+    yield []
+    configure_loader_cache(cache_dir=None)
+
+
+def test_cached_loader_skips_loader_on_hit(loader_calls: list[int]):
+    @cached_loader("test_loader")
+    def loader(n_rows: int = 3) -> pd.DataFrame:
+        loader_calls.append(n_rows)
+        return pd.DataFrame(
+            {
+                "dw_ek_borger": range(n_rows),
+                "timestamp": pd.date_range("2020-01-01", periods=n_rows),
+            },
+        )
+
+    first = loader()
+    second = loader(n_rows=3)
+    third = loader(n_rows=2)
+
+    assert loader_calls == [3, 2]
+    pd.testing.assert_frame_equal(first, second)
+    assert len(third) == 2
+
+
+def test_key_depends_on_params_and_source_fingerprint(tmp_path: Path):
+    fingerprint = "2023-01-01"
+    cache = LoaderCache(cache_dir=tmp_path, source_fingerprint=lambda: fingerprint)
+
+    key = cache.get_key("loader", {"n_rows": 1})
+
+    assert key == cache.get_key("loader", {"n_rows": 1})
+    assert key != cache.get_key("loader", {"n_rows": 2})
+    assert key != cache.get_key("other_loader", {"n_rows": 1})
+
+    fingerprint = "2023-01-02"
+    assert key != cache.get_key("loader", {"n_rows": 1})
+
+
+def test_source_fingerprint_changes_with_the_source_tables(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    summaries = {
+        "lab_results": [100, "2022-02-01"],
+        "medications": [50, "2022-01-31"],
+    }
+    queries = []
+
+    def read_sql(query: str) -> pd.DataFrame:
+        queries.append(query)
+        return pd.DataFrame(
+            [[table, *summary] for table, summary in summaries.items()],
+            columns=["source_table", "n_rows", "max_timestamp"],
+        )
+
+    tables = {"lab_results": "datotid_sidstesvar", "medications": "datotid_start"}
+    fingerprint = get_source_fingerprint(tables, read_sql=read_sql)
+
+    assert "MAX(datotid_start) AS max_timestamp FROM medications" in queries[0]
+    assert fingerprint == get_source_fingerprint(tables, read_sql=read_sql)
+
+    summaries["lab_results"] = [101, "2022-02-01"]
+    assert fingerprint != get_source_fingerprint(tables, read_sql=read_sql)
+    summaries["lab_results"] = [100, "2022-02-02"]
+    assert fingerprint != get_source_fingerprint(tables, read_sql=read_sql)
+
+    assert default_source_fingerprint() == "test"
+    monkeypatch.delenv(SOURCE_FINGERPRINT_ENV_VAR)
+    monkeypatch.setattr(
+        loader_cache,
+        "_get_warehouse_fingerprint",
+        lambda: get_source_fingerprint(tables, read_sql=read_sql),
+    )
+    assert default_source_fingerprint() == get_source_fingerprint(
+        tables,
+        read_sql=read_sql,
+    )
+
+
+def test_invalidate(tmp_path: Path):
+    cache = LoaderCache(cache_dir=tmp_path)
+    df = pd.DataFrame({"value": [1, 2, 3]})
+
+    for loader_name in ("a", "a", "b"):
+        cache.load(loader_name, {"id": len(loader_name)}, lambda: df)
+    cache.load("a", {"id": 2}, lambda: df)
+
+    assert cache.invalidate("a") == 2
+    assert cache.invalidate() == 1
+    assert cache.read(cache.get_key("b", {"id": 1})) is None
+
+
+def test_evicts_least_recently_used(tmp_path: Path):
+    df = pd.DataFrame({"value": range(1_000)})
+
+    cache = LoaderCache(cache_dir=tmp_path)
+    keys = [cache.get_key("loader", {"i": i}) for i in range(3)]
+
+    cache.write(keys[0], df)
+    cache.write(keys[1], df)
+    entry_size = cache.get_size_bytes() // 2
+    cache.max_size_bytes = 2 * entry_size
+
+    # Make the second entry the least recently used
+    os.utime(tmp_path / f"{keys[1]}.parquet", (0, 0))
+    cache.write(keys[2], df)
+
+    assert cache.read(keys[0]) is not None
+    assert cache.read(keys[1]) is None
+    assert cache.read(keys[2]) is not None
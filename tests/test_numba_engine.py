@@ -0,0 +1,58 @@
+import logging
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from t2d_feature_generation.flattening import planner
+from t2d_feature_generation.flattening.planner import (
+    SUPPORTED_AGGREGATIONS,
+    WindowSpec,
+    flatten_temporal_specs,
+)
+
+
+def get_specs(direction: str) -> list[WindowSpec]:
+    return [
+        WindowSpec(
+            loader_name="hba1c",
+            col_name=f"hba1c_within_{interval_days}_days_{aggregation}_{fallback}",
+            interval_days=interval_days,
+            direction=direction,
+            aggregation=aggregation,
+            fallback=fallback,
+        )
+        for interval_days in (1, 30, 180, 365, 730, 1095, 1460, 1825)
+        for aggregation in SUPPORTED_AGGREGATIONS
+        for fallback in (np.nan, -1)
+    ]
+
+
+def test_numba_engine_is_skipped_without_numba(
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+    make_events: Callable[..., pd.DataFrame],
+):
+    monkeypatch.setattr(planner, "HAS_NUMBA", False)
+    prediction_times = make_events(100, seed=1)[["dw_ek_borger", "timestamp"]]
+    values_df = make_events(500)
+
+    with caplog.at_level(logging.WARNING):
+        flattened_df = flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=get_specs("behind"),
+            load_values=lambda _: values_df,
+            engines=("numba",),
+        )
+
+    assert "numba is not installed" in caplog.text
+    pd.testing.assert_frame_equal(
+        flattened_df,
+        flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=get_specs("behind"),
+            load_values=lambda _: values_df,
+            engines=(),
+        ),
+    )
@@ -0,0 +1,177 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from psycop_feature_generation.application_modules.project_setup import ProjectInfo
+
+from t2d_feature_generation import partitioned_output
+from t2d_feature_generation.feature_set_reader import FeatureSetReader
+from t2d_feature_generation.flattening.sharding import flatten_sharded
+from t2d_feature_generation.partitioned_output import (
+    get_flag_col_names,
+    split_and_save_shards_to_disk,
+    write_partitioned_split,
+)
+
+SPLIT_IDS = {
+    "train": np.arange(0, 300),
+    "val": np.arange(300, 400),
+    "test": np.arange(400, 500),
+}
+
+
+def make_split_df(n_rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 500, n_rows).astype(np.int32),
+            "timestamp": pd.Timestamp("2014-01-01")
+            + pd.to_timedelta(rng.integers(0, 3 * 365 * 24, n_rows), unit="h"),
+            "pred_hba1c_within_730_days_max_fallback_nan": rng.normal(
+                size=n_rows,
+            ).astype(np.float32),
+            "outc_t2d_within_1095_days_max_fallback_0_dichotomous": rng.integers(
+                0,
+                2,
+                n_rows,
+            ).astype(np.int8),
+            "source": pd.Categorical(rng.choice(["t2d", "lab_results"], n_rows)),
+        },
+    )
+
+
+def test_partitions_are_sorted_and_prunable(tmp_path: Path):
+    split_df = make_split_df(30_000)
+    split_dir = tmp_path / "t2d_features" / "split=train"
+
+    paths = write_partitioned_split(
+        split_df=split_df,
+        split_dir=split_dir,
+        row_group_size=1_000,
+    )
+
+    assert [path.relative_to(split_dir).as_posix() for path in paths] == [
+        f"year={year}/part-0.parquet" for year in (2014, 2015, 2016)
+    ]
+    assert not list(tmp_path.glob("**/*.tmp"))
+
+    # All rows are kept, sorted by year, id and timestamp
+    read_df = FeatureSetReader(tmp_path, splits=["train"]).read(
+        columns=list(split_df.columns),
+    )
+    expected = (
+        split_df.assign(year=split_df["timestamp"].dt.year)
+        .sort_values(["year", "dw_ek_borger", "timestamp"])
+        .drop(columns="year")
+        .reset_index(drop=True)
+    )
+    pd.testing.assert_frame_equal(read_df, expected)
+
+    # Ids of row groups do not overlap, so filtering on an id reads a single
+    # row group per year
+    metadata = pq.ParquetFile(paths[0]).metadata
+    id_ranges = [
+        (
+            metadata.row_group(i).column(0).statistics.min,
+            metadata.row_group(i).column(0).statistics.max,
+        )
+        for i in range(metadata.num_row_groups)
+    ]
+    assert all(
+        previous_max <= next_min
+        for (_, previous_max), (next_min, _) in zip(id_ranges, id_ranges[1:])
+    )
+
+    reader = FeatureSetReader(tmp_path, splits=["train"])
+    fragments = reader.get_fragments(reader.get_filter(ids=[250], for_row_groups=True))
+    assert all(fragment.num_row_groups <= 2 for fragment in fragments)
+
+    # Only flag columns are dictionary encoded, and everything is zstd compressed
+    columns = {
+        metadata.row_group(0).column(i).path_in_schema: metadata.row_group(0).column(i)
+        for i in range(metadata.num_columns)
+    }
+    assert get_flag_col_names(split_df) == [
+        "outc_t2d_within_1095_days_max_fallback_0_dichotomous",
+        "source",
+    ]
+    for col_name, column in columns.items():
+        assert column.compression == "ZSTD"
+        is_dictionary_encoded = "PLAIN_DICTIONARY" in column.encodings or (
+            "RLE_DICTIONARY" in column.encodings
+        )
+        assert is_dictionary_encoded == (col_name in get_flag_col_names(split_df))
+
+
+def test_rewriting_replaces_the_split(tmp_path: Path):
+    split_dir = tmp_path / "split=val"
+    write_partitioned_split(split_df=make_split_df(1_000), split_dir=split_dir)
+
+    # Rows of 2014 only, so the other years' partitions are removed
+    split_df = make_split_df(1_000)
+    write_partitioned_split(
+        split_df=split_df[split_df["timestamp"].dt.year == 2014],
+        split_dir=split_dir,
+    )
+
+    assert [path.name for path in split_dir.iterdir()] == ["year=2014"]
+
+
+def keep_prediction_times(prediction_times_df: pd.DataFrame) -> pd.DataFrame:
+    return prediction_times_df
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_shards_are_split_and_saved_one_at_a_time(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    partitioned: bool,
+):
+    monkeypatch.setattr(
+        partitioned_output,
+        "get_split_id_df",
+        lambda split_name: pd.DataFrame({"dw_ek_borger": SPLIT_IDS[split_name]}),
+    )
+    project_info = ProjectInfo(
+        project_name="t2d",
+        project_path=tmp_path,
+        feature_set_path=tmp_path,
+        feature_set_prefix="t2d_features",
+    )
+    flattened_df = make_split_df(2_000)
+    shard_paths = flatten_sharded(
+        prediction_times=flattened_df,
+        flatten_fn=keep_prediction_times,
+        output_dir=tmp_path / "shards",
+        n_shards=3,
+        max_workers=2,
+    )
+
+    split_and_save_shards_to_disk(
+        shard_paths=shard_paths,
+        project_info=project_info,
+        partitioned=partitioned,
+    )
+
+    for split_name, split_ids in SPLIT_IDS.items():
+        if partitioned:
+            split_df = FeatureSetReader(tmp_path, splits=[split_name]).read(
+                columns=list(flattened_df.columns),
+            )
+        else:
+            split_df = pd.read_parquet(tmp_path / f"t2d_features_{split_name}.parquet")
+
+        # Rows are in shard order, so both are compared in a canonical order
+        pd.testing.assert_frame_equal(
+            split_df.sort_values(list(flattened_df.columns[:3])).reset_index(
+                drop=True,
+            ),
+            flattened_df[flattened_df["dw_ek_borger"].isin(split_ids)]
+            .sort_values(list(flattened_df.columns[:3]))
+            .reset_index(drop=True),
+            check_categorical=False,
+        )
+    assert not list(tmp_path.glob("**/*.tmp"))
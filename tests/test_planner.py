@@ -0,0 +1,208 @@
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pytest
+from timeseriesflattener.feature_spec_objects import OutcomeSpec, PredictorSpec
+from timeseriesflattener.flattened_dataset import TimeseriesFlattener
+
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+from t2d_feature_generation.flattening.planner import (
+    ENGINES,
+    SUPPORTED_AGGREGATIONS,
+    WindowSpec,
+    flatten_temporal_specs,
+)
+
+
+@pytest.fixture
+def prediction_times() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n_prediction_times = 300
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 40, n_prediction_times),
+            "timestamp": pd.Timestamp("2015-01-01")
+            + pd.to_timedelta(
+                rng.choice(2_000 * 24, n_prediction_times, replace=False),
+                unit="h",
+            ),
+        },
+    )
+
+
+@pytest.fixture
+def values_df() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    n_values = 2_000
+
+    values = rng.normal(50, 10, n_values)
+    values[rng.random(n_values) < 0.1] = np.nan
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 50, n_values),
+            # Unique timestamps, as timeseriesflattener breaks ties arbitrarily
+            "timestamp": pd.Timestamp("2013-01-01")
+            + pd.to_timedelta(
+                rng.choice(5_000 * 24, n_values, replace=False),
+                unit="h",
+            ),
+            "value": values,
+        },
+    )
+
+
+def test_planner_matches_timeseriesflattener(
+    prediction_times: pd.DataFrame,
+    values_df: pd.DataFrame,
+):
+    specs = [
+        PredictorSpec(
+            values_df=values_df,
+            feature_name="lab",
+            lookbehind_days=interval_days,
+            resolve_multiple_fn=resolve_multiple_fn,
+            fallback=fallback,
+            prefix="pred",
+        )
+        for interval_days in (30, 365, 1095)
+        for resolve_multiple_fn in ("max", "min", "mean", "latest", "count", "sum")
+        for fallback in (np.nan, 0)
+    ] + [
+        OutcomeSpec(
+            values_df=values_df,
+            feature_name="lab",
+            lookahead_days=interval_days,
+            resolve_multiple_fn=resolve_multiple_fn,
+            fallback=0,
+            incident=False,
+            prefix="outc",
+        )
+        for interval_days in (30, 365)
+        for resolve_multiple_fn in ("max", "earliest")
+    ]
+
+    flattener = TimeseriesFlattener(
+        prediction_times_df=prediction_times.copy(),
+        drop_pred_times_with_insufficient_look_distance=False,
+        entity_id_col_name="dw_ek_borger",
+        n_workers=1,
+        log_to_stdout=False,
+    )
+    flattener.add_spec(specs)
+    expected = flattener.get_df()
+
+    flattened = flatten_temporal_specs(
+        prediction_times=prediction_times,
+        specs=[WindowSpec.from_spec(spec) for spec in specs],
+        load_values=lambda _: values_df,
+        # Force several batches
+        max_pairs_per_batch=100,
+    )
+
+    for spec in specs:
+        pd.testing.assert_series_equal(
+            flattened[spec.get_col_str()],
+            expected[spec.get_col_str()].astype(float),
+            check_index=False,
+        )
+
+
+@pytest.mark.parametrize("direction", ["behind", "ahead"])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engine_matches_the_expansion(
+    engine: str,
+    direction: str,
+    make_events: Callable[..., pd.DataFrame],
+):
+    if engine == "numba":
+        pytest.importorskip("numba")
+
+    prediction_times = make_events(400, seed=1)[["dw_ek_borger", "timestamp"]]
+    values_df = make_events(3_000)
+    specs = [
+        WindowSpec(
+            loader_name="hba1c",
+            col_name=f"hba1c_within_{interval_days}_days_{aggregation}_{fallback}",
+            interval_days=interval_days,
+            direction=direction,
+            aggregation=aggregation,
+            fallback=fallback,
+        )
+        for interval_days in (1, 30, 180, 365, 730, 1095, 1460, 1825)
+        for aggregation in SUPPORTED_AGGREGATIONS
+        for fallback in (np.nan, -1)
+    ]
+
+    flattened_by_engines = {
+        engines: flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=specs,
+            load_values=lambda _: values_df,
+            engines=engines,
+        )
+        for engines in ((), (engine,))
+    }
+
+    pd.testing.assert_frame_equal(
+        *flattened_by_engines.values(),
+        check_exact=True,
+    )
+    # Windows with values, without events, and with only null values
+    flattened = flattened_by_engines[()]
+    count = flattened["hba1c_within_1_days_count_-1"]
+    has_events = flattened["hba1c_within_1_days_bool_-1"]
+    assert (count > 0).any()
+    assert (has_events == -1).any()
+    assert ((has_events == 1) & (count == 0)).any()
+
+
+def test_planner_loads_each_source_once(
+    prediction_times: pd.DataFrame,
+    values_df: pd.DataFrame,
+):
+    specs = [
+        WindowSpec(
+            loader_name=loader_name,
+            col_name=f"pred_{loader_name}_within_{interval_days}_days_{aggregation}",
+            interval_days=interval_days,
+            direction="behind",
+            aggregation=aggregation,
+            fallback=np.nan,
+        )
+        for loader_name in ("hba1c", "ldl")
+        for interval_days in (30, 365)
+        for aggregation in ("max", "latest")
+    ]
+    loaded = []
+
+    def load_values(spec: WindowSpec) -> pd.DataFrame:
+        loaded.append(spec.loader_name)
+        return values_df
+
+    flattened = flatten_temporal_specs(
+        prediction_times=prediction_times,
+        specs=specs,
+        load_values=load_values,
+    )
+
+    assert loaded == ["hba1c", "ldl"]
+    assert list(flattened.columns) == [spec.col_name for spec in specs]
+
+
+def test_searchsorted_by_merging_matches_composite_keys(values_df: pd.DataFrame):
+    events = PatientSortedEvents.from_df(
+        df=values_df,
+        patients=pd.Index(range(50)),
+    )
+    rng = np.random.default_rng(2)
+    query_codes = rng.integers(0, 50, 500)
+    query_timestamps = rng.choice(events.timestamps, 500) + rng.integers(-1, 2, 500)
+
+    for side in ("left", "right"):
+        np.testing.assert_array_equal(
+            events.searchsorted(query_codes, query_timestamps, side=side),
+            events._searchsorted_by_merging(query_codes, query_timestamps, side=side),
+        )
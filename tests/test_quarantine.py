@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+from psycop_feature_generation.application_modules.filter_prediction_times import (
+    PredictionTimeFilterer,
+)
+
+from t2d_feature_generation.quarantine import QuarantineIndex, filter_prediction_times
+
+
+@pytest.fixture
+def prediction_times() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    origin = pd.Timestamp("2014-01-01")
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 100, 2_000),
+            "timestamp": origin + pd.to_timedelta(rng.integers(0, 40_000, 2_000), "h"),
+        },
+    )
+
+
+@pytest.fixture
+def quarantine_timestamps() -> pd.DataFrame:
+    """Moves of some of the patients, and of patients without prediction times."""
+    rng = np.random.default_rng(1)
+    origin = pd.Timestamp("2014-01-01")
+    timestamps = origin + pd.to_timedelta(rng.integers(-20_000, 40_000, 300), "h")
+
+    return pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 150, 300),
+            "timestamp": timestamps.where(rng.random(300) > 0.05),
+        },
+    )
+
+
+def filter_with_merge(
+    prediction_times: pd.DataFrame,
+    quarantine_timestamps: pd.DataFrame,
+    quarantine_days: int,
+) -> pd.DataFrame:
+    """Filter with psycop's PredictionTimeFilterer, which adds a uuid column to
+    the prediction times in place."""
+    return PredictionTimeFilterer(
+        prediction_times_df=prediction_times.copy(),
+        entity_id_col_name="dw_ek_borger",
+        quarantine_timestamps_df=quarantine_timestamps,
+        quarantine_interval_days=quarantine_days,
+    ).run_filter()
+
+
+def test_exclusions_match_prediction_time_filterer(
+    prediction_times: pd.DataFrame,
+    quarantine_timestamps: pd.DataFrame,
+):
+    quarantine_days = [30, 720, 730]
+    exclusions = QuarantineIndex(quarantine_timestamps).get_exclusions(
+        prediction_times,
+        quarantine_days,
+    )
+
+    for days in quarantine_days:
+        expected = filter_with_merge(prediction_times, quarantine_timestamps, days)
+        assert 0 < exclusions[days].sum() < len(prediction_times)
+        pd.testing.assert_frame_equal(
+            prediction_times[~exclusions[days]],
+            expected,
+        )
+
+    counts = QuarantineIndex(quarantine_timestamps).count_exclusions(
+        prediction_times,
+        quarantine_days,
+    )
+    assert counts.to_dict() == {days: exclusions[days].sum() for days in exclusions}
+
+
+def test_filter_prediction_times(
+    prediction_times: pd.DataFrame,
+    quarantine_timestamps: pd.DataFrame,
+):
+    pd.testing.assert_frame_equal(
+        filter_prediction_times(
+            prediction_times_df=prediction_times,
+            quarantine_df=quarantine_timestamps,
+            quarantine_days=720,
+        ),
+        filter_with_merge(prediction_times, quarantine_timestamps, 720),
+    )
+
+    # Without quarantine starts, nothing is excluded
+    assert filter_prediction_times(
+        prediction_times_df=prediction_times,
+        quarantine_df=quarantine_timestamps.iloc[:0],
+        quarantine_days=720,
+    ).equals(prediction_times)
+
+    with pytest.raises(ValueError, match="both must be provided"):
+        filter_prediction_times(
+            prediction_times_df=prediction_times,
+            quarantine_days=720,
+        )
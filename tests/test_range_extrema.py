@@ -0,0 +1,24 @@
+import numpy as np
+
+from t2d_feature_generation.flattening.range_extrema import SparseTable
+
+
+def test_sparse_table_matches_brute_force():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=200)
+    values[rng.random(200) < 0.5] = np.nan
+    values[:10] = np.nan
+
+    starts = rng.integers(0, 200, 1_000)
+    ends = np.minimum(starts + rng.integers(0, 100, 1_000), 200)
+    starts[:3], ends[:3] = (0, 5, 7), (10, 5, 8)
+
+    table = SparseTable(values, np.fmax, max_length=int((ends - starts).max()))
+    expected = [
+        np.nan if start == end else np.fmax.reduce(values[start:end])
+        for start, end in zip(starts, ends)
+    ]
+
+    np.testing.assert_array_equal(table.query(starts, ends), expected)
+    # Levels are built as far as the longest range needs, for 2^0, ..., 2^6 values
+    assert len(table.table) == sum(200 - 2**level + 1 for level in range(7)) + 1
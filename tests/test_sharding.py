@@ -0,0 +1,244 @@
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from psycop_feature_generation.application_modules.project_setup import ProjectInfo
+from timeseriesflattener.feature_spec_objects import (
+    OutcomeSpec,
+    PredictorSpec,
+    StaticSpec,
+)
+from timeseriesflattener.flattened_dataset import TimeseriesFlattener
+
+from t2d_feature_generation.flattening import flatten
+from t2d_feature_generation.flattening.sharding import (
+    _ShardSplitter,
+    flatten_sharded,
+    get_shard_numbers,
+    load_shards,
+)
+
+
+def make_synthetic_data() -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(0)
+    start = pd.Timestamp("2015-01-01")
+
+    prediction_times = pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 50, 500),
+            "timestamp": start
+            + pd.to_timedelta(rng.choice(4 * 365 * 24, 500, replace=False), "h"),
+        },
+    )
+    events = pd.DataFrame(
+        {
+            "dw_ek_borger": rng.integers(0, 60, 2_000).astype(np.int32),
+            "timestamp": start
+            + pd.to_timedelta(rng.choice(4 * 365 * 24, 2_000, replace=False), "h"),
+            "value": rng.normal(50, 10, 2_000),
+        },
+    )
+
+    return prediction_times, events
+
+
+def flatten_with_timeseriesflattener(
+    prediction_times_df: pd.DataFrame,
+    feature_specs: list,
+) -> pd.DataFrame:
+    flattener = TimeseriesFlattener(
+        prediction_times_df=prediction_times_df,
+        drop_pred_times_with_insufficient_look_distance=False,
+        entity_id_col_name="dw_ek_borger",
+        n_workers=1,
+        log_to_stdout=False,
+    )
+    flattener.add_spec(feature_specs)
+
+    return flattener.get_df()
+
+
+def flatten_visit_counts(
+    prediction_times_df: pd.DataFrame,
+    excluded_df: pd.DataFrame,
+    min_timestamp: pd.Timestamp,
+) -> pd.DataFrame:
+    """Drops prediction times of excluded patients and before min_timestamp, and
+    counts each patient's prediction times."""
+    df = prediction_times_df[
+        ~prediction_times_df["dw_ek_borger"].isin(excluded_df["dw_ek_borger"])
+        & (prediction_times_df["timestamp"] >= min_timestamp)
+    ]
+    return df.assign(
+        n_visits=df.groupby("dw_ek_borger")["timestamp"].transform("size"),
+    ).reset_index(drop=True)
+
+
+def test_sharded_matches_unsharded(tmp_path: Path):
+    prediction_times, events = make_synthetic_data()
+
+    first_events = events.groupby("dw_ek_borger", as_index=False)["timestamp"].min()
+    feature_specs = [
+        PredictorSpec(
+            values_df=events,
+            feature_name="hba1c",
+            lookbehind_days=lookbehind_days,
+            resolve_multiple_fn=resolve_multiple_fn,
+            fallback=np.nan,
+            prefix="pred",
+        )
+        for lookbehind_days in (30, 365)
+        for resolve_multiple_fn in ("max", "latest")
+    ] + [
+        # Incident outcomes drop prediction times
+        OutcomeSpec(
+            values_df=first_events.assign(value=1),
+            feature_name="first_hba1c",
+            lookahead_days=365,
+            resolve_multiple_fn="max",
+            fallback=0,
+            incident=True,
+            prefix="outc",
+        ),
+        StaticSpec(
+            values_df=first_events.rename(columns={"timestamp": "value"}),
+            feature_name="first_hba1c",
+            prefix="pred",
+        ),
+    ]
+
+    paths = flatten_sharded(
+        prediction_times=prediction_times,
+        flatten_fn=flatten_with_timeseriesflattener,
+        output_dir=tmp_path,
+        n_shards=7,
+        sharded_inputs={"feature_specs": feature_specs},
+        max_workers=2,
+    )
+    assert len(paths) == 7
+
+    expected = flatten_with_timeseriesflattener(
+        prediction_times_df=prediction_times,
+        feature_specs=feature_specs,
+    )
+    # timeseriesflattener's column order differs between processes
+    pd.testing.assert_frame_equal(load_shards(tmp_path)[expected.columns], expected)
+
+
+def test_sharded_create_flattened_dataset_loads_birthdays_once(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    prediction_times, events = make_synthetic_data()
+
+    def birthdays() -> pd.DataFrame:
+        raise AssertionError("Birthdays are loaded once, by the caller")
+
+    # Workers are forked, so they see the patched loader
+    monkeypatch.setattr(flatten, "birthdays", birthdays)
+    flatten_fn = partial(
+        flatten.create_flattened_dataset,
+        project_info=ProjectInfo(
+            project_name="t2d",
+            project_path=tmp_path,
+            feature_set_path=tmp_path,
+            feature_set_prefix="t2d",
+        ),
+        n_workers=1,
+    )
+    sharded_inputs = {
+        "feature_specs": [
+            PredictorSpec(
+                values_df=events,
+                feature_name="hba1c",
+                lookbehind_days=365,
+                resolve_multiple_fn=resolve_multiple_fn,
+                fallback=np.nan,
+                prefix="pred",
+            )
+            # Variance is left to timeseriesflattener
+            for resolve_multiple_fn in ("max", "variance")
+        ],
+        "date_of_birth_df": pd.DataFrame(
+            {
+                "dw_ek_borger": np.arange(50),
+                "date_of_birth": pd.Timestamp("1960-01-01")
+                + pd.to_timedelta(np.arange(50) * 100, "D"),
+            },
+        ),
+    }
+
+    paths = flatten_sharded(
+        prediction_times=prediction_times,
+        flatten_fn=flatten_fn,
+        output_dir=tmp_path / "shards",
+        n_shards=4,
+        sharded_inputs=sharded_inputs,
+        max_workers=2,
+    )
+
+    expected = flatten_fn(prediction_times_df=prediction_times, **sharded_inputs)
+    pd.testing.assert_frame_equal(load_shards(paths)[expected.columns], expected)
+
+
+def test_sharded_keeps_order_of_duplicated_prediction_times(tmp_path: Path):
+    prediction_times, _ = make_synthetic_data()
+    prediction_times = pd.concat(
+        [prediction_times, prediction_times.sample(200, random_state=0)],
+        ignore_index=True,
+    ).sample(frac=1, random_state=1)
+    flatten_fn = partial(flatten_visit_counts, min_timestamp=pd.Timestamp("2016-01-01"))
+    excluded_df = pd.DataFrame({"dw_ek_borger": [1, 2, 3]})
+
+    paths = flatten_sharded(
+        prediction_times=prediction_times,
+        flatten_fn=flatten_fn,
+        output_dir=tmp_path,
+        n_shards=4,
+        sharded_inputs={"excluded_df": excluded_df},
+        max_workers=2,
+    )
+
+    pd.testing.assert_frame_equal(
+        load_shards(paths),
+        flatten_fn(prediction_times_df=prediction_times, excluded_df=excluded_df),
+    )
+
+
+def test_specs_of_a_source_share_its_restricted_values():
+    _, events = make_synthetic_data()
+    specs = [
+        PredictorSpec(
+            values_df=events,
+            feature_name="value",
+            lookbehind_days=lookbehind_days,
+            resolve_multiple_fn="max",
+            fallback=np.nan,
+        )
+        for lookbehind_days in (30, 365)
+    ]
+    splitter = _ShardSplitter(n_shards=4, entity_id_col_name="dw_ek_borger")
+
+    restricted = splitter.restrict(specs, shard=1)
+
+    assert restricted[0].values_df is restricted[1].values_df
+    assert set(get_shard_numbers(restricted[0].values_df["dw_ek_borger"], 4)) == {1}
+    assert splitter.restrict(events, shard=1) is restricted[0].values_df
+
+    # Restricted values of earlier shards are not kept
+    splitter.restrict(specs, shard=2)
+    assert {shard for _, shard in splitter._restricted} == {2}
+
+
+def test_shard_numbers_do_not_depend_on_id_dtype():
+    ids = pd.Series(np.arange(1_000))
+
+    shard_numbers = get_shard_numbers(ids, 16)
+
+    np.testing.assert_array_equal(
+        shard_numbers,
+        get_shard_numbers(ids.astype(np.int32), 16),
+    )
+    assert set(shard_numbers) == set(range(16))
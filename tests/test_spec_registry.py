@@ -0,0 +1,134 @@
+from collections import Counter
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+from timeseriesflattener.feature_spec_objects import (
+    OutcomeGroupSpec,
+    PredictorGroupSpec,
+    StaticSpec,
+)
+from timeseriesflattener.utils import data_loaders
+
+from t2d_feature_generation.spec_registry import SpecRegistry
+
+PREDICTOR_LOADER_NAMES = ("t2d_test_registry_hba1c", "t2d_test_registry_ldl")
+# Only loaded by test_specs_are_created_lazily_and_once, as loads are cached
+OUTCOME_LOADER_NAME = "t2d_test_registry_t2d"
+LOADER_CALLS: Counter = Counter()
+
+
+def make_loader(loader_name: str) -> Callable[..., pd.DataFrame]:
+    def load(n_rows: Optional[int] = None) -> pd.DataFrame:
+        LOADER_CALLS[loader_name] += 1
+        rng = np.random.default_rng(0)
+        n_rows = n_rows or 100
+
+        return pd.DataFrame(
+            {
+                "dw_ek_borger": rng.integers(0, 20, n_rows),
+                "timestamp": pd.Timestamp("2015-01-01")
+                + pd.to_timedelta(rng.integers(0, 1_000, n_rows), unit="D"),
+                "value": rng.integers(0, 2, n_rows),
+            },
+        )
+
+    return load
+
+
+for _loader_name in (*PREDICTOR_LOADER_NAMES, OUTCOME_LOADER_NAME):
+    if _loader_name not in data_loaders.get_all():
+        data_loaders.register(_loader_name, func=make_loader(_loader_name))
+
+
+def get_predictor_group_spec() -> PredictorGroupSpec:
+    return PredictorGroupSpec(
+        values_loader=PREDICTOR_LOADER_NAMES,
+        lookbehind_days=[30, 365, 730],
+        resolve_multiple_fn=["max", "latest"],
+        fallback=[np.nan],
+        allowed_nan_value_prop=[0],
+    )
+
+
+@pytest.fixture
+def registry() -> SpecRegistry:
+    registry = SpecRegistry()
+    registry.add_group(get_predictor_group_spec())
+    registry.add_group(
+        OutcomeGroupSpec(
+            values_loader=[OUTCOME_LOADER_NAME],
+            lookahead_days=[365, 730],
+            resolve_multiple_fn=["max"],
+            fallback=[0],
+            incident=[True],
+            allowed_nan_value_prop=[0],
+            prefix="outc",
+        ),
+    )
+    registry.add(
+        StaticSpec,
+        values_loader=PREDICTOR_LOADER_NAMES[0],
+        input_col_name_override="timestamp",
+        output_col_name_override="timestamp_first_hba1c",
+        prefix="",
+    )
+    return registry
+
+
+def test_registry_matches_create_combinations(registry: SpecRegistry):
+    expected = get_predictor_group_spec().create_combinations()
+    specs = registry.create_specs(registry.query(kind="predictor"))
+
+    assert len(registry) == len(expected) + 3
+    assert [spec.get_col_str() for spec in specs] == [
+        spec.get_col_str() for spec in expected
+    ]
+
+
+def test_queries_select_by_index(registry: SpecRegistry):
+    assert [entry.position for entry in registry.query(kind="outcome")] == [12, 13]
+    assert [entry.prefix for entry in registry.query(kind="static")] == [""]
+
+    entries = registry.query(
+        values_loader=PREDICTOR_LOADER_NAMES[0],
+        kind="predictor",
+        max_interval_days=365,
+    )
+    assert [(entry.interval_days, entry.aggregation) for entry in entries] == [
+        (30, "max"),
+        (365, "max"),
+        (30, "latest"),
+        (365, "latest"),
+    ]
+
+    entries = registry.query(aggregation="latest", min_interval_days=365)
+    assert {entry.interval_days for entry in entries} == {365, 730}
+    assert len(entries) == 4
+
+    assert len(registry.query(prefix=["pred", "outc"])) == 14
+    assert registry.query(values_loader="missing_loader") == []
+
+
+def test_specs_are_created_lazily_and_once(registry: SpecRegistry):
+    LOADER_CALLS.clear()
+
+    # Building the registry and querying it loads nothing
+    entries = registry.query(kind="outcome")
+    assert not LOADER_CALLS
+
+    specs = registry.create_specs(entries)
+    assert [spec.get_col_str() for spec in specs] == [
+        f"outc_{OUTCOME_LOADER_NAME}_within_{days}_days_max_fallback_0_dichotomous"
+        for days in (365, 730)
+    ]
+    assert LOADER_CALLS == {OUTCOME_LOADER_NAME: 1}
+
+    # Specs are reused
+    assert registry.create_specs(entries)[0] is specs[0]
+
+
+def test_unsupported_spec_class():
+    with pytest.raises(ValueError, match="Unsupported spec class"):
+        SpecRegistry().add(dict, values_loader="hba1c")
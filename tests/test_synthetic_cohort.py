@@ -0,0 +1,113 @@
+import sqlite3
+from collections.abc import Iterable
+from typing import Optional, Union
+
+import pandas as pd
+
+from t2d_feature_generation.eligibility import get_eligible_prediction_times
+from t2d_feature_generation.outcome_specification.first_event import (
+    combine_first_events,
+    get_first_event_per_patient,
+)
+from t2d_feature_generation.outcome_specification.lab_pushdown import (
+    DIABETES_LAB_THRESHOLDS,
+    load_lab_results_above_threshold,
+)
+from t2d_feature_generation.synthetic_cohort import generate_synthetic_cohort
+
+
+def test_generation_is_deterministic_and_scales():
+    cohort = generate_synthetic_cohort(n_patients=2_000, seed=1)
+
+    pd.testing.assert_frame_equal(
+        cohort.lab_results,
+        generate_synthetic_cohort(n_patients=2_000, seed=1).lab_results,
+    )
+
+    n_rows = cohort.get_n_rows()
+    assert 30_000 < n_rows["visits"] < 50_000
+    assert 45_000 < n_rows["lab_results"] < 75_000
+
+    # Diabetes events are from onset onwards
+    onsets = cohort.patients.set_index("dw_ek_borger")["onset"]
+    for df in (cohort.t2d_diagnoses, cohort.antidiabetic_medications):
+        assert (df["timestamp"] >= df["dw_ek_borger"].map(onsets).dt.floor("s")).all()
+
+
+def test_lab_results_view_matches_loader_layout():
+    cohort = generate_synthetic_cohort(n_patients=500)
+    con = sqlite3.connect(":memory:")
+    con.execute("ATTACH DATABASE ':memory:' AS fct")
+    cohort.write_lab_results_view(con)
+
+    def read_sql(
+        query: str,
+        chunksize: Optional[int] = None,
+    ) -> Union[pd.DataFrame, Iterable[pd.DataFrame]]:
+        return pd.read_sql(query, con, chunksize=chunksize)
+
+    for lab in DIABETES_LAB_THRESHOLDS:
+        lab_results = cohort.get_lab_results(lab)
+        above_threshold = lab_results[lab_results["value"] > lab.threshold]
+
+        pushed_down = load_lab_results_above_threshold(
+            lab=lab,
+            first_per_patient=True,
+            read_sql=read_sql,
+        )
+        expected = get_first_event_per_patient(above_threshold)
+
+        pd.testing.assert_frame_equal(
+            pushed_down[["dw_ek_borger", "timestamp"]]
+            .sort_values("dw_ek_borger")
+            .reset_index(drop=True),
+            expected[["dw_ek_borger", "timestamp"]]
+            .sort_values("dw_ek_borger")
+            .reset_index(drop=True),
+        )
+
+
+def test_eligibility_excludes_prevalent_diabetes():
+    cohort = generate_synthetic_cohort(n_patients=5_000)
+    first_lab_results = {
+        lab.value_type: get_first_event_per_patient(
+            cohort.get_lab_results(lab).query(f"value > {lab.threshold}"),
+        )
+        for lab in DIABETES_LAB_THRESHOLDS
+    }
+    first_diabetes_lab_result = combine_first_events(first_lab_results)
+    first_diabetes_indicator = combine_first_events(
+        {
+            "t1d_diagnoses": get_first_event_per_patient(cohort.t1d_diagnoses),
+            "t2d_diagnoses": get_first_event_per_patient(cohort.t2d_diagnoses),
+            "medications": get_first_event_per_patient(
+                cohort.antidiabetic_medications,
+            ),
+            "lab_results": first_diabetes_lab_result,
+        },
+    )
+
+    eligible, funnel = get_eligible_prediction_times(
+        prediction_times=cohort.visits,
+        first_diabetes_indicator=first_diabetes_indicator,
+        first_diabetes_lab_result=first_diabetes_lab_result,
+        quarantine_timestamps=cohort.moves,
+    )
+
+    # Every criterion excludes some of the synthetic prediction times
+    assert (funnel["n_excluded"].iloc[1:] > 0).all()
+
+    first_indicators = eligible["dw_ek_borger"].map(
+        first_diabetes_indicator.set_index("dw_ek_borger")["timestamp"],
+    )
+    assert not (first_indicators < pd.Timestamp("2013-01-01")).any()
+
+    # Prevalent patients without a recorded indicator before 2013 stay eligible,
+    # but most of their prediction times are excluded
+    patients = cohort.patients.set_index("dw_ek_borger")
+    is_prevalent = patients["status"].isin(["prevalent_t2d", "t1d"]) & (
+        patients["onset"] < pd.Timestamp("2013-01-01")
+    )
+    prevalent_prop = cohort.visits["dw_ek_borger"].map(is_prevalent).mean()
+    eligible_prevalent_prop = eligible["dw_ek_borger"].map(is_prevalent).mean()
+    assert eligible_prevalent_prop < prevalent_prop / 2
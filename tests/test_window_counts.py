@@ -0,0 +1,17 @@
+import numpy as np
+
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+from t2d_feature_generation.flattening.window_counts import get_prefix_sums
+
+
+def test_prefix_sums_skip_null_values():
+    events = PatientSortedEvents(
+        codes=np.array([0, 0, 1]),
+        timestamps=np.array([0, 1, 0]),
+        values=np.array([2.0, np.nan, 3.0]),
+    )
+
+    counts, sums = get_prefix_sums(events)
+
+    np.testing.assert_array_equal(counts, [0, 1, 1, 2])
+    np.testing.assert_array_equal(sums, [0.0, 2.0, 2.0, 5.0])
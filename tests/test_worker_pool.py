@@ -0,0 +1,137 @@
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from t2d_feature_generation.flattening.column_cache import ColumnCache
+from t2d_feature_generation.flattening.events import PatientSortedEvents
+from t2d_feature_generation.flattening.planner import (
+    WindowSpec,
+    flatten_temporal_specs,
+)
+from t2d_feature_generation.flattening.worker_pool import (
+    SourcePool,
+    attach_arrays,
+    publish_arrays,
+)
+
+
+def sum_events(
+    events: PatientSortedEvents,
+    codes: np.ndarray,
+    timestamps: np.ndarray,
+) -> dict[str, np.ndarray]:
+    """Sum of the values of each patient's events up to each prediction time."""
+    return {
+        "sum": np.array(
+            [
+                events.values[
+                    (events.codes == code) & (events.timestamps <= timestamp)
+                ].sum()
+                for code, timestamp in zip(codes, timestamps)
+            ],
+        ),
+    }
+
+
+def get_specs(loader_name: str) -> list[WindowSpec]:
+    return [
+        WindowSpec(
+            loader_name=loader_name,
+            col_name=f"{loader_name}_{direction}_{interval_days}_days_{aggregation}",
+            interval_days=interval_days,
+            direction=direction,
+            aggregation=aggregation,
+            fallback=0 if aggregation == "bool" else np.nan,
+            dtype="int8" if aggregation == "bool" else "float32",
+        )
+        for interval_days in (30, 365)
+        for direction in ("behind", "ahead")
+        for aggregation in ("max", "mean", "latest", "bool")
+    ]
+
+
+def test_attached_arrays_are_views_of_the_file(tmp_path: Path):
+    arrays = {
+        "codes": np.arange(1_000, dtype=np.int64),
+        "values": np.linspace(0, 1, 1_000).astype(np.float32),
+        "flags": np.zeros(1_000, dtype=np.int8),
+    }
+    attached = attach_arrays(publish_arrays(arrays, tmp_path / "arrays.arrow"))
+
+    assert list(attached) == list(arrays)
+    for name, array in arrays.items():
+        np.testing.assert_array_equal(attached[name], array)
+        assert attached[name].dtype == array.dtype
+        assert not attached[name].flags.owndata
+        assert not attached[name].flags.writeable
+
+
+def test_source_pool_releases_the_files_of_each_source(tmp_path: Path):
+    events = PatientSortedEvents(
+        codes=np.array([0, 0, 1]),
+        timestamps=np.array([0, 1, 0]),
+        values=np.array([1.0, 2.0, 3.0]),
+    )
+
+    with SourcePool(
+        sum_events,
+        codes=np.array([0, 1]),
+        timestamps=np.array([2, 2]),
+        max_workers=1,
+        shared_dir=tmp_path,
+    ) as pool:
+        futures = [pool.submit(events) for _ in range(2)]
+        for future in futures:
+            columns, _ = pool.get_columns(future)
+
+            np.testing.assert_array_equal(columns["sum"], [3.0, 3.0])
+            assert columns["sum"].flags.writeable
+
+        # Only the prediction times are left, as the columns are in memory
+        assert [path.name for path in pool.dir.iterdir()] == ["prediction_times.arrow"]
+
+    assert list(tmp_path.iterdir()) == []
+    np.testing.assert_array_equal(columns["sum"], [3.0, 3.0])
+
+
+def test_worker_pool_matches_in_process(
+    tmp_path: Path,
+    make_events: Callable[..., pd.DataFrame],
+):
+    prediction_times = make_events(500, seed=0, n_patients=40)[
+        ["dw_ek_borger", "timestamp"]
+    ]
+    values_by_loader_name = {
+        loader_name: make_events(2_000, seed=seed, n_patients=50)
+        for seed, loader_name in enumerate(["hba1c", "ldl", "visits"], start=1)
+    }
+    specs = [
+        spec for loader_name in values_by_loader_name for spec in get_specs(loader_name)
+    ]
+
+    def flatten(**kwargs: Any) -> pd.DataFrame:
+        return flatten_temporal_specs(
+            prediction_times=prediction_times,
+            specs=specs,
+            load_values=lambda spec: values_by_loader_name[spec.loader_name],
+            **kwargs,
+        )
+
+    expected = flatten()
+    pd.testing.assert_frame_equal(
+        flatten(max_workers=2, shared_dir=tmp_path),
+        expected,
+    )
+    # The published arrays are removed
+    assert list(tmp_path.iterdir()) == []
+
+    # Columns computed in workers are cached, and read back on the next run
+    column_cache = ColumnCache(tmp_path / "cache")
+    for _ in range(2):
+        pd.testing.assert_frame_equal(
+            flatten(max_workers=2, column_cache=column_cache),
+            expected,
+        )
+    assert len(list(column_cache.cache_dir.glob("*.arrow"))) == len(specs)